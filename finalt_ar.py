@@ -36,39 +36,17 @@ except ImportError:
 from datetime import datetime
 import plotly.express as px
 import json
+import copy
+from functools import lru_cache
 import os
+import io
+import csv
 import tempfile
 import matplotlib.pyplot as plt
 from fpdf import FPDF
 import re
 import warnings
 
-# Handle pyfinance safely
-try:
-    import pyfinance as pf
-    PYFINANCE_AVAILABLE = True
-except ImportError:
-    PYFINANCE_AVAILABLE = False
-    
-    
-    # Create a fallback for pyfinance functions used in your code
-    class PF_Fallback:
-        @staticmethod
-        def npv(rate, values):
-            """Simple NPV implementation"""
-            npv = 0
-            for i, val in enumerate(values):
-                npv += val / ((1 + rate) ** i)
-            return npv
-        
-        @staticmethod
-        def irr(values):
-            """Simple IRR fallback"""
-            return 0.0
-    
-    # Assign the fallback to pf
-    pf = PF_Fallback()
-
 # Ignorer les avertissements de dépréciation
 warnings.filterwarnings('ignore')
 
@@ -96,31 +74,59 @@ def convert_to_serializable(obj):
         return str(obj)
 
 
+# Clés de session exportées dans la sauvegarde JSON
+_SESSION_EXPORT_KEYS = ("basic_info", "investment_data", "immos", "credits", "subsidies",
+                        "frais_preliminaires", "income_statement_params", "cash_flow_params",
+                        "actif_data", "passif_data", "monthly_cashflow_data", "vat_budget_data",
+                        "detailed_amortization")
+
+
+def _session_payload_to_serializable(payload):
+    """
+    Convertit un dictionnaire de données de session en structures sérialisables
+    """
+    return {key: convert_to_serializable(value) for key, value in payload.items()}
+
+
+def _session_data_to_json(body):
+    """
+    Ajoute des métadonnées à jour au corps JSON (objet indenté) des données de session
+    """
+    # Métadonnées hors cache : horodatage propre à chaque export
+    metadata = json.dumps({
+        "metadata": {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "version": "1.0",
+            "app": "Simulateur d'Étude Financière"
+        }
+    }, ensure_ascii=False, indent=2)
+    if body == "{}":
+        return metadata
+    # Insérer la clé "metadata" en dernière position de l'objet
+    return body[:-2] + ",\n" + metadata[2:]
+
+
+def bump_session_data_version():
+    """
+    Signale une modification des données de session : l'export JSON sera reconstruit
+    """
+    st.session_state._data_version = st.session_state.get('_data_version', 0) + 1
+
+
 def get_session_data_as_json():
     """
     Convertit toutes les données de session en format JSON
     """
-    # Créer une copie des données de session pour éviter de modifier l'original
-    session_data = {}
-    
-    # Exporter toutes les données importantes
-    for key in ["basic_info", "investment_data", "immos", "credits", "subsidies", 
-                "frais_preliminaires", "income_statement_params", "cash_flow_params",
-                "actif_data", "passif_data", "monthly_cashflow_data", "vat_budget_data",
-                "detailed_amortization"]:
-        if key in st.session_state:
-            # Convertir les structures complexes en structures sérialisables
-            session_data[key] = convert_to_serializable(st.session_state[key])
-    
-    # Ajouter des métadonnées
-    session_data["metadata"] = {
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "version": "1.0",
-        "app": "Simulateur d'Étude Financière"
-    }
-    
-    # Convertir en JSON
-    return json.dumps(session_data, ensure_ascii=False, indent=2)
+    ss = st.session_state
+    version = ss.get('_data_version', 0)
+    
+    # Le corps JSON n'est reconstruit que si la version des données a changé
+    cached = ss.get('_session_json_cache')
+    if cached is None or cached[0] != version:
+        payload = {key: ss[key] for key in _SESSION_EXPORT_KEYS if key in ss}
+        body = json.dumps(_session_payload_to_serializable(payload), ensure_ascii=False, indent=2)
+        cached = ss._session_json_cache = (version, body)
+    return _session_data_to_json(cached[1])
 
 
 def save_data():
@@ -137,7 +143,8 @@ def save_data():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{save_dir}/{company_name}_{timestamp}.json"
         
-        # Obtenir les données JSON
+        # Obtenir les données JSON (reconstruites : la sauvegarde reflète l'état courant)
+        bump_session_data_version()
         data_json = get_session_data_as_json()
         
         # Écrire dans un fichier
@@ -164,19 +171,132 @@ def load_data_from_json(file):
         for key, value in data.items():
             if key != "metadata":
                 st.session_state[key] = value
+        bump_session_data_version()
         
         return True
     except Exception as e:
         raise Exception(f"Erreur lors du chargement des données: {str(e)}")
 
 
+# Séparateurs de milliers (virgule, espace, espace insécable) retirés avant conversion
+_NUM_CLEAN = str.maketrans('', '', ', \xa0')
+
+# Mise en page sombre et palettes communes des graphiques Plotly (construites une seule fois)
+_DARK_LAYOUT = {
+    'paper_bgcolor': 'rgba(0,0,0,0)',  # Fond transparent
+    'plot_bgcolor': 'rgba(0,0,0,0)',   # Fond transparent
+    'font_color': 'white'              # Texte blanc
+}
+_PALETTE_BOLD = px.colors.qualitative.Bold
+_PALETTE_PASTEL = px.colors.qualitative.Pastel
+_PALETTE_SET2 = px.colors.qualitative.Set2
+
+
+def _to_centimes(amount):
+    """
+    Convertit un montant en DHS en nombre entier de centimes (comparaisons exactes).
+    Les montants vides ou non finis (NaN d'une ligne ajoutée, inf) comptent pour 0.
+    """
+    amount = float(amount)
+    if not np.isfinite(amount):
+        return 0
+    return int(round(amount * 100))
+
+
+def _npv_irr(investissement, cash_flow, taux, n):
+    """
+    Calcule la VAN et le TRI (par période) d'un investissement initial
+    suivi de n flux constants. Le TRI est obtenu par la méthode de Newton,
+    NaN s'il ne converge pas.
+    """
+    # VAN par le facteur d'annuité: CF * (1 - (1+r)^-n) / r
+    if taux == 0.0:
+        van = -investissement + cash_flow * n
+    else:
+        van = -investissement + cash_flow * (1.0 - (1.0 + taux) ** -n) / taux
+
+    if investissement <= 0.0:
+        return van, np.nan
+
+    # Point de départ: rendement de la rente perpétuelle, toujours au-dessus du TRI
+    periodes = np.arange(1, n + 1)
+    tri = cash_flow / investissement
+    for _ in range(100):
+        facteurs = (1.0 + tri) ** periodes
+        f = -investissement + np.sum(cash_flow / facteurs)
+        derivee = -np.sum(periodes * cash_flow / (facteurs * (1.0 + tri)))
+        if derivee == 0.0:
+            break
+        pas = f / derivee
+        tri -= pas
+        if tri <= -1.0:
+            break
+        if abs(pas) < 1e-10:
+            return van, tri
+    return van, np.nan
+
+
+def _irr_newton(cfs, guess=0.1, tol=1e-7, maxiter=50):
+    """
+    TRI d'une série de flux annuels (le premier en année 0) par la méthode de Newton,
+    NaN s'il ne converge pas.
+    """
+    periodes = np.arange(cfs.shape[0])
+    r = guess
+    for _ in range(maxiter):
+        facteurs = (1.0 + r) ** periodes
+        npv = np.sum(cfs / facteurs)
+        dnpv = -np.sum(periodes * cfs / (facteurs * (1.0 + r)))
+        if dnpv == 0.0:
+            break
+        step = npv / dnpv
+        r -= step
+        if r <= -1.0:
+            break
+        if abs(step) < tol:
+            return r
+    return np.nan
+
+
+# Modèle CSV d'import proposé au téléchargement (encodé une seule fois)
+_CSV_TEMPLATE_BYTES = """type,categorie,nom,montant,taux_tva,duree_amort,taux_amort,date
+immobilisation,equipement,Matériel d'équipement,78400.00,20,5,20,2023-01-15
+immobilisation,transport,Matériel de transport,45000.00,20,5,20,2023-02-10
+immobilisation,terrain,Terrain / Local,120000.00,20,10,10,2023-01-01
+financement,apport,Apport personnel,50000.00,0,0,0,2023-01-01
+financement,emprunt,Crédit bancaire,150000.00,0,0,0,2023-01-15
+financement,subvention,Subvention,30000.00,0,0,0,2023-02-01
+charges,loyer,Loyer mensuel,3500.00,20,0,0,2023-01-01
+charges,personnel,Salaire employé 1,5000.00,0,0,0,2023-01-01
+charges,personnel,Salaire employé 2,6000.00,0,0,0,2023-01-01
+charges,services,Téléphone et Internet,500.00,20,0,0,2023-01-01
+charges,services,Électricité,800.00,14,0,0,2023-01-01
+ventes,produit,Produit A,12000.00,20,0,0,2023-01-15
+ventes,produit,Produit B,8000.00,20,0,0,2023-01-20
+ventes,service,Service conseil,15000.00,20,0,0,2023-02-01""".encode('utf-8')
+
+
+@st.cache_data(show_spinner=False)
+def _csv_bytes(df, sep=",", decimal="."):
+    """
+    Export CSV (UTF-8) d'un DataFrame, mis en cache sur son contenu
+    """
+    return df.to_csv(index=False, sep=sep, decimal=decimal).encode('utf-8')
+
+
+@lru_cache(maxsize=4096)
+def _ascii_only_str(text):
+    """Version mise en cache pour les chaînes (titres et en-têtes très répétés)."""
+    return (text.replace("✓", "OK")
+                .replace("⚠", "ATTENTION")
+                .replace("❌", "ERREUR"))
+
+
 def ascii_only(text):
     """Remplace les caractères Unicode problématiques par des alternatives ASCII."""
     if not isinstance(text, str):
         text = str(text)
-    return (text.replace("✓", "OK")
-                .replace("⚠", "ATTENTION")
-                .replace("❌", "ERREUR"))
+    return _ascii_only_str(text)
 
 def generate_pdf_report(report_name, sections):
     """
@@ -184,6 +304,7 @@ def generate_pdf_report(report_name, sections):
     Intègre les sections sélectionnées et assure une gestion robuste des données.
     La fonction est améliorée pour inclure tous les graphiques d'amortissement,
     les tableaux de trésorerie mensuelle et les tableaux de budget TVA.
+    Retourne le contenu du PDF sous forme de bytes.
     """
     import tempfile
     import matplotlib
@@ -195,6 +316,8 @@ def generate_pdf_report(report_name, sections):
     from datetime import datetime
     import os
     import base64
+    import hashlib
+    import shutil
     from io import BytesIO
     import re
     from PIL import Image
@@ -249,26 +372,53 @@ def generate_pdf_report(report_name, sections):
             return False
         return True
 
+    # Images déjà validées (chemin) et empreintes des contenus déjà écrits (hash -> chemin)
+    verified_images = set()
+    image_hashes = {}
+
+    def save_figure_to_bytes(fig, dpi=90):
+        """Rend une figure en PNG dans un tampon mémoire."""
+        buf = BytesIO()
+        fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight',
+                    pil_kwargs={'compress_level': 1})  # 90 dpi suffit à 180 mm, zlib rapide
+        buf.seek(0)
+        return buf
+
     # Nouvelle fonction pour sauvegarder des figures de manière fiable
-    def save_figure_safely(fig, filename, temp_dir, dpi=150):
+    def save_figure_safely(fig, filename, temp_dir, dpi=90):
         """Sauvegarde une figure de manière fiable et vérifie sa validité."""
         try:
-            path = f"{temp_dir}/{filename}"
-            fig.savefig(path, format='png', dpi=dpi, bbox_inches='tight')
+            buf = save_figure_to_bytes(fig, dpi)
             plt.close(fig)  # Important: fermer la figure pour libérer la mémoire
+            png_bytes = buf.getvalue()
             
-            # Vérifier que le fichier existe et est valide
-            if os.path.exists(path) and os.path.getsize(path) > 100:
-                try:
-                    with Image.open(path) as img:
-                        img.verify()  # Vérifier que l'image est valide
-                    logger.info(f"Image sauvegardée avec succès: {path}")
-                    return path
-                except Exception as e:
-                    logger.error(f"Erreur validation image {filename}: {e}")
-            else:
-                logger.warning(f"Fichier image trop petit ou inexistant: {path}")
-            return None
+            # Vérifier en mémoire que l'image est valide avant de l'écrire
+            if len(png_bytes) <= 100:
+                logger.warning(f"Image trop petite: {filename}")
+                return None
+            try:
+                with Image.open(buf) as img:
+                    img.verify()  # Vérifier que l'image est valide
+            except Exception as e:
+                logger.error(f"Erreur validation image {filename}: {e}")
+                return None
+            
+            # Graphique identique déjà écrit: réutiliser le même fichier (FPDF ne l'intègre qu'une fois)
+            digest = hashlib.md5(png_bytes).hexdigest()
+            if digest in image_hashes:
+                return image_hashes[digest]
+            
+            # FPDF 1.x n'accepte que des chemins: une seule écriture, sans relecture
+            path = f"{temp_dir}/{filename}"
+            with open(path, 'wb') as f:
+                f.write(png_bytes)
+            # Un fichier réécrit ne correspond plus à son ancienne empreinte
+            for old_digest in [d for d, p in image_hashes.items() if p == path]:
+                del image_hashes[old_digest]
+            image_hashes[digest] = path
+            verified_images.add(path)
+            logger.info(f"Image sauvegardée avec succès: {path}")
+            return path
         except Exception as e:
             logger.error(f"Erreur sauvegarde {filename}: {e}")
             return None
@@ -303,11 +453,12 @@ def generate_pdf_report(report_name, sections):
                 
                 # Vérifier si l'image existe et est valide avant de l'ajouter
                 success = False
-                if os.path.exists(img) and os.path.getsize(img) > 100:
+                if img in verified_images or (os.path.exists(img) and os.path.getsize(img) > 100):
                     try:
-                        # Vérifier que c'est une image valide
-                        with Image.open(img) as test_img:
-                            test_img.verify()
+                        # Vérifier que c'est une image valide (déjà fait pour les figures rendues en mémoire)
+                        if img not in verified_images:
+                            with Image.open(img) as test_img:
+                                test_img.verify()
                         
                         # Ajouter l'image au PDF
                         self.image(img, x=10, y=None, w=w, h=h)
@@ -365,157 +516,85 @@ def generate_pdf_report(report_name, sections):
                 logger.error(f"Erreur lors de la création du tableau: {e}")
                 self.chapter_body(f"Erreur lors de la création du tableau: {str(e)}")
 
-    # Fonction pour capturer les graphiques Plotly
-    def capture_plotly_figures():
-        """Capture tous les graphiques Plotly générés dans l'application."""
+    # Capture en une seule passe de tous les graphiques présents dans l'application
+    def capture_all_charts(limit=None):
+        """Parcourt une seule fois session_state et le registre Matplotlib pour capturer les graphiques.
+        S'arrête dès que `limit` graphiques ont été capturés."""
         captured_figs = []
+        seen_figs = set()  # Évite de capturer deux fois la même figure Matplotlib
         
-        try:
-            # Parcourir toutes les entrées dans le session state pour trouver des objets Plotly
-            for key, value in st.session_state.items():
-                if isinstance(value, dict) and 'figure' in value and 'data' in value.get('figure', {}):
-                    # Probablement un objet Plotly Figure
-                    try:
-                        import plotly.io as pio
-                        fig_path = f"{temp_dir}/plotly_{key}.png"
-                        value['figure'].write_image(fig_path, width=1000, height=600, scale=2)
-                        
-                        # Vérifier que l'image a été correctement créée
-                        if os.path.exists(fig_path) and os.path.getsize(fig_path) > 100:
-                            captured_figs.append({
-                                'path': fig_path,
-                                'name': f"Graphique {key.replace('_', ' ').title()}"
-                            })
-                            logger.info(f"Graphique Plotly capturé: {key}")
-                        else:
-                            logger.warning(f"Échec de capture du graphique Plotly {key}: Fichier invalide")
-                    except Exception as e:
-                        logger.error(f"Erreur lors de la capture du graphique Plotly {key}: {e}")
-        except Exception as e:
-            logger.error(f"Erreur lors de la recherche des graphiques Plotly: {e}")
+        def register_image(path, name):
+            """Ajoute l'image à la liste si le fichier est une image valide."""
+            if os.path.exists(path) and os.path.getsize(path) > 100:
+                try:
+                    with Image.open(path) as img:
+                        img.verify()
+                    captured_figs.append({'path': path, 'name': name})
+                    logger.info(f"Graphique capturé: {name}")
+                except Exception as img_err:
+                    logger.error(f"Graphique invalide {name}: {img_err}")
+            else:
+                logger.warning(f"Échec de capture du graphique {name}: Fichier invalide")
         
-        return captured_figs
-
-    # Fonction pour extraire les images des éléments Streamlit
-    def capture_streamlit_images():
-        """Capture toutes les images générées par Streamlit."""
-        captured_imgs = []
+        def save_base64_image(data_uri, path, name):
+            img_data_match = re.search(r'base64,(.*)', data_uri)
+            if img_data_match:
+                with open(path, 'wb') as f:
+                    f.write(base64.b64decode(img_data_match.group(1)))
+                register_image(path, name)
+        
+        # Liste des clés qui pourraient contenir des graphiques
+        graph_indicators = ('chart', 'graph', 'plot', 'fig', 'pie')
+        
+        def limit_reached():
+            return limit is not None and len(captured_figs) >= limit
         
         try:
-            # Rechercher dans le HTML rendu pour trouver les balises img
-            import re
-            
-            try:
-                # Essayer d'importer BeautifulSoup si disponible
-                from bs4 import BeautifulSoup
-                bs4_available = True
-            except ImportError:
-                bs4_available = False
-                logger.warning("BeautifulSoup n'est pas disponible, certaines fonctionnalités de capture d'image seront limitées")
-            
-            # Essayer d'accéder au contexte de rendu de Streamlit
-            try:
-                # Méthode 1: Utiliser _get_report_ctx (peut ne pas fonctionner dans toutes les versions)
-                ctx = st._get_report_ctx()
-                if hasattr(ctx, 'ui_report') and hasattr(ctx.ui_report, 'html'):
-                    html_content = ctx.ui_report.html
-                else:
-                    html_content = ""
-            except:
-                html_content = ""
-                logger.warning("Impossible d'accéder au contexte de rapport Streamlit")
-            
-            # Si la méthode 1 échoue, essayer autre chose
-            if not html_content:
+            for key, value in st.session_state.items():
+                if limit_reached():
+                    break
+                title = str(key).replace('_', ' ').title()
                 try:
-                    # Méthode 2: Utiliser l'accès direct au cache de session (expérimental)
-                    for key, val in st.session_state.items():
-                        if isinstance(val, str) and val.startswith("data:image"):
-                            # Extraire l'image base64
-                            img_data_match = re.search(r'base64,(.*)', val)
-                            if img_data_match:
-                                img_data = img_data_match.group(1)
-                                img_bytes = base64.b64decode(img_data)
-                                img_path = f"{temp_dir}/streamlit_img_{len(captured_imgs)}.png"
-                                
-                                with open(img_path, 'wb') as f:
-                                    f.write(img_bytes)
-                                
-                                # Vérifier que l'image est valide
-                                try:
-                                    with Image.open(img_path) as img:
-                                        img.verify()
-                                    captured_imgs.append({
-                                        'path': img_path,
-                                        'name': f"Image {key.replace('_', ' ').title()}"
-                                    })
-                                    logger.info(f"Image Streamlit capturée: {key}")
-                                except Exception as img_err:
-                                    logger.error(f"Image Streamlit invalide {key}: {img_err}")
+                    # Dictionnaire contenant une figure Plotly
+                    if isinstance(value, dict):
+                        figure = value.get('figure')
+                        if figure is not None and 'data' in figure:
+                            fig_path = f"{temp_dir}/plotly_{key}.png"
+                            figure.write_image(fig_path, width=1000, height=600, scale=2)
+                            register_image(fig_path, f"Graphique {title}")
+                    
+                    # Image base64 (rendue par Streamlit ou stockée en session)
+                    elif isinstance(value, str):
+                        if value.startswith('data:image'):
+                            save_base64_image(value, f"{temp_dir}/session_{key}.png", f"Image: {title}")
+                    
+                    # Objets graphiques stockés sous une clé explicite
+                    elif any(indicator in str(key).lower() for indicator in graph_indicators):
+                        if hasattr(value, 'write_image'):
+                            fig_path = f"{temp_dir}/session_{key}.png"
+                            value.write_image(fig_path, width=1000, height=600, scale=2)
+                            register_image(fig_path, f"Graphique: {title}")
+                        elif hasattr(value, 'savefig'):
+                            seen_figs.add(id(value))
+                            fig_path = f"{temp_dir}/session_{key}.png"
+                            value.savefig(fig_path, dpi=90, bbox_inches='tight', pil_kwargs={'compress_level': 1})
+                            register_image(fig_path, f"Graphique: {title}")
                 except Exception as e:
-                    logger.error(f"Erreur lors de la méthode 2 de capture d'images: {e}")
-            
-            # Si HTML est disponible et BeautifulSoup est installé, analyser pour trouver les images
-            if html_content and bs4_available:
-                soup = BeautifulSoup(html_content, 'html.parser')
-                img_tags = soup.find_all('img')
-                
-                for i, img in enumerate(img_tags):
-                    try:
-                        src = img.get('src', '')
-                        if src.startswith('data:image'):
-                            # Extraire l'image base64
-                            img_data_match = re.search(r'base64,(.*)', src)
-                            if img_data_match:
-                                img_data = img_data_match.group(1)
-                                img_bytes = base64.b64decode(img_data)
-                                img_path = f"{temp_dir}/streamlit_img_{i}.png"
-                                
-                                with open(img_path, 'wb') as f:
-                                    f.write(img_bytes)
-                                
-                                # Vérifier que l'image est valide
-                                try:
-                                    with Image.open(img_path) as img:
-                                        img.verify()
-                                    captured_imgs.append({
-                                        'path': img_path,
-                                        'name': f"Image {i}"
-                                    })
-                                    logger.info(f"Image HTML capturée: {i}")
-                                except Exception as img_err:
-                                    logger.error(f"Image HTML invalide {i}: {img_err}")
-                    except Exception as e:
-                        logger.error(f"Erreur lors de l'extraction de l'image {i}: {e}")
+                    logger.error(f"Erreur lors de la capture du graphique {key}: {e}")
         except Exception as e:
-            logger.error(f"Erreur lors de la capture des images Streamlit: {e}")
-        
-        return captured_imgs
-
-    # Capture des graphiques Matplotlib/Seaborn qui pourraient être dans le registre interne
-    def capture_matplotlib_figures():
-        """Capture les graphiques Matplotlib/Seaborn actifs."""
-        captured_figs = []
+            logger.error(f"Erreur lors du parcours de session_state: {e}")
         
+        # Graphiques Matplotlib/Seaborn encore ouverts dans le registre interne
         try:
-            import matplotlib.pyplot as plt
             for i, fig in enumerate(map(plt.figure, plt.get_fignums())):
+                if limit_reached():
+                    break
+                if id(fig) in seen_figs:
+                    continue
                 try:
                     fig_path = f"{temp_dir}/matplotlib_{i}.png"
-                    fig.savefig(fig_path, dpi=150, bbox_inches='tight')
-                    
-                    # Vérifier que l'image est valide
-                    if os.path.exists(fig_path) and os.path.getsize(fig_path) > 100:
-                        try:
-                            with Image.open(fig_path) as img:
-                                img.verify()
-                            captured_figs.append({
-                                'path': fig_path,
-                                'name': f"Graphique Matplotlib {i}"
-                            })
-                            logger.info(f"Graphique Matplotlib capturé: {i}")
-                        except Exception as img_err:
-                            logger.error(f"Graphique Matplotlib invalide {i}: {img_err}")
+                    fig.savefig(fig_path, dpi=90, bbox_inches='tight', pil_kwargs={'compress_level': 1})
+                    register_image(fig_path, f"Graphique Matplotlib {i}")
                 except Exception as e:
                     logger.error(f"Erreur lors de la capture du graphique Matplotlib {i}: {e}")
         except Exception as e:
@@ -523,84 +602,6 @@ def generate_pdf_report(report_name, sections):
         
         return captured_figs
 
-    # Créer une fonction pour capturer tous les graphiques dans la session state
-    def capture_all_graphs_in_session():
-        """Capture tous les graphiques stockés dans session_state"""
-        captured_figs = []
-        
-        # Liste des clés qui pourraient contenir des graphiques
-        graph_indicators = ['chart', 'graph', 'plot', 'fig', 'pie']
-        
-        for key in st.session_state:
-            # Chercher des clés qui pourraient contenir des graphiques
-            if any(indicator in key.lower() for indicator in graph_indicators):
-                try:
-                    # Essayer de sauvegarder comme objet Plotly
-                    if hasattr(st.session_state[key], 'write_image'):
-                        fig_path = f"{temp_dir}/session_{key}.png"
-                        st.session_state[key].write_image(fig_path, width=1000, height=600, scale=2)
-                        
-                        # Vérifier que l'image est valide
-                        if os.path.exists(fig_path) and os.path.getsize(fig_path) > 100:
-                            try:
-                                with Image.open(fig_path) as img:
-                                    img.verify()
-                                captured_figs.append({
-                                    'path': fig_path,
-                                    'name': f"Graphique: {key.replace('_', ' ').title()}"
-                                })
-                                logger.info(f"Graphique de session capturé: {key}")
-                            except Exception as img_err:
-                                logger.error(f"Graphique de session invalide {key}: {img_err}")
-                                
-                    # Essayer de sauvegarder comme objet Matplotlib
-                    elif hasattr(st.session_state[key], 'savefig'):
-                        fig_path = f"{temp_dir}/session_{key}.png"
-                        st.session_state[key].savefig(fig_path, dpi=150, bbox_inches='tight')
-                        
-                        # Vérifier que l'image est valide
-                        if os.path.exists(fig_path) and os.path.getsize(fig_path) > 100:
-                            try:
-                                with Image.open(fig_path) as img:
-                                    img.verify()
-                                captured_figs.append({
-                                    'path': fig_path,
-                                    'name': f"Graphique: {key.replace('_', ' ').title()}"
-                                })
-                                logger.info(f"Figure de session capturée: {key}")
-                            except Exception as img_err:
-                                logger.error(f"Figure de session invalide {key}: {img_err}")
-                                
-                    # Essayer de sauvegarder comme base64 image
-                    elif isinstance(st.session_state[key], str) and st.session_state[key].startswith('data:image'):
-                        try:
-                            img_data_match = re.search(r'base64,(.*)', st.session_state[key])
-                            if img_data_match:
-                                img_data = img_data_match.group(1)
-                                img_bytes = base64.b64decode(img_data)
-                                img_path = f"{temp_dir}/session_{key}.png"
-                                
-                                with open(img_path, 'wb') as f:
-                                    f.write(img_bytes)
-                                
-                                # Vérifier que l'image est valide
-                                try:
-                                    with Image.open(img_path) as img:
-                                        img.verify()
-                                    captured_figs.append({
-                                        'path': img_path,
-                                        'name': f"Image: {key.replace('_', ' ').title()}"
-                                    })
-                                    logger.info(f"Image base64 de session capturée: {key}")
-                                except Exception as img_err:
-                                    logger.error(f"Image base64 de session invalide {key}: {img_err}")
-                        except Exception as e:
-                            logger.error(f"Erreur lors du traitement de l'image base64 {key}: {e}")
-                except Exception as e:
-                    logger.error(f"Erreur lors de la capture du graphique {key}: {e}")
-        
-        return captured_figs
-
     # Fonction pour générer des graphiques à partir des données de session_state
     def generate_additional_charts():
         """Génère des graphiques supplémentaires à partir des données disponibles"""
@@ -636,21 +637,8 @@ def generate_pdf_report(report_name, sections):
                         ax.legend()
                         
                         # Ajouter les valeurs sur chaque barre
-                        for rect in rects1:
-                            height = rect.get_height()
-                            ax.annotate(f'{height:,.0f}',
-                                        xy=(rect.get_x() + rect.get_width() / 2, height),
-                                        xytext=(0, 3),
-                                        textcoords="offset points",
-                                        ha='center', va='bottom', rotation=0)
-                                        
-                        for rect in rects2:
-                            height = rect.get_height()
-                            ax.annotate(f'{height:,.0f}',
-                                        xy=(rect.get_x() + rect.get_width() / 2, height),
-                                        xytext=(0, 3),
-                                        textcoords="offset points",
-                                        ha='center', va='bottom', rotation=0)
+                        ax.bar_label(rects1, labels=[f'{v:,.0f}' for v in ca], padding=3)
+                        ax.bar_label(rects2, labels=[f'{v:,.0f}' for v in charges], padding=3)
                         
                         img_path = save_figure_safely(fig, "ca_charges_evolution.png", temp_dir)
                         if img_path:
@@ -875,7 +863,7 @@ def generate_pdf_report(report_name, sections):
                             if isinstance(value, (int, float)):
                                 total += value
                             elif isinstance(value, str):
-                                total += float(value.replace(',', ''))
+                                total += float(value.translate(_NUM_CLEAN))
                         except:
                             pass
                     return total
@@ -976,7 +964,7 @@ def generate_pdf_report(report_name, sections):
                             if isinstance(value, (int, float)):
                                 total += value
                             elif isinstance(value, str):
-                                total += float(value.replace(',', ''))
+                                total += float(value.translate(_NUM_CLEAN))
                         except (ValueError, TypeError):
                             pass
                     return total
@@ -995,14 +983,8 @@ def generate_pdf_report(report_name, sections):
                 
                 bars = ax.bar(components, values, color=colors)
                 
-                # Ajouter les valeurs sur les barres
-                for bar in bars:
-                    height = bar.get_height()
-                    ax.annotate(f'{height:,.0f}',
-                              xy=(bar.get_x() + bar.get_width() / 2, height),
-                              xytext=(0, 3 if height >= 0 else -15),
-                              textcoords="offset points",
-                              ha='center', va='bottom' if height >= 0 else 'top')
+                # Ajouter les valeurs sur les barres (placement automatique au-dessus/en dessous de zéro)
+                ax.bar_label(bars, labels=[f'{v:,.0f}' for v in values], padding=3)
                 
                 ax.set_title("Analyse des composants de la TVA")
                 ax.set_ylabel("Montant (DHS)")
@@ -1371,7 +1353,7 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                 pdf.cell(80, 8, f"{total_passif:,.2f} DHS", 1, 1, "R")
                 pdf.ln(10)
                 
-                if abs(total_actif - total_passif) < 0.01:
+                if _to_centimes(total_actif) == _to_centimes(total_passif):
                     pdf.set_text_color(0, 128, 0)
                     pdf.cell(0, 8, ascii_only("OK Le bilan est equilibre"), 0, 1, "L")
                 else:
@@ -1415,8 +1397,8 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                 x = np.arange(len(years))
                 width = 0.35
                 
-                ax.bar(x - width/2, ca_values, width, label="CA")
-                ax.bar(x + width/2, result_net, width, label="Résultat net")
+                bars_ca = ax.bar(x - width/2, ca_values, width, label="CA")
+                bars_rn = ax.bar(x + width/2, result_net, width, label="Résultat net")
                 
                 ax.set_xlabel('Années')
                 ax.set_ylabel('Montant (DHS)')
@@ -1425,11 +1407,8 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                 ax.set_xticklabels(years)
                 ax.legend()
                 
-                for i, v in enumerate(ca_values):
-                    ax.text(i - width/2, v + 0.1, f"{v:,.0f}", ha='center')
-                
-                for i, v in enumerate(result_net):
-                    ax.text(i + width/2, v + 0.1, f"{v:,.0f}", ha='center')
+                ax.bar_label(bars_ca, labels=[f"{v:,.0f}" for v in ca_values], padding=3)
+                ax.bar_label(bars_rn, labels=[f"{v:,.0f}" for v in result_net], padding=3)
                 
                 img_path = save_figure_safely(fig, "income_evolution.png", temp_dir)
                 if img_path:
@@ -1561,7 +1540,7 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                                         if isinstance(value, (int, float)):
                                             total += value
                                         elif isinstance(value, str) and value.replace('.', '').replace(',', '').isdigit():
-                                            total += float(value.replace(',', ''))
+                                            total += float(value.translate(_NUM_CLEAN))
                                     except (ValueError, TypeError):
                                         pass
                                 categories[cat] = total
@@ -1863,7 +1842,7 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                                 if isinstance(v, (int, float)):
                                     total += v
                                 elif isinstance(v, str) and v.strip():
-                                    total += float(v.replace(',', ''))
+                                    total += float(v.translate(_NUM_CLEAN))
                             except:
                                 pass
                         return total
@@ -2018,17 +1997,22 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                                 if isinstance(v, (int, float)):
                                     total += v
                                 elif isinstance(v, str) and v.strip():
-                                    total += float(v.replace(',', ''))
+                                    total += float(v.translate(_NUM_CLEAN))
                             except:
                                 pass
                         return total
                     
+                    # Lire chaque section une seule fois
+                    achats_section = vat_data.get("achats") or {}
+                    ventes_section = vat_data.get("ventes") or {}
+                    immos_section = vat_data.get("tva_immobilisations") or {}
+                    
                     # Calculer les totaux
-                    achats_ht = safe_sum_tva(vat_data.get("achats", {}), "ht")
-                    tva_deduct_achats = safe_sum_tva(vat_data.get("achats", {}), "tva")
-                    ventes_ht = safe_sum_tva(vat_data.get("ventes", {}), "ht")
-                    tva_collect_ventes = safe_sum_tva(vat_data.get("ventes", {}), "tva")
-                    tva_deduct_immos = safe_sum_tva(vat_data.get("tva_immobilisations", {}))
+                    achats_ht = safe_sum_tva(achats_section, "ht")
+                    tva_deduct_achats = safe_sum_tva(achats_section, "tva")
+                    ventes_ht = safe_sum_tva(ventes_section, "ht")
+                    tva_collect_ventes = safe_sum_tva(ventes_section, "tva")
+                    tva_deduct_immos = safe_sum_tva(immos_section)
                     
                     # Si pas de TVA déductible sur achats mais montant HT disponible
                     if tva_deduct_achats == 0 and achats_ht > 0:
@@ -2048,7 +2032,7 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                     achats_headers = ["Élément", "Montant HT (DHS)", "TVA déductible (DHS)"]
                     achats_data = []
                     
-                    for key, value in vat_data.get("achats", {}).items():
+                    for key, value in achats_section.items():
                         if "tva" in key.lower():
                             continue  # Skip TVA entries, they'll be calculated
                             
@@ -2082,7 +2066,7 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                     ventes_headers = ["Élément", "Montant HT (DHS)", "TVA collectée (DHS)"]
                     ventes_data = []
                     
-                    for key, value in vat_data.get("ventes", {}).items():
+                    for key, value in ventes_section.items():
                         if "tva" in key.lower():
                             continue  # Skip TVA entries, they'll be calculated
                             
@@ -2110,14 +2094,14 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                     pdf.ln(5)
                     
                     # Tableau de TVA déductible sur immobilisations
-                    if vat_data.get("tva_immobilisations", {}):
+                    if immos_section:
                         pdf.set_font("Arial", "B", 10)
                         pdf.cell(0, 8, ascii_only("3. TVA déductible sur immobilisations"), 0, 1, "L")
                         
                         immo_tva_headers = ["Immobilisation", "TVA déductible (DHS)"]
                         immo_tva_data = []
                         
-                        for key, value in vat_data.get("tva_immobilisations", {}).items():
+                        for key, value in immos_section.items():
                             try:
                                 montant_tva = float(value) if isinstance(value, (int, float, str)) else 0
                             except (ValueError, TypeError):
@@ -2159,13 +2143,12 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                         values = [tva_collect_ventes, tva_deduct_achats, tva_deduct_immos]
                         colors = ['#ff9999', '#66b3ff', '#99ff99']
                         
-                        ax.bar(labels, values, color=colors)
+                        bars = ax.bar(labels, values, color=colors)
                         ax.set_ylabel('Montant (DHS)')
                         ax.set_title('Composantes de la TVA')
                         
                         # Ajouter les valeurs sur les barres
-                        for i, v in enumerate(values):
-                            ax.text(i, v/2, f"{v:,.0f}", ha='center')
+                        ax.bar_label(bars, labels=[f"{v:,.0f}" for v in values], label_type='center')
                         
                         img_path = save_figure_safely(fig, "tva_components.png", temp_dir)
                         if img_path:
@@ -2175,13 +2158,13 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
                         # Graphique de la TVA nette
                         fig, ax = plt.subplots(figsize=(10, 7))
                         
-                        ax.bar(['TVA nette à payer'], [tva_nette], 
-                               color='#ff9999' if tva_nette > 0 else '#99ff99')
+                        bars = ax.bar(['TVA nette à payer'], [tva_nette], 
+                                      color='#ff9999' if tva_nette > 0 else '#99ff99')
                         ax.set_ylabel('Montant (DHS)')
                         ax.set_title('TVA nette à payer')
                         
                         # Ajouter les valeurs sur les barres
-                        ax.text(0, tva_nette/2, f"{tva_nette:,.0f}", ha='center')
+                        ax.bar_label(bars, labels=[f"{tva_nette:,.0f}"], label_type='center')
                         
                         img_path = save_figure_safely(fig, "tva_nette.png", temp_dir)
                         if img_path:
@@ -2201,6 +2184,7 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
         pdf.chapter_title("Annexe: Graphiques Supplementaires")
         
         # Capturer tous les graphiques générés dans l'application
+        max_annex_graphs = 10  # Maximum 10 graphiques supplémentaires
         all_graphs = []
         try:
             # Générer des graphiques additionnels
@@ -2208,29 +2192,15 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
             if generated_charts:
                 all_graphs.extend(generated_charts)
                 
-            # Capturer graphiques Plotly
-            plotly_graphs = capture_plotly_figures()
-            if plotly_graphs:
-                all_graphs.extend(plotly_graphs)
-                
-            # Capturer graphiques Matplotlib
-            matplotlib_graphs = capture_matplotlib_figures()
-            if matplotlib_graphs:
-                all_graphs.extend(matplotlib_graphs)
-                
-            # Capturer autres graphiques en session
-            session_graphs = capture_all_graphs_in_session()
-            if session_graphs:
-                all_graphs.extend(session_graphs)
-                
-            # Capturer les images Streamlit
-            streamlit_images = capture_streamlit_images()
-            if streamlit_images:
-                all_graphs.extend(streamlit_images)
+            # Capturer en une passe les graphiques Plotly, Matplotlib et images de session,
+            # sans rendre plus d'images que l'annexe ne peut en contenir
+            remaining = max_annex_graphs - len(all_graphs)
+            if remaining > 0:
+                all_graphs.extend(capture_all_charts(limit=remaining))
                 
             # Limiter à un nombre raisonnable de graphiques
             if all_graphs:
-                included_graphs = all_graphs[:10]  # Maximum 10 graphiques supplémentaires
+                included_graphs = all_graphs[:max_annex_graphs]
                 
                 pdf.set_font("Arial", "", 10)
                 pdf.multi_cell(0, 5, f"Cette annexe contient {len(included_graphs)} graphiques supplémentaires générés pour ce rapport.")
@@ -2255,17 +2225,20 @@ Adresse: {ascii_only(basic_info.get('address', 'Non specifie'))}
             logger.error(f"Erreur lors de la génération des graphiques supplémentaires: {e}")
             pdf.chapter_body(f"Erreur lors de la génération des graphiques supplémentaires: {ascii_only(str(e))}")
         
-        # Finir le PDF
-        output_file = f"{temp_dir}/financial_report.pdf"
-        pdf.output(output_file)
+        # Finir le PDF directement en mémoire (fpdf 1.x renvoie une chaîne latin-1)
+        pdf_bytes = pdf.output(dest='S').encode('latin-1')
         
-        logger.info(f"PDF généré avec succès: {output_file}")
-        return output_file
+        # Les images intermédiaires sont déjà intégrées au PDF : libérer le dossier temporaire
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        
+        logger.info(f"PDF généré avec succès: {len(pdf_bytes)} octets")
+        return pdf_bytes
             
     except Exception as e:
         logger.error(f"Erreur fatale lors de la génération du PDF: {e}")
         import traceback
         logger.error(traceback.format_exc())
+        shutil.rmtree(temp_dir, ignore_errors=True)
         
         # Créer un PDF d'erreur
         error_pdf = PDF()
@@ -2289,9 +2262,7 @@ Contactez le support technique avec ces informations pour résoudre le problème
         
         error_pdf.multi_cell(0, 5, ascii_only(error_details))
         
-        output_file = f"{temp_dir}/error_report.pdf"
-        error_pdf.output(output_file)
-        return output_file
+        return error_pdf.output(dest='S').encode('latin-1')
     
 def add_export_sidebar_widgets():
     """
@@ -2362,13 +2333,10 @@ def add_export_sidebar_widgets():
         if st.button("🖨️ Générer le PDF", key="generate_pdf_btn"):
             with st.spinner("Génération du rapport en cours..."):
                 try:
-                    pdf_file = generate_pdf_report(report_name, include_sections)
+                    pdf_bytes = generate_pdf_report(report_name, include_sections)
                     st.success("✅ Rapport PDF généré avec succès!")
                     
                     # Téléchargement du PDF
-                    with open(pdf_file, "rb") as f:
-                        pdf_bytes = f.read()
-                    
                     st.download_button(
                         label="⬇️ Télécharger le PDF",
                         data=pdf_bytes,
@@ -2380,6 +2348,160 @@ def add_export_sidebar_widgets():
                     st.error(f"Erreur lors de la génération du PDF: {str(e)}")
 
 # ========== INITIALISATION DES VARIABLES DE SESSION ==========
+# Valeurs par défaut des données de session, copiées à l'initialisation
+_DEFAULT_ACTIF_DATA = {
+    'immobilisations_non_valeur': [
+        {'label': "Frais préliminaires", 'value': 5700.0},
+        {'label': "Charges à répartir", 'value': 0.0},
+        {'label': "Primes de remboursement", 'value': 0.0}
+    ],
+    'immobilisations_incorporelles': [
+        {'label': "Recherche & développement", 'value': 0.0},
+        {'label': "Brevets, marques", 'value': 0.0},
+        {'label': "Fonds commercial", 'value': 80000.0}
+    ],
+    'immobilisations_corporelles': [
+        {'label': "Terrains", 'value': 3500.0},
+        {'label': "Constructions", 'value': 94080.0},
+        {'label': "Installations techniques", 'value': 14400.0},
+        {'label': "Matériel de transport", 'value': 0.0},
+        {'label': "Mobilier, bureau", 'value': 0.0},
+        {'label': "Autres immobilisations", 'value': 0.0}
+    ],
+    'stocks': [
+        {'label': "Marchandises", 'value': 0.0},
+        {'label': "Matières premières", 'value': 0.0}
+    ],
+    'tresorerie_actif': [
+        {'label': "Banque, chèques postaux", 'value': 0.0},
+        {'label': "Caisse, avances", 'value': 0.0}
+    ]
+}
+
+_DEFAULT_PASSIF_DATA = {
+    'capitaux_propres': [
+        {'label': "Capital social", 'value': 70511.31},
+        {'label': "Capitaux propres assimilés", 'value': 0.0},
+        {'label': "Subvention d'investissement", 'value': 0.0}
+    ],
+    'dettes_financement': [
+        {'label': "Emprunts obligataires", 'value': 0.0},
+        {'label': "Autres dettes de financement", 'value': 0.0}
+    ],
+    'passif_circulant': [
+        {'label': "Fournisseurs et comptes rattachés", 'value': 0.0},
+        {'label': "Ecart de conversion", 'value': 0.0},
+        {'label': "Autres provisions", 'value': 0.0}
+    ],
+    'tresorerie_passif': [
+        {'label': "Banque (solde créditeur)", 'value': 0.0}
+    ]
+}
+
+_DEFAULT_MONTHLY_CASHFLOW_DATA = {
+    'ressources': {
+        'Apports personnels': 70511.31,
+        'Emprunts': 134000.00,
+        'Subventions': 90000.00
+    },
+    'chiffre_affaires': {
+        'Ventes de produits & service au Maroc': 45004.71
+    },
+    'immobilisations': {
+        'Immobilisations incorporelles': 86840.00,
+        'Immobilisations corporelles': 96300.00
+    },
+    'charges_exploitation': {
+        'Achat de matières premières (charges variables)': 0.00,
+        'Echéances d\'emprunt': 1849.30,
+        'Impôts et taxes': 7760.94,
+        'Charges externes': 6200.00,
+        'Salaires et charges sociales': 25946.22,
+        'Frais bancaires et charges financières': 80.00
+    }
+}
+
+_DEFAULT_VAT_BUDGET_DATA = {
+    'achats': {
+        'Achat HT': 6200.00,
+        'TVA déductible sur achat': 1240.00
+    },
+    'ventes': {
+        'Vente en HT': 45004.71,
+        'TVA collecte sur vente': 9000.94
+    },
+    'tva_immobilisations': {
+        'TVA dedustible sur immobilisation': 36628.00
+    }
+}
+
+_DEFAULT_DETAILED_AMORTIZATION = [
+    {
+        'name': "Frais préliminaire & d'approche",
+        'amount': 5700.00,
+        'duration': 5,
+        'rate': 20,
+        'amortization_n': 1140.00,
+        'amortization_n1': 1140.00,
+        'amortization_n2': 1140.00
+    },
+    {
+        'name': "Terrain / Local",
+        'amount': 0.00,
+        'duration': 10,
+        'rate': 10,
+        'amortization_n': 0.00,
+        'amortization_n1': 0.00,
+        'amortization_n2': 0.00
+    },
+    {
+        'name': "Construction / Aménagement",
+        'amount': 3500.00,
+        'duration': 5,
+        'rate': 10,
+        'amortization_n': 700.00,
+        'amortization_n1': 700.00,
+        'amortization_n2': 700.00
+    },
+    {
+        'name': "Matériel d'équipement",
+        'amount': 78400.00,
+        'duration': 5,
+        'rate': 20,
+        'amortization_n': 15680.00,
+        'amortization_n1': 15680.00,
+        'amortization_n2': 15680.00
+    },
+    {
+        'name': "Mobilier & matériel de bureau",
+        'amount': 12000.00,
+        'duration': 5,
+        'rate': 20,
+        'amortization_n': 2400.00,
+        'amortization_n1': 2400.00,
+        'amortization_n2': 2400.00
+    },
+    {
+        'name': "Matériel de transport & manutension",
+        'amount': 0.00,
+        'duration': 5,
+        'rate': 20,
+        'amortization_n': 0.00,
+        'amortization_n1': 0.00,
+        'amortization_n2': 0.00
+    },
+    {
+        'name': "Système d'information",
+        'amount': 80000.00,
+        'duration': 5,
+        'rate': 20,
+        'amortization_n': 16000.00,
+        'amortization_n1': 16000.00,
+        'amortization_n2': 16000.00
+    }
+]
+
+
 def init_session_state():
     # Données d'entreprise
     if 'basic_info' not in st.session_state:
@@ -2444,165 +2566,23 @@ def init_session_state():
     
     # Bilan - Actif
     if 'actif_data' not in st.session_state:
-        st.session_state.actif_data = {
-            'immobilisations_non_valeur': [
-                {'label': "Frais préliminaires", 'value': 5700.0},
-                {'label': "Charges à répartir", 'value': 0.0},
-                {'label': "Primes de remboursement", 'value': 0.0}
-            ],
-            'immobilisations_incorporelles': [
-                {'label': "Recherche & développement", 'value': 0.0},
-                {'label': "Brevets, marques", 'value': 0.0},
-                {'label': "Fonds commercial", 'value': 80000.0}
-            ],
-            'immobilisations_corporelles': [
-                {'label': "Terrains", 'value': 3500.0},
-                {'label': "Constructions", 'value': 94080.0},
-                {'label': "Installations techniques", 'value': 14400.0},
-                {'label': "Matériel de transport", 'value': 0.0},
-                {'label': "Mobilier, bureau", 'value': 0.0},
-                {'label': "Autres immobilisations", 'value': 0.0}
-            ],
-            'stocks': [
-                {'label': "Marchandises", 'value': 0.0},
-                {'label': "Matières premières", 'value': 0.0}
-            ],
-            'tresorerie_actif': [
-                {'label': "Banque, chèques postaux", 'value': 0.0},
-                {'label': "Caisse, avances", 'value': 0.0}
-            ]
-        }
+        st.session_state.actif_data = copy.deepcopy(_DEFAULT_ACTIF_DATA)
     
     # Bilan - Passif
     if 'passif_data' not in st.session_state:
-        st.session_state.passif_data = {
-            'capitaux_propres': [
-                {'label': "Capital social", 'value': 70511.31},
-                {'label': "Capitaux propres assimilés", 'value': 0.0},
-                {'label': "Subvention d'investissement", 'value': 0.0}
-            ],
-            'dettes_financement': [
-                {'label': "Emprunts obligataires", 'value': 0.0},
-                {'label': "Autres dettes de financement", 'value': 0.0}
-            ],
-            'passif_circulant': [
-                {'label': "Fournisseurs et comptes rattachés", 'value': 0.0},
-                {'label': "Ecart de conversion", 'value': 0.0},
-                {'label': "Autres provisions", 'value': 0.0}
-            ],
-            'tresorerie_passif': [
-                {'label': "Banque (solde créditeur)", 'value': 0.0}
-            ]
-        }
+        st.session_state.passif_data = copy.deepcopy(_DEFAULT_PASSIF_DATA)
     
     # Données de trésorerie mensuelle
     if 'monthly_cashflow_data' not in st.session_state:
-        st.session_state.monthly_cashflow_data = {
-            'ressources': {
-                'Apports personnels': 70511.31,
-                'Emprunts': 134000.00,
-                'Subventions': 90000.00
-            },
-            'chiffre_affaires': {
-                'Ventes de produits & service au Maroc': 45004.71
-            },
-            'immobilisations': {
-                'Immobilisations incorporelles': 86840.00,
-                'Immobilisations corporelles': 96300.00
-            },
-            'charges_exploitation': {
-                'Achat de matières premières (charges variables)': 0.00,
-                'Echéances d\'emprunt': 1849.30,
-                'Impôts et taxes': 7760.94,
-                'Charges externes': 6200.00,
-                'Salaires et charges sociales': 25946.22,
-                'Frais bancaires et charges financières': 80.00
-            }
-        }
+        st.session_state.monthly_cashflow_data = copy.deepcopy(_DEFAULT_MONTHLY_CASHFLOW_DATA)
     
     # Budget TVA
     if 'vat_budget_data' not in st.session_state:
-        st.session_state.vat_budget_data = {
-            'achats': {
-                'Achat HT': 6200.00,
-                'TVA déductible sur achat': 1240.00
-            },
-            'ventes': {
-                'Vente en HT': 45004.71,
-                'TVA collecte sur vente': 9000.94
-            },
-            'tva_immobilisations': {
-                'TVA dedustible sur immobilisation': 36628.00
-            }
-        }
+        st.session_state.vat_budget_data = copy.deepcopy(_DEFAULT_VAT_BUDGET_DATA)
     
     # Tableau d'amortissement détaillé des immobilisations
     if 'detailed_amortization' not in st.session_state:
-        st.session_state.detailed_amortization = [
-            {
-                'name': "Frais préliminaire & d'approche",
-                'amount': 5700.00,
-                'duration': 5,
-                'rate': 20,
-                'amortization_n': 1140.00,
-                'amortization_n1': 1140.00,
-                'amortization_n2': 1140.00
-            },
-            {
-                'name': "Terrain / Local",
-                'amount': 0.00,
-                'duration': 10,
-                'rate': 10,
-                'amortization_n': 0.00,
-                'amortization_n1': 0.00,
-                'amortization_n2': 0.00
-            },
-            {
-                'name': "Construction / Aménagement",
-                'amount': 3500.00,
-                'duration': 5,
-                'rate': 10,
-                'amortization_n': 700.00,
-                'amortization_n1': 700.00,
-                'amortization_n2': 700.00
-            },
-            {
-                'name': "Matériel d'équipement",
-                'amount': 78400.00,
-                'duration': 5,
-                'rate': 20,
-                'amortization_n': 15680.00,
-                'amortization_n1': 15680.00,
-                'amortization_n2': 15680.00
-            },
-            {
-                'name': "Mobilier & matériel de bureau",
-                'amount': 12000.00,
-                'duration': 5,
-                'rate': 20,
-                'amortization_n': 2400.00,
-                'amortization_n1': 2400.00,
-                'amortization_n2': 2400.00
-            },
-            {
-                'name': "Matériel de transport & manutension",
-                'amount': 0.00,
-                'duration': 5,
-                'rate': 20,
-                'amortization_n': 0.00,
-                'amortization_n1': 0.00,
-                'amortization_n2': 0.00
-            },
-            {
-                'name': "Système d'information",
-                'amount': 80000.00,
-                'duration': 5,
-                'rate': 20,
-                'amortization_n': 16000.00,
-                'amortization_n1': 16000.00,
-                'amortization_n2': 16000.00
-            }
-        ]
+        st.session_state.detailed_amortization = copy.deepcopy(_DEFAULT_DETAILED_AMORTIZATION)
     
     # Données calculées (partagées entre modules)
     if 'calculated_data' not in st.session_state:
@@ -2613,862 +2593,45 @@ def init_session_state():
         st.session_state.income_statement = {}
 
 
-# Fonction pour calculer les métriques financières
-def calculate_financial_metrics(df):
+def _tva_total(frame):
     """
-    Calcule des métriques financières avancées à partir du DataFrame d'importation
+    Somme des montants × taux de TVA (%) d'un DataFrame, via un produit scalaire NumPy
     """
-    metrics = {}
-    
-    # Calculer les montants totaux par catégorie
-    total_immobilisations = df[df['type'] == 'immobilisation']['montant'].sum()
-    total_financements = df[df['type'] == 'financement']['montant'].sum()
-    total_charges_mensuelles = df[df['type'] == 'charges']['montant'].sum()
-    total_ventes_mensuelles = df[df['type'] == 'ventes']['montant'].sum()
-    
-    metrics['total_immobilisations'] = total_immobilisations
-    metrics['total_financements'] = total_financements
-    metrics['total_charges'] = total_charges_mensuelles
-    metrics['total_ventes'] = total_ventes_mensuelles
-    
-    # Calcul du flux de trésorerie mensuel
-    metrics['cash_flow_mensuel'] = total_ventes_mensuelles - total_charges_mensuelles
+    return float(np.dot(frame['montant'].to_numpy(dtype=np.float64),
+                        frame['taux_tva'].to_numpy(dtype=np.float64)) * 0.01)
+
+
+def show_finance_initiation():
+    st.header("🎓 Initiation à la Finance")
     
-    # Calcul du ROI (Retour sur investissement) si les données sont disponibles
-    if total_immobilisations > 0:
-        roi_mensuel = metrics['cash_flow_mensuel'] / total_immobilisations
-        metrics['roi_mensuel'] = roi_mensuel
-        metrics['roi_annuel'] = roi_mensuel * 12
-        
-        # Calcul du délai de récupération de l'investissement (Payback period)
-        if metrics['cash_flow_mensuel'] > 0:
-            metrics['payback_months'] = total_immobilisations / metrics['cash_flow_mensuel']
-            metrics['payback_years'] = metrics['payback_months'] / 12
-        else:
-            metrics['payback_months'] = float('inf')
-            metrics['payback_years'] = float('inf')
-    else:
-        metrics['roi_mensuel'] = 0
-        metrics['roi_annuel'] = 0
-        metrics['payback_months'] = 0
-        metrics['payback_years'] = 0
+    st.markdown("""
+    ## Ressources de formation en finance
     
-    # Calcul de la VAN (Valeur Actuelle Nette) sur 5 ans avec un taux d'actualisation de 8%
-    if PYFINANCE_AVAILABLE:
-        try:
-            if metrics['cash_flow_mensuel'] > 0:
-                # Créer un flux de trésorerie sur 60 mois (5 ans)
-                cash_flows = [-total_immobilisations] + [metrics['cash_flow_mensuel']] * 60
-                
-                # Taux d'actualisation mensuel (8% annuel)
-                monthly_rate = 0.08 / 12
-                
-                # Calculer la VAN
-                metrics['van'] = pf.npv(rate=monthly_rate, values=cash_flows)
-                
-                # Calculer le TRI
-                try:
-                    metrics['tri'] = pf.irr(values=cash_flows) * 12  # Convertir le TRI mensuel en annuel
-                except:
-                    metrics['tri'] = None
-            else:
-                metrics['van'] = -total_immobilisations
-                metrics['tri'] = None
-        except:
-            metrics['van'] = None
-            metrics['tri'] = None
-    else:
-        # Version simplifiée de calcul si PyFinance n'est pas disponible
-        if metrics['cash_flow_mensuel'] > 0:
-            # Calcul simplifié de la VAN sur 5 ans
-            van = -total_immobilisations
-            monthly_rate = 0.08 / 12
-            
-            for i in range(60):
-                van += metrics['cash_flow_mensuel'] / ((1 + monthly_rate) ** (i + 1))
-            
-            metrics['van'] = van
-            metrics['tri'] = None  # TRI indisponible sans PyFinance
-        else:
-            metrics['van'] = -total_immobilisations
-            metrics['tri'] = None
+    Cette page regroupe des vidéos pédagogiques pour vous aider à comprendre les concepts fondamentaux de la finance et de la comptabilité.
+    """)
     
-    # Calculer l'amortissement total annuel
-    annual_amort = 0
-    for _, immo in df[df['type'] == 'immobilisation'].iterrows():
-        if immo['duree_amort'] > 0:
-            annual_amort += immo['montant'] * (immo['taux_amort'] / 100)
+    # Section des vidéos YouTube
+    st.subheader("📺 Vidéos de formation")
     
-    metrics['amortissement_annuel'] = annual_amort
+    # Création de deux colonnes pour afficher les vidéos
+    col1, col2 = st.columns(2)
     
-    # Calculer la TVA
-    try:
-        # TVA sur ventes
-        tva_collectee = df[df['type'] == 'ventes'].apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
+    with col1:
+        st.markdown("### Introduction aux états financiers")
+        st.video("https://www.youtube.com/watch?v=aCzHpBSOoV0")
+        st.markdown("""
+        **Comprendre les états financiers et leur importance**
         
-        # TVA sur achats
-        tva_deductible_achats = df[df['type'] == 'charges'].apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
+        Cette vidéo explique les bases des états financiers et leur rôle dans la prise de décision.
+        """)
         
-        # TVA sur immobilisations
-        tva_deductible_immo = df[df['type'] == 'immobilisation'].apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
+        st.markdown("### Analyse de trésorerie")
+        st.video("https://www.youtube.com/watch?v=8X3rFBIgBZ4")
+        st.markdown("""
+        **Importance de la gestion de trésorerie**
         
-        metrics['tva_collectee'] = tva_collectee
-        metrics['tva_deductible_achats'] = tva_deductible_achats
-        metrics['tva_deductible_immo'] = tva_deductible_immo
-        metrics['tva_nette'] = tva_collectee - tva_deductible_achats - tva_deductible_immo
-    except:
-        metrics['tva_collectee'] = 0
-        metrics['tva_deductible_achats'] = 0
-        metrics['tva_deductible_immo'] = 0
-        metrics['tva_nette'] = 0
-    
-    return metrics
-
-
-# Fonction pour traiter le fichier CSV avec une IA simplifiée
-def process_with_ai(df):
-    """
-    Fonction d'analyse qui traite automatiquement les données importées
-    et les structure dans le bon format
-    """
-    # Vérifier si le dataframe est vide
-    if df.empty:
-        return None, "Le fichier CSV est vide.", {}
-    
-    # Initialiser le message de traitement
-    processing_log = []
-    
-    # Compter les lignes avant traitement
-    initial_rows = len(df)
-    processing_log.append(f"Fichier importé avec {initial_rows} entrées.")
-    
-    # Liste des colonnes attendues
-    expected_columns = ['type', 'categorie', 'nom', 'montant', 'taux_tva', 'duree_amort', 'taux_amort', 'date']
-    
-    # Vérifier si toutes les colonnes attendues sont présentes
-    missing_columns = [col for col in expected_columns if col not in df.columns]
-    
-    # Si des colonnes sont manquantes, tenter de déduire les colonnes à partir des données
-    if missing_columns:
-        processing_log.append(f"Colonnes manquantes détectées: {', '.join(missing_columns)}")
-        processing_log.append("Tentative de déduction des colonnes à partir des données...")
-        
-        # Copier le dataframe pour le retraiter
-        new_df = pd.DataFrame(columns=expected_columns)
-        
-        # Essayer de correspondre les colonnes existantes avec les attendues
-        column_mapping = {}
-        for col in df.columns:
-            # Essayer de deviner la colonne en fonction du nom ou du contenu
-            col_lower = col.lower()
-            
-            if any(x in col_lower for x in ['type', 'catégorie', 'élément']):
-                column_mapping[col] = 'type'
-            elif any(x in col_lower for x in ['catégorie', 'cat', 'groupe']):
-                column_mapping[col] = 'categorie'
-            elif any(x in col_lower for x in ['nom', 'designation', 'libellé', 'description']):
-                column_mapping[col] = 'nom'
-            elif any(x in col_lower for x in ['montant', 'valeur', 'prix', 'somme', 'coût']):
-                column_mapping[col] = 'montant'
-            elif any(x in col_lower for x in ['tva', 'taxe']):
-                column_mapping[col] = 'taux_tva'
-            elif any(x in col_lower for x in ['durée', 'duree', 'période', 'periode', 'années']):
-                column_mapping[col] = 'duree_amort'
-            elif any(x in col_lower for x in ['amort', 'pourcentage', 'taux']):
-                column_mapping[col] = 'taux_amort'
-            elif any(x in col_lower for x in ['date', 'jour']):
-                column_mapping[col] = 'date'
-        
-        # Appliquer la correspondance
-        for old_col, new_col in column_mapping.items():
-            new_df[new_col] = df[old_col]
-        
-        # Si certaines colonnes sont toujours manquantes, les créer avec des valeurs par défaut
-        for col in expected_columns:
-            if col not in new_df.columns:
-                if col == 'type':
-                    # Essayer de déduire le type à partir des autres colonnes
-                    new_df[col] = 'autre'
-                    if 'categorie' in new_df.columns:
-                        cat_to_type = {
-                            'equipement': 'immobilisation',
-                            'transport': 'immobilisation',
-                            'terrain': 'immobilisation',
-                            'bureau': 'immobilisation',
-                            'informatique': 'immobilisation',
-                            'apport': 'financement',
-                            'emprunt': 'financement',
-                            'subvention': 'financement',
-                            'loyer': 'charges',
-                            'personnel': 'charges',
-                            'services': 'charges',
-                            'produit': 'ventes',
-                            'service': 'ventes'
-                        }
-                        new_df[col] = new_df['categorie'].map(lambda x: next((v for k, v in cat_to_type.items() if k in str(x).lower()), 'autre'))
-                elif col == 'categorie':
-                    new_df[col] = 'autre'
-                elif col == 'taux_tva':
-                    new_df[col] = 20.0
-                elif col in ['duree_amort', 'taux_amort']:
-                    new_df[col] = 0.0
-                    if 'type' in new_df.columns:
-                        # Si c'est une immobilisation, mettre des valeurs par défaut d'amortissement
-                        is_immo = new_df['type'] == 'immobilisation'
-                        new_df.loc[is_immo, 'duree_amort'] = 5.0
-                        new_df.loc[is_immo, 'taux_amort'] = 20.0
-                elif col == 'date':
-                    new_df[col] = datetime.now().strftime('%Y-%m-%d')
-        
-        df = new_df
-        processing_log.append("Colonnes déduites et valeurs par défaut appliquées.")
-    
-    # Convertir les colonnes numériques
-    for col in ['montant', 'taux_tva', 'duree_amort', 'taux_amort']:
-        if col in df.columns:
-            try:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                # Remplacer les NaN par 0
-                df[col].fillna(0, inplace=True)
-                processing_log.append(f"Colonne {col} convertie en format numérique.")
-            except:
-                processing_log.append(f"Erreur lors de la conversion de la colonne {col} en format numérique.")
-    
-    # Convertir la colonne date en format date
-    if 'date' in df.columns:
-        try:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            # Remplacer les NaN par la date actuelle
-            df['date'].fillna(pd.Timestamp.now(), inplace=True)
-            processing_log.append("Colonne date convertie en format date.")
-        except:
-            processing_log.append("Erreur lors de la conversion de la colonne date.")
-    
-    # Dernières vérifications et nettoyages
-    df = df.drop_duplicates()
-    
-    # Calcul des métriques financières
-    metrics = calculate_financial_metrics(df)
-    processing_log.append("Métriques financières calculées.")
-    
-    # Calculer le nombre de lignes après traitement
-    final_rows = len(df)
-    processing_log.append(f"Traitement terminé: {final_rows} entrées valides.")
-    
-    return df, "\n".join(processing_log), metrics
-
-
-# Fonction pour afficher la page d'importation CSV
-def show_csv_import():
-    st.header("📤 Importation et Analyse des Données Financières")
-    
-    with st.expander("ℹ️ Guide d'importation", expanded=True):
-        st.markdown("""
-        ### Format du fichier CSV
-        
-        Le fichier CSV doit contenir les colonnes suivantes:
-        - `type`: Type d'élément (immobilisation, financement, charges, ventes)
-        - `categorie`: Sous-catégorie (equipement, transport, apport, etc.)
-        - `nom`: Nom ou description de l'élément
-        - `montant`: Montant en DHS
-        - `taux_tva`: Taux de TVA applicable (%)
-        - `duree_amort`: Durée d'amortissement (années) - pour les immobilisations
-        - `taux_amort`: Taux d'amortissement (%) - pour les immobilisations
-        - `date`: Date d'acquisition ou de transaction
-        
-        ### Comment importer
-        
-        1. Téléchargez le modèle de fichier CSV ci-dessous
-        2. Complétez-le avec vos données
-        3. Glissez-déposez le fichier dans la zone prévue
-        4. Le système analysera automatiquement vos données
-        5. Vérifiez les résultats et appliquez-les à votre projet
-        """)
-        
-        # Modèle CSV à télécharger
-        csv_template = """type,categorie,nom,montant,taux_tva,duree_amort,taux_amort,date
-immobilisation,equipement,Matériel d'équipement,78400.00,20,5,20,2023-01-15
-immobilisation,transport,Matériel de transport,45000.00,20,5,20,2023-02-10
-immobilisation,terrain,Terrain / Local,120000.00,20,10,10,2023-01-01
-financement,apport,Apport personnel,50000.00,0,0,0,2023-01-01
-financement,emprunt,Crédit bancaire,150000.00,0,0,0,2023-01-15
-financement,subvention,Subvention,30000.00,0,0,0,2023-02-01
-charges,loyer,Loyer mensuel,3500.00,20,0,0,2023-01-01
-charges,personnel,Salaire employé 1,5000.00,0,0,0,2023-01-01
-charges,personnel,Salaire employé 2,6000.00,0,0,0,2023-01-01
-charges,services,Téléphone et Internet,500.00,20,0,0,2023-01-01
-charges,services,Électricité,800.00,14,0,0,2023-01-01
-ventes,produit,Produit A,12000.00,20,0,0,2023-01-15
-ventes,produit,Produit B,8000.00,20,0,0,2023-01-20
-ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
-        
-        st.download_button(
-            label="📥 Télécharger le modèle CSV",
-            data=csv_template,
-            file_name="modele_donnees_financieres.csv",
-            mime="text/csv"
-        )
-    
-    # Interface d'importation
-    uploaded_file = st.file_uploader("Glissez-déposez votre fichier CSV ici", type=["csv"])
-    
-    if uploaded_file is not None:
-        try:
-            # Traitement du fichier avec indicateur de chargement
-            with st.spinner("Analyse du fichier CSV en cours..."):
-                # Lecture du fichier
-                df = pd.read_csv(uploaded_file, sep=None, engine='python')
-                
-                # Traitement et analyse
-                processed_df, log_message, metrics = process_with_ai(df)
-                
-                if processed_df is not None:
-                    st.success("✅ Fichier importé et traité avec succès!")
-                    
-                    # Afficher le rapport de traitement
-                    with st.expander("📋 Rapport de traitement", expanded=False):
-                        st.code(log_message)
-                    
-                    # Dashboard de résultats financiers avec onglets
-                    tab1, tab2, tab3, tab4 = st.tabs(["Synthèse", "Rentabilité", "TVA", "Données importées"])
-                    
-                    with tab1:
-                        # Métriques principales
-                        col1, col2, col3, col4 = st.columns(4)
-                        
-                        with col1:
-                            st.metric(
-                                "Total Immobilisations", 
-                                f"{metrics['total_immobilisations']:,.2f} DHS"
-                            )
-                        
-                        with col2:
-                            st.metric(
-                                "Total Financements", 
-                                f"{metrics['total_financements']:,.2f} DHS"
-                            )
-                        
-                        with col3:
-                            st.metric(
-                                "Charges Mensuelles", 
-                                f"{metrics['total_charges']:,.2f} DHS"
-                            )
-                        
-                        with col4:
-                            st.metric(
-                                "Ventes Mensuelles", 
-                                f"{metrics['total_ventes']:,.2f} DHS",
-                                f"{metrics['cash_flow_mensuel']:+,.2f} DHS"
-                            )
-                        
-                        # Visualisations
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            # Graphique de répartition par type
-                            pie_data = processed_df.groupby('type')['montant'].sum().reset_index()
-                            if not pie_data.empty:
-                                fig = px.pie(
-                                    pie_data,
-                                    values='montant',
-                                    names='type',
-                                    title="Répartition par type de données",
-                                    color_discrete_sequence=px.colors.qualitative.Bold
-                                )
-                                fig.update_layout(
-                                    paper_bgcolor='rgba(0,0,0,0)',
-                                    plot_bgcolor='rgba(0,0,0,0)',
-                                    font_color='white'
-                                )
-                                st.plotly_chart(fig, use_container_width=True)
-                        
-                        with col2:
-                            # Graphique des immobilisations par catégorie
-                            immo_data = processed_df[processed_df['type'] == 'immobilisation']
-                            if not immo_data.empty:
-                                immo_by_cat = immo_data.groupby('categorie')['montant'].sum().reset_index()
-                                fig = px.bar(
-                                    immo_by_cat,
-                                    x='categorie',
-                                    y='montant',
-                                    title="Immobilisations par catégorie",
-                                    color='categorie',
-                                    color_discrete_sequence=px.colors.qualitative.Pastel
-                                )
-                                fig.update_layout(
-                                    paper_bgcolor='rgba(0,0,0,0)',
-                                    plot_bgcolor='rgba(0,0,0,0)',
-                                    font_color='white',
-                                    xaxis_title="Catégorie",
-                                    yaxis_title="Montant (DHS)"
-                                )
-                                st.plotly_chart(fig, use_container_width=True)
-                            else:
-                                st.info("Aucune immobilisation trouvée dans les données importées.")
-                    
-                    with tab2:
-                        # Métriques de rentabilité
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            st.metric(
-                                "Cash-Flow Mensuel",
-                                f"{metrics['cash_flow_mensuel']:,.2f} DHS",
-                                f"{metrics['cash_flow_mensuel']*12:+,.2f} DHS (annuel)"
-                            )
-                            
-                            if metrics['payback_months'] != float('inf'):
-                                st.metric(
-                                    "Délai de récupération",
-                                    f"{metrics['payback_months']:.1f} mois",
-                                    f"{metrics['payback_years']:.2f} ans"
-                                )
-                            else:
-                                st.metric(
-                                    "Délai de récupération",
-                                    "N/A",
-                                    "Cash-flow négatif ou nul"
-                                )
-                        
-                        with col2:
-                            st.metric(
-                                "ROI (Retour sur investissement)",
-                                f"{metrics.get('roi_annuel', 0)*100:.2f}% par an",
-                                f"{metrics.get('roi_mensuel', 0)*100:.2f}% par mois"
-                            )
-                            
-                            st.metric(
-                                "VAN (Valeur Actuelle Nette)",
-                                f"{metrics.get('van', 0):,.2f} DHS",
-                                f"TRI: {metrics.get('tri', 0)*100:.2f}%" if metrics.get('tri') else "TRI: N/A"
-                            )
-                        
-                        # Graphique de projection des flux de trésorerie
-                        if metrics['cash_flow_mensuel'] > 0:
-                            months = list(range(0, 25))
-                            cumulative_cash_flow = [-metrics['total_immobilisations']]
-                            
-                            for i in range(1, 25):
-                                cumulative_cash_flow.append(cumulative_cash_flow[-1] + metrics['cash_flow_mensuel'])
-                            
-                            cash_flow_df = pd.DataFrame({
-                                'Mois': months,
-                                'Flux de trésorerie cumulé': cumulative_cash_flow
-                            })
-                            
-                            fig = px.line(
-                                cash_flow_df, 
-                                x='Mois', 
-                                y='Flux de trésorerie cumulé',
-                                markers=True,
-                                title="Projection du flux de trésorerie sur 24 mois"
-                            )
-                            
-                            # Ligne horizontale à y=0
-                            fig.add_shape(
-                                type='line',
-                                x0=0,
-                                y0=0,
-                                x1=24,
-                                y1=0,
-                                line=dict(color='gray', dash='dash')
-                            )
-                            
-                            fig.update_layout(
-                                paper_bgcolor='rgba(0,0,0,0)',
-                                plot_bgcolor='rgba(0,0,0,0)',
-                                font_color='white',
-                                xaxis_title="Mois",
-                                yaxis_title="Flux de trésorerie cumulé (DHS)"
-                            )
-                            
-                            st.plotly_chart(fig, use_container_width=True)
-                            
-                            # Analyse détaillée de la rentabilité
-                            with st.expander("🔍 Analyse de rentabilité détaillée"):
-                                st.markdown("""
-                                ### Analyse de la rentabilité
-                                
-                                L'analyse est basée sur les hypothèses suivantes:
-                                - Les charges et revenus mensuels sont constants
-                                - Le taux d'actualisation utilisé pour la VAN est de 8% annuel
-                                - L'horizon d'investissement est de 5 ans
-                                
-                                **Interprétation des résultats:**
-                                """)
-                                
-                                if metrics.get('van', 0) > 0:
-                                    st.success("✅ La VAN est positive, ce qui indique que le projet est rentable sur 5 ans.")
-                                else:
-                                    st.warning("⚠️ La VAN est négative, ce qui indique que le projet n'est pas rentable sur 5 ans.")
-                                
-                                if metrics.get('payback_months', float('inf')) < 24:
-                                    st.success(f"✅ Le délai de récupération est de {metrics.get('payback_months', 0):.1f} mois, ce qui est inférieur à 2 ans.")
-                                elif metrics.get('payback_months', float('inf')) < 60:
-                                    st.info(f"ℹ️ Le délai de récupération est de {metrics.get('payback_months', 0):.1f} mois, ce qui est acceptable mais pourrait être amélioré.")
-                                else:
-                                    st.warning(f"⚠️ Le délai de récupération est de {metrics.get('payback_months', 0):.1f} mois, ce qui est relativement long.")
-                        else:
-                            st.info("Impossible de générer une projection de trésorerie: cash-flow mensuel nul ou négatif.")
-                    
-                    with tab3:
-                        # Analyse TVA
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            st.metric(
-                                "TVA Collectée", 
-                                f"{metrics.get('tva_collectee', 0):,.2f} DHS"
-                            )
-                        
-                        with col2:
-                            st.metric(
-                                "TVA Déductible", 
-                                f"{metrics.get('tva_deductible_achats', 0) + metrics.get('tva_deductible_immo', 0):,.2f} DHS",
-                                f"Achats: {metrics.get('tva_deductible_achats', 0):,.2f} | Immos: {metrics.get('tva_deductible_immo', 0):,.2f}"
-                            )
-                        
-                        with col3:
-                            st.metric(
-                                "TVA Nette", 
-                                f"{metrics.get('tva_nette', 0):,.2f} DHS"
-                            )
-                        
-                        # Graphique de répartition de la TVA
-                        tva_data = {
-                            'Composant': ['TVA Collectée', 'TVA Déductible Achats', 'TVA Déductible Immos'],
-                            'Montant': [
-                                metrics.get('tva_collectee', 0), 
-                                metrics.get('tva_deductible_achats', 0), 
-                                metrics.get('tva_deductible_immo', 0)
-                            ]
-                        }
-                        
-                        tva_df = pd.DataFrame(tva_data)
-                        
-                        if tva_df['Montant'].sum() > 0:
-                            fig = px.bar(
-                                tva_df,
-                                x='Composant',
-                                y='Montant',
-                                title="Répartition des composants de la TVA",
-                                color='Composant',
-                                color_discrete_sequence=px.colors.qualitative.Pastel
-                            )
-                            
-                            fig.update_layout(
-                                paper_bgcolor='rgba(0,0,0,0)',
-                                plot_bgcolor='rgba(0,0,0,0)',
-                                font_color='white',
-                                xaxis_title="",
-                                yaxis_title="Montant (DHS)"
-                            )
-                            
-                            st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Détail TVA par catégorie
-                        st.subheader("Détail de la TVA par catégorie")
-                        
-                        # Construire le tableau détaillé
-                        tva_details = []
-                        
-                        # Ventes
-                        ventes_df = processed_df[processed_df['type'] == 'ventes']
-                        if not ventes_df.empty:
-                            for _, row in ventes_df.groupby('categorie').agg({'montant': 'sum', 'taux_tva': 'mean'}).reset_index().iterrows():
-                                tva_details.append({
-                                    'Type': 'Ventes',
-                                    'Catégorie': row['categorie'],
-                                    'Montant HT': row['montant'],
-                                    'Taux TVA': f"{row['taux_tva']:.1f}%",
-                                    'TVA': row['montant'] * (row['taux_tva']/100),
-                                    'Type TVA': 'Collectée'
-                                })
-                        
-                        # Charges
-                        charges_df = processed_df[processed_df['type'] == 'charges']
-                        if not charges_df.empty:
-                            for _, row in charges_df.groupby('categorie').agg({'montant': 'sum', 'taux_tva': 'mean'}).reset_index().iterrows():
-                                tva_details.append({
-                                    'Type': 'Charges',
-                                    'Catégorie': row['categorie'],
-                                    'Montant HT': row['montant'],
-                                    'Taux TVA': f"{row['taux_tva']:.1f}%",
-                                    'TVA': row['montant'] * (row['taux_tva']/100),
-                                    'Type TVA': 'Déductible'
-                                })
-                        
-                        # Immobilisations
-                        immos_df = processed_df[processed_df['type'] == 'immobilisation']
-                        if not immos_df.empty:
-                            for _, row in immos_df.groupby('categorie').agg({'montant': 'sum', 'taux_tva': 'mean'}).reset_index().iterrows():
-                                tva_details.append({
-                                    'Type': 'Immobilisation',
-                                    'Catégorie': row['categorie'],
-                                    'Montant HT': row['montant'],
-                                    'Taux TVA': f"{row['taux_tva']:.1f}%",
-                                    'TVA': row['montant'] * (row['taux_tva']/100),
-                                    'Type TVA': 'Déductible'
-                                })
-                        
-                        # Afficher le tableau s'il y a des données
-                        if tva_details:
-                            tva_details_df = pd.DataFrame(tva_details)
-                            # Formatter pour l'affichage
-                            tva_details_df['Montant HT'] = tva_details_df['Montant HT'].apply(lambda x: f"{x:,.2f} DHS")
-                            tva_details_df['TVA'] = tva_details_df['TVA'].apply(lambda x: f"{x:,.2f} DHS")
-                            st.dataframe(tva_details_df, use_container_width=True)
-                        else:
-                            st.info("Aucune donnée TVA détaillée disponible.")
-                    
-                    with tab4:
-                        # Données importées
-                        st.subheader("Données importées")
-                        
-                        # Option de filtrage par type
-                        type_filter = st.multiselect(
-                            "Filtrer par type",
-                            options=sorted(processed_df['type'].unique()),
-                            default=sorted(processed_df['type'].unique())
-                        )
-                        
-                        filtered_df = processed_df[processed_df['type'].isin(type_filter)]
-                        
-                        # Formatter pour l'affichage
-                        display_df = filtered_df.copy()
-                        display_df['montant'] = display_df['montant'].apply(lambda x: f"{x:,.2f}")
-                        display_df['taux_tva'] = display_df['taux_tva'].apply(lambda x: f"{x:.1f}%")
-                        display_df['duree_amort'] = display_df['duree_amort'].apply(lambda x: f"{x:.0f}" if x > 0 else "-")
-                        display_df['taux_amort'] = display_df['taux_amort'].apply(lambda x: f"{x:.1f}%" if x > 0 else "-")
-                        
-                        st.dataframe(display_df, use_container_width=True)
-                    
-                    # Application des données
-                    st.subheader("Application des données")
-                    
-                    # Options d'application
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        apply_all = st.checkbox("Tout appliquer", value=True)
-                    
-                    if not apply_all:
-                        with col2:
-                            sections_to_apply = st.multiselect(
-                                "Sections à appliquer",
-                                options=["Immobilisations", "Financements", "Charges", "Ventes", "Amortissements", "TVA"],
-                                default=["Immobilisations", "Financements"]
-                            )
-                    else:
-                        sections_to_apply = ["Immobilisations", "Financements", "Charges", "Ventes", "Amortissements", "TVA"]
-                    
-                    # Bouton d'application
-                    if st.button("Appliquer les données", type="primary"):
-                        # Filtrer par type pour la mise à jour
-                        immos = processed_df[processed_df['type'] == 'immobilisation']
-                        finances = processed_df[processed_df['type'] == 'financement']
-                        charges = processed_df[processed_df['type'] == 'charges']
-                        ventes = processed_df[processed_df['type'] == 'ventes']
-                        
-                        updates_made = []
-                        
-                        # Mise à jour des immobilisations
-                        if "Immobilisations" in sections_to_apply and not immos.empty:
-                            st.session_state.immos = []
-                            for _, row in immos.iterrows():
-                                st.session_state.immos.append({
-                                    "Nom": row['nom'],
-                                    "Montant": row['montant'],
-                                    "Catégorie": row['categorie'],
-                                    "Date": row['date']
-                                })
-                            updates_made.append("Immobilisations")
-                        
-                        # Mise à jour des financements
-                        if "Financements" in sections_to_apply and not finances.empty:
-                            # Apports
-                            apports = finances[finances['categorie'] == 'apport']['montant'].sum()
-                            if apports > 0:
-                                st.session_state.investment_data['cash_contribution'] = apports
-                                
-                            # Emprunts
-                            emprunts = finances[finances['categorie'] == 'emprunt']
-                            if not emprunts.empty:
-                                st.session_state.credits = []
-                                for _, row in emprunts.iterrows():
-                                    st.session_state.credits.append({
-                                        "Nom": row['nom'],
-                                        "Montant": row['montant'],
-                                        "Date": row['date']
-                                    })
-                                # Mise à jour dans monthly_cashflow_data
-                                st.session_state.monthly_cashflow_data['ressources']['Emprunts'] = emprunts['montant'].sum()
-                            
-                            # Subventions
-                            subventions = finances[finances['categorie'] == 'subvention']
-                            if not subventions.empty:
-                                st.session_state.subsidies = []
-                                for _, row in subventions.iterrows():
-                                    st.session_state.subsidies.append({
-                                        "Nom": row['nom'],
-                                        "Montant": row['montant'],
-                                        "Date": row['date']
-                                    })
-                                # Mise à jour dans monthly_cashflow_data
-                                st.session_state.monthly_cashflow_data['ressources']['Subventions'] = subventions['montant'].sum()
-                            
-                            updates_made.append("Financements")
-                        
-                        # Mise à jour du tableau de trésorerie
-                        if "Charges" in sections_to_apply and not charges.empty:
-                            charges_by_cat = charges.groupby('categorie')['montant'].sum()
-                            # Adapter les catégories aux clés existantes ou créer de nouvelles
-                            for cat, amount in charges_by_cat.items():
-                                found = False
-                                for key in st.session_state.monthly_cashflow_data['charges_exploitation'].keys():
-                                    if cat.lower() in key.lower():
-                                        st.session_state.monthly_cashflow_data['charges_exploitation'][key] = amount
-                                        found = True
-                                        break
-                                
-                                if not found:
-                                    # Ajouter une nouvelle catégorie
-                                    cat_name = cat.capitalize()
-                                    st.session_state.monthly_cashflow_data['charges_exploitation'][cat_name] = amount
-                            
-                            updates_made.append("Charges")
-                        
-                        if "Ventes" in sections_to_apply and not ventes.empty:
-                            ventes_by_cat = ventes.groupby('categorie')['montant'].sum()
-                            # Adapter les catégories aux clés existantes ou créer de nouvelles
-                            for cat, amount in ventes_by_cat.items():
-                                found = False
-                                for key in st.session_state.monthly_cashflow_data['chiffre_affaires'].keys():
-                                    if cat.lower() in key.lower():
-                                        st.session_state.monthly_cashflow_data['chiffre_affaires'][key] = amount
-                                        found = True
-                                        break
-                                
-                                if not found:
-                                    # Ajouter une nouvelle catégorie
-                                    cat_name = cat.capitalize()
-                                    st.session_state.monthly_cashflow_data['chiffre_affaires'][cat_name] = amount
-                            
-                            updates_made.append("Ventes")
-                        
-                        # Mise à jour du tableau d'amortissement
-                        if "Amortissements" in sections_to_apply and not immos.empty:
-                            for _, row in immos.iterrows():
-                                # Trouver l'immobilisation correspondante ou la plus proche
-                                best_match = None
-                                best_match_score = 0
-                                
-                                for i, item in enumerate(st.session_state.detailed_amortization):
-                                    # Vérifier si le nom correspond exactement
-                                    if item["name"].lower() == row['nom'].lower():
-                                        best_match = i
-                                        break
-                                    
-                                    # Sinon vérifier si la catégorie est dans le nom
-                                    elif row['categorie'].lower() in item["name"].lower():
-                                        match_score = len(row['categorie'])
-                                        if match_score > best_match_score:
-                                            best_match = i
-                                            best_match_score = match_score
-                                
-                                # Mettre à jour l'élément trouvé ou en ajouter un nouveau
-                                if best_match is not None:
-                                    st.session_state.detailed_amortization[best_match]["amount"] = row['montant']
-                                    st.session_state.detailed_amortization[best_match]["duration"] = row['duree_amort']
-                                    st.session_state.detailed_amortization[best_match]["rate"] = row['taux_amort']
-                                    
-                                    # Recalculer l'amortissement
-                                    annual_amort = row['montant'] * (row['taux_amort'] / 100)
-                                    st.session_state.detailed_amortization[best_match]["amortization_n"] = annual_amort
-                                    st.session_state.detailed_amortization[best_match]["amortization_n1"] = annual_amort
-                                    st.session_state.detailed_amortization[best_match]["amortization_n2"] = annual_amort
-                                else:
-                                    # Ajouter une nouvelle entrée
-                                    annual_amort = row['montant'] * (row['taux_amort'] / 100)
-                                    st.session_state.detailed_amortization.append({
-                                        "name": row['nom'],
-                                        "amount": row['montant'],
-                                        "duration": row['duree_amort'],
-                                        "rate": row['taux_amort'],
-                                        "amortization_n": annual_amort,
-                                        "amortization_n1": annual_amort,
-                                        "amortization_n2": annual_amort
-                                    })
-                            
-                            updates_made.append("Amortissements")
-                        
-                        # Mise à jour de la TVA
-                        if "TVA" in sections_to_apply:
-                            # TVA sur achats
-                            if not charges.empty:
-                                charges_ht = charges['montant'].sum()
-                                tva_charges = charges.apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
-                                
-                                st.session_state.vat_budget_data['achats']['Achat HT'] = charges_ht
-                                st.session_state.vat_budget_data['achats']['TVA déductible sur achat'] = tva_charges
-                            
-                            # TVA sur ventes
-                            if not ventes.empty:
-                                ventes_ht = ventes['montant'].sum()
-                                tva_ventes = ventes.apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
-                                
-                                st.session_state.vat_budget_data['ventes']['Vente en HT'] = ventes_ht
-                                st.session_state.vat_budget_data['ventes']['TVA collecte sur vente'] = tva_ventes
-                            
-                            # TVA sur immobilisations
-                            if not immos.empty:
-                                tva_immo = immos.apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
-                                
-                                st.session_state.vat_budget_data['tva_immobilisations']["TVA dedustible sur immobilisation"] = tva_immo
-                            
-                            updates_made.append("TVA")
-                        
-                        # Afficher un résumé des mises à jour effectuées
-                        if updates_made:
-                            st.success(f"✅ Données appliquées avec succès : {', '.join(updates_made)}")
-                            st.balloons()
-                        else:
-                            st.warning("⚠️ Aucune donnée sélectionnée pour l'application.")
-        
-        except Exception as e:
-            st.error(f"Une erreur s'est produite lors du traitement du fichier : {str(e)}")
-            st.info("Veuillez vérifier le format de votre fichier CSV et réessayer.")
-
-def show_finance_initiation():
-    st.header("🎓 Initiation à la Finance")
-    
-    st.markdown("""
-    ## Ressources de formation en finance
-    
-    Cette page regroupe des vidéos pédagogiques pour vous aider à comprendre les concepts fondamentaux de la finance et de la comptabilité.
-    """)
-    
-    # Section des vidéos YouTube
-    st.subheader("📺 Vidéos de formation")
-    
-    # Création de deux colonnes pour afficher les vidéos
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("### Introduction aux états financiers")
-        st.video("https://www.youtube.com/watch?v=aCzHpBSOoV0")
-        st.markdown("""
-        **Comprendre les états financiers et leur importance**
-        
-        Cette vidéo explique les bases des états financiers et leur rôle dans la prise de décision.
-        """)
-        
-        st.markdown("### Analyse de trésorerie")
-        st.video("https://www.youtube.com/watch?v=8X3rFBIgBZ4")
-        st.markdown("""
-        **Importance de la gestion de trésorerie**
-        
-        Cette vidéo explique comment analyser et gérer efficacement la trésorerie d'une entreprise.
-        """)
+        Cette vidéo explique comment analyser et gérer efficacement la trésorerie d'une entreprise.
+        """)
     
     with col2:
         st.markdown("### Comprendre le bilan")
@@ -3558,6 +2721,7 @@ def main():
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
                 init_session_state()
+                bump_session_data_version()
                 st.rerun()
         
         # Section de sauvegarde des données dans la sidebar
@@ -3626,13 +2790,10 @@ def main():
             if st.button("🖨️ Générer le PDF", key="generate_pdf_btn"):
                 with st.spinner("Génération du rapport en cours..."):
                     try:
-                        pdf_file = generate_pdf_report(report_name, include_sections)
+                        pdf_bytes = generate_pdf_report(report_name, include_sections)
                         st.success("✅ Rapport PDF généré avec succès!")
                         
                         # Téléchargement du PDF
-                        with open(pdf_file, "rb") as f:
-                            pdf_bytes = f.read()
-                        
                         st.download_button(
                             label="⬇️ Télécharger le PDF",
                             data=pdf_bytes,
@@ -3736,26 +2897,32 @@ def show_company_info():
 # ========== INVESTISSEMENTS ==========
 def show_investments():
     st.header("Investissements et Financement")
+    
+    # Alias locaux des données de session (une seule résolution via le proxy par rendu)
+    ss = st.session_state
+    inv = ss.investment_data
+    calc = ss.calculated_data
+    frais = ss.frais_preliminaires
 
     with st.expander("Détail des Investissements", expanded=True):
         st.subheader("Frais Préliminaires")
         col1, col2 = st.columns(2)
         with col1:
-            st.session_state.investment_data['brand_registration'] = st.number_input(
+            inv['brand_registration'] = st.number_input(
                 "Enregistrement de la marque (DHS)", 
                 min_value=0.0,
-                value=st.session_state.investment_data['brand_registration'])
+                value=inv['brand_registration'])
         with col2:
-            st.session_state.investment_data['sarl_formation'] = st.number_input(
+            inv['sarl_formation'] = st.number_input(
                 "Frais de constitution SARL (DHS)",
                 min_value=0.0,
-                value=st.session_state.investment_data['sarl_formation'])
+                value=inv['sarl_formation'])
         
         # Mettre à jour les frais préliminaires pour la cohérence avec d'autres pages
-        if len(st.session_state.frais_preliminaires) >= 1:
-            st.session_state.frais_preliminaires[0]["valeur"] = st.session_state.investment_data['brand_registration']
-        if len(st.session_state.frais_preliminaires) >= 2:
-            st.session_state.frais_preliminaires[1]["valeur"] = st.session_state.investment_data['sarl_formation']
+        if len(frais) >= 1:
+            frais[0]["valeur"] = inv['brand_registration']
+        if len(frais) >= 2:
+            frais[1]["valeur"] = inv['sarl_formation']
 
         st.subheader("Immobilisations Corporelles")
         new_name = st.text_input("Nom de l'immobilisation", key="new_imm_name")
@@ -3763,10 +2930,10 @@ def show_investments():
         
         if st.button("➕ Ajouter une immobilisation", key="add_immo"):
             if new_name and new_value > 0:
-                st.session_state.immos.append({"Nom": new_name, "Montant": float(new_value)})
+                ss.immos.append({"Nom": new_name, "Montant": float(new_value)})
 
-        if st.session_state.immos:
-            df_immos = pd.DataFrame(st.session_state.immos)
+        if ss.immos:
+            df_immos = pd.DataFrame(ss.immos)
             
             # Ajouter des boutons de suppression pour chaque immobilisation
             edited_df = st.data_editor(
@@ -3777,7 +2944,7 @@ def show_investments():
             )
             
             # Mettre à jour les immobilisations avec les valeurs éditées
-            st.session_state.immos = edited_df.to_dict('records')
+            ss.immos = edited_df.to_dict('records')
             
             total_immos = edited_df["Montant"].sum()
         else:
@@ -3786,25 +2953,25 @@ def show_investments():
         st.write(f"**Total Immobilisations Corporelles : {total_immos:,.2f} DHS**")
         
         # Stocker le total pour les autres pages
-        st.session_state.calculated_data['total_immos'] = total_immos
+        calc['total_immos'] = total_immos
 
         st.subheader("Système d'Information")
-        st.session_state.investment_data['web_dev'] = st.number_input(
+        inv['web_dev'] = st.number_input(
             "Développement application web (DHS)", 
             min_value=0.0,
-            value=st.session_state.investment_data['web_dev'])
+            value=inv['web_dev'])
 
     with st.expander("Plan de Financement", expanded=True):
         st.subheader("Apports")
-        st.session_state.investment_data['cash_contribution'] = st.number_input(
+        inv['cash_contribution'] = st.number_input(
             "Apport en numéraire (DHS)", 
             min_value=0.0,
-            value=st.session_state.investment_data['cash_contribution'])
+            value=inv['cash_contribution'])
         
-        st.session_state.investment_data['in_kind'] = st.number_input(
+        inv['in_kind'] = st.number_input(
             "Apport en nature (DHS)", 
             min_value=0.0,
-            value=st.session_state.investment_data['in_kind'])
+            value=inv['in_kind'])
 
         st.subheader("Crédits")
         col1, col2, col3, col4 = st.columns(4)
@@ -3819,15 +2986,15 @@ def show_investments():
         
         if st.button("➕ Ajouter un crédit", key="add_credit"):
             if new_credit_name and new_credit_amount > 0:
-                st.session_state.credits.append({
+                ss.credits.append({
                     "Nom": new_credit_name,
                     "Montant": float(new_credit_amount),
                     "Taux": float(new_credit_rate),
                     "Durée": int(new_credit_duration)
                 })
         
-        if st.session_state.credits:
-            df_credits = pd.DataFrame(st.session_state.credits)
+        if ss.credits:
+            df_credits = pd.DataFrame(ss.credits)
             
             # Ajouter des boutons de suppression pour chaque crédit
             edited_df = st.data_editor(
@@ -3838,7 +3005,7 @@ def show_investments():
             )
             
             # Mettre à jour les crédits avec les valeurs éditées
-            st.session_state.credits = edited_df.to_dict('records')
+            ss.credits = edited_df.to_dict('records')
             
             total_credits = edited_df["Montant"].sum()
         else:
@@ -3847,7 +3014,7 @@ def show_investments():
         st.write(f"**Total Crédits : {total_credits:,.2f} DHS**")
         
         # Stocker le total pour les autres pages
-        st.session_state.calculated_data['total_credits'] = total_credits
+        calc['total_credits'] = total_credits
 
         st.subheader("Subventions")
         col1, col2 = st.columns(2)
@@ -3858,13 +3025,13 @@ def show_investments():
         
         if st.button("➕ Ajouter une subvention", key="add_subsidy"):
             if new_subsidy_name and new_subsidy_amount > 0:
-                st.session_state.subsidies.append({
+                ss.subsidies.append({
                     "Nom": new_subsidy_name,
                     "Montant": float(new_subsidy_amount)
                 })
         
-        if st.session_state.subsidies:
-            df_subsidies = pd.DataFrame(st.session_state.subsidies)
+        if ss.subsidies:
+            df_subsidies = pd.DataFrame(ss.subsidies)
             
             # Ajouter des boutons de suppression pour chaque subvention
             edited_df = st.data_editor(
@@ -3875,7 +3042,7 @@ def show_investments():
             )
             
             # Mettre à jour les subventions avec les valeurs éditées
-            st.session_state.subsidies = edited_df.to_dict('records')
+            ss.subsidies = edited_df.to_dict('records')
             
             total_subsidies = edited_df["Montant"].sum()
         else:
@@ -3884,13 +3051,13 @@ def show_investments():
         st.write(f"**Total Subventions : {total_subsidies:,.2f} DHS**")
         
         # Stocker le total pour les autres pages
-        st.session_state.calculated_data['total_subsidies'] = total_subsidies
+        calc['total_subsidies'] = total_subsidies
         
         # Calculer et stocker les totaux globaux
-        total_frais = st.session_state.investment_data['brand_registration'] + st.session_state.investment_data['sarl_formation']
-        st.session_state.calculated_data['total_frais'] = total_frais
-        st.session_state.calculated_data['total_investissement'] = total_frais + total_immos + st.session_state.investment_data['web_dev']
-        st.session_state.calculated_data['total_financement'] = st.session_state.investment_data['cash_contribution'] + st.session_state.investment_data['in_kind'] + total_credits + total_subsidies
+        total_frais = inv['brand_registration'] + inv['sarl_formation']
+        calc['total_frais'] = total_frais
+        calc['total_investissement'] = total_frais + total_immos + inv['web_dev']
+        calc['total_financement'] = inv['cash_contribution'] + inv['in_kind'] + total_credits + total_subsidies
 
     # Résumé du plan de financement
     with st.expander("Résumé du Plan de Financement", expanded=True):
@@ -3898,23 +3065,24 @@ def show_investments():
         
         with col1:
             st.subheader("Sources")
-            st.write(f"Apport en numéraire: {st.session_state.investment_data['cash_contribution']:,.2f} DHS")
-            st.write(f"Apport en nature: {st.session_state.investment_data['in_kind']:,.2f} DHS")
-            st.write(f"Crédits: {st.session_state.calculated_data['total_credits']:,.2f} DHS")
-            st.write(f"Subventions: {st.session_state.calculated_data['total_subsidies']:,.2f} DHS")
-            st.write(f"**Total: {st.session_state.calculated_data['total_financement']:,.2f} DHS**")
+            st.write(f"Apport en numéraire: {inv['cash_contribution']:,.2f} DHS")
+            st.write(f"Apport en nature: {inv['in_kind']:,.2f} DHS")
+            st.write(f"Crédits: {calc['total_credits']:,.2f} DHS")
+            st.write(f"Subventions: {calc['total_subsidies']:,.2f} DHS")
+            st.write(f"**Total: {calc['total_financement']:,.2f} DHS**")
         
         with col2:
             st.subheader("Emplois")
-            st.write(f"Frais préliminaires: {st.session_state.calculated_data['total_frais']:,.2f} DHS")
-            st.write(f"Immobilisations corporelles: {st.session_state.calculated_data['total_immos']:,.2f} DHS")
-            st.write(f"Système d'information: {st.session_state.investment_data['web_dev']:,.2f} DHS")
-            st.write(f"**Total: {st.session_state.calculated_data['total_investissement']:,.2f} DHS**")
+            st.write(f"Frais préliminaires: {calc['total_frais']:,.2f} DHS")
+            st.write(f"Immobilisations corporelles: {calc['total_immos']:,.2f} DHS")
+            st.write(f"Système d'information: {inv['web_dev']:,.2f} DHS")
+            st.write(f"**Total: {calc['total_investissement']:,.2f} DHS**")
         
         # Calcul de l'équilibre
-        equilibre = st.session_state.calculated_data['total_financement'] - st.session_state.calculated_data['total_investissement']
+        equilibre_centimes = _to_centimes(calc['total_financement']) - _to_centimes(calc['total_investissement'])
+        equilibre = equilibre_centimes / 100
         
-        if abs(equilibre) < 0.01:
+        if equilibre_centimes == 0:
             st.success("✅ Plan de financement équilibré")
         else:
             if equilibre > 0:
@@ -3923,45 +3091,88 @@ def show_investments():
                 st.error(f"❌ Déficit de financement : {abs(equilibre):,.2f} DHS")
 
 # ========== BILAN ==========
-def show_balance_sheet():
-    st.header("Bilan d'Ouverture")
-    
-    # Mettre à jour les valeurs importantes avec les données des autres onglets
-    if 'calculated_data' in st.session_state:
-        # Frais préliminaires
-        if len(st.session_state.actif_data['immobilisations_non_valeur']) > 0:
-            st.session_state.actif_data['immobilisations_non_valeur'][0]['value'] = st.session_state.calculated_data.get('total_frais', 5700.0)
-        
-        # Immobilisations incorporelles (système d'information)
-        if len(st.session_state.actif_data['immobilisations_incorporelles']) > 2:
-            st.session_state.actif_data['immobilisations_incorporelles'][2]['value'] = st.session_state.investment_data.get('web_dev', 80000.0)
-        
-        # Apports (capital social)
-        total_apports = st.session_state.investment_data.get('cash_contribution', 50511.31) + st.session_state.investment_data.get('in_kind', 20000.0)
-        if len(st.session_state.passif_data['capitaux_propres']) > 0:
-            st.session_state.passif_data['capitaux_propres'][0]['value'] = total_apports
-        
-        # Subventions
-        if len(st.session_state.passif_data['capitaux_propres']) > 2:
-            st.session_state.passif_data['capitaux_propres'][2]['value'] = st.session_state.calculated_data.get('total_subsidies', 0.0)
-        
-        # Dettes de financement
-        if len(st.session_state.passif_data['dettes_financement']) > 0:
-            st.session_state.passif_data['dettes_financement'][0]['value'] = st.session_state.calculated_data.get('total_credits', 0.0)
+# Configuration de colonnes partagée par tous les éditeurs du bilan
+_BILAN_COLUMN_CONFIG = {
+    "label": "Libellé",
+    "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
+}
 
-    # Fonctions pour gérer les lignes
-    def add_line(category, section, default_label="Nouvelle ligne", default_value=0.0):
-        if category == 'actif':
-            st.session_state.actif_data[section].append({'label': default_label, 'value': default_value})
-        else:
-            st.session_state.passif_data[section].append({'label': default_label, 'value': default_value})
 
-    def remove_line(category, section, index):
-        if category == 'actif':
-            st.session_state.actif_data[section].pop(index)
-        else:
-            st.session_state.passif_data[section].pop(index)
+# Nombre maximal de lignes affichées dans un éditeur de section (protection du rendu)
+_MAX_EDITOR_ROWS = 5000
+
+
+def _section_centimes(df, value_col='value'):
+    """
+    Total en centimes entiers d'une colonne de montants d'un tableau édité (valeurs vides comptées à 0)
+    """
+    if value_col not in df:
+        return 0
+    # Conversion en int64 ligne à ligne : somme exacte, sans erreur d'arrondi accumulée
+    centimes = np.rint(df[value_col].fillna(0).to_numpy(dtype=float) * 100).astype(np.int64)
+    return int(centimes.sum())
+
+
+def _mark_section_dirty(editor_key):
+    """
+    Callback des éditeurs de sections : signale une section modifiée par l'utilisateur
+    """
+    st.session_state[f"_dirty_{editor_key}"] = True
+
+
+def render_editable_section(storage_path, editor_key, total_label=None, value_col='value',
+                            column_config=_BILAN_COLUMN_CONFIG):
+    """
+    Affiche l'éditeur d'une liste d'enregistrements de la session.
+    storage_path est un chemin pointé dans session_state (ex. "actif_data.stocks").
+    Le total de la colonne value_col est enregistré en centimes dans st.session_state._section_totals.
+    """
+    # Résoudre le conteneur parent et la clé de la liste à éditer
+    *parents, leaf = storage_path.split('.')
+    container = st.session_state
+    for part in parents:
+        container = container[part]
+    records = container[leaf]
+    
+    # Au-delà du plafond, seules les premières lignes sont éditées ; le reste est conservé tel quel
+    overflow = records[_MAX_EDITOR_ROWS:]
+    if overflow:
+        st.warning(f"⚠️ Tableau volumineux : seules les {_MAX_EDITOR_ROWS} premières lignes sont affichées "
+                   f"({len(overflow)} lignes supplémentaires conservées et incluses dans le total).")
+    df_section = pd.DataFrame(records[:_MAX_EDITOR_ROWS])
+    
+    edited_df = st.data_editor(
+        df_section,
+        column_config=column_config,
+        hide_index=True,
+        num_rows="dynamic",
+        key=editor_key,
+        on_change=_mark_section_dirty,
+        args=(editor_key,)
+    )
+    
+    # Matérialiser les enregistrements seulement après une édition (drapeau posé par le callback)
+    if st.session_state.pop(f"_dirty_{editor_key}", False):
+        container[leaf] = edited_df.to_dict('records') + overflow
+        bump_session_data_version()
+    
+    total_section = _section_centimes(edited_df, value_col)
+    if overflow:
+        total_section += _section_centimes(pd.DataFrame(overflow), value_col)
+    if total_label:
+        st.markdown(f"**Total {total_label} : {total_section / 100:,.2f} DHS**")
+    
+    st.session_state.setdefault('_section_totals', {})[editor_key] = total_section
+
 
+@st.fragment
+def render_bilan_editors():
+    """
+    Éditeurs des sections du bilan, totaux généraux et contrôle d'équilibre (fragment isolé)
+    """
+    # Totaux des sections en centimes, alimentés par les éditeurs
+    totals = st.session_state.setdefault('_section_totals', {})
+    
     # Layout en colonnes
     col1, col2 = st.columns(2)
     
@@ -3981,27 +3192,7 @@ def show_balance_sheet():
             for section_key, section_title in sections_actif:
                 with st.container():
                     st.markdown(f"**{section_title}**")
-                    
-                    # Utiliser un data_editor pour une meilleure UX
-                    df_section = pd.DataFrame(st.session_state.actif_data[section_key])
-                    
-                    edited_df = st.data_editor(
-                        df_section,
-                        column_config={
-                            "label": "Libellé",
-                            "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-                        },
-                        hide_index=True,
-                        num_rows="dynamic",
-                        key=f"editor_actif_{section_key}"
-                    )
-                    
-                    # Mettre à jour les données de session
-                    st.session_state.actif_data[section_key] = edited_df.to_dict('records')
-                    
-                    # Calcul du total par section
-                    total_section = sum(item['value'] for item in st.session_state.actif_data[section_key])
-                    st.markdown(f"**Total {section_title} : {total_section:,.2f} DHS**")
+                    render_editable_section(f"actif_data.{section_key}", f"editor_actif_{section_key}", section_title)
             
             # ACTIF CIRCULANT
             st.subheader("ACTIF CIRCULANT")
@@ -4014,33 +3205,11 @@ def show_balance_sheet():
             for section_key, section_title in sections_circulant:
                 with st.container():
                     st.markdown(f"**{section_title}**")
-                    
-                    # Utiliser un data_editor pour cette section aussi
-                    df_section = pd.DataFrame(st.session_state.actif_data[section_key])
-                    
-                    edited_df = st.data_editor(
-                        df_section,
-                        column_config={
-                            "label": "Libellé",
-                            "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-                        },
-                        hide_index=True,
-                        num_rows="dynamic",
-                        key=f"editor_actif_{section_key}"
-                    )
-                    
-                    # Mettre à jour les données de session
-                    st.session_state.actif_data[section_key] = edited_df.to_dict('records')
-                    
-                    # Calcul du total par section
-                    total_section = sum(item['value'] for item in st.session_state.actif_data[section_key])
-                    st.markdown(f"**Total {section_title} : {total_section:,.2f} DHS**")
+                    render_editable_section(f"actif_data.{section_key}", f"editor_actif_{section_key}", section_title)
             
             # Calcul du total général actif
-            total_actif = sum(
-                sum(item['value'] for item in st.session_state.actif_data[section]) 
-                for section in st.session_state.actif_data
-            )
+            actif_centimes = sum(totals[f"editor_actif_{key}"] for key, _ in sections_actif + sections_circulant)
+            total_actif = actif_centimes / 100
             st.markdown(f"**TOTAL GENERAL ACTIF : {total_actif:,.2f} DHS**")
     
     # COLONNE PASSIF
@@ -4050,47 +3219,15 @@ def show_balance_sheet():
             st.subheader("CAPITAUX PROPRES")
             
             with st.container():
-                df_capitaux = pd.DataFrame(st.session_state.passif_data['capitaux_propres'])
-                
-                edited_df = st.data_editor(
-                    df_capitaux,
-                    column_config={
-                        "label": "Libellé",
-                        "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-                    },
-                    hide_index=True,
-                    num_rows="dynamic",
-                    key="editor_passif_capitaux"
-                )
-                
-                # Mettre à jour les données de session
-                st.session_state.passif_data['capitaux_propres'] = edited_df.to_dict('records')
-                
-                total_capitaux = sum(item['value'] for item in st.session_state.passif_data['capitaux_propres'])
-                st.markdown(f"**Total Capitaux propres : {total_capitaux:,.2f} DHS**")
+                render_editable_section("passif_data.capitaux_propres", "editor_passif_capitaux", "Capitaux propres")
+                total_capitaux = totals["editor_passif_capitaux"] / 100
             
             # DETTES DE FINANCEMENT
             st.subheader("DETTES DE FINANCEMENT")
             
             with st.container():
-                df_dettes = pd.DataFrame(st.session_state.passif_data['dettes_financement'])
-                
-                edited_df = st.data_editor(
-                    df_dettes,
-                    column_config={
-                        "label": "Libellé",
-                        "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-                    },
-                    hide_index=True,
-                    num_rows="dynamic",
-                    key="editor_passif_dettes"
-                )
-                
-                # Mettre à jour les données de session
-                st.session_state.passif_data['dettes_financement'] = edited_df.to_dict('records')
-                
-                total_dettes = sum(item['value'] for item in st.session_state.passif_data['dettes_financement'])
-                st.markdown(f"**Total Dettes financement : {total_dettes:,.2f} DHS**")
+                render_editable_section("passif_data.dettes_financement", "editor_passif_dettes", "Dettes financement")
+                total_dettes = totals["editor_passif_dettes"] / 100
             
             st.markdown(f"**TOTAL FINANCEMENT PERMANENT : {total_capitaux + total_dettes:,.2f} DHS**")
             
@@ -4098,62 +3235,190 @@ def show_balance_sheet():
             st.subheader("PASSIF CIRCULANT")
             
             with st.container():
-                df_circulant = pd.DataFrame(st.session_state.passif_data['passif_circulant'])
-                
-                edited_df = st.data_editor(
-                    df_circulant,
-                    column_config={
-                        "label": "Libellé",
-                        "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-                    },
-                    hide_index=True,
-                    num_rows="dynamic",
-                    key="editor_passif_circulant"
-                )
-                
-                # Mettre à jour les données de session
-                st.session_state.passif_data['passif_circulant'] = edited_df.to_dict('records')
-                
-                total_circulant = sum(item['value'] for item in st.session_state.passif_data['passif_circulant'])
-                st.markdown(f"**Total Passif circulant : {total_circulant:,.2f} DHS**")
+                render_editable_section("passif_data.passif_circulant", "editor_passif_circulant", "Passif circulant")
+                total_circulant = totals["editor_passif_circulant"] / 100
             
             # TRÉSORERIE-PASSIF
             st.subheader("TRÉSORERIE-PASSIF")
             
             with st.container():
-                df_tresorerie = pd.DataFrame(st.session_state.passif_data['tresorerie_passif'])
-                
-                edited_df = st.data_editor(
-                    df_tresorerie,
-                    column_config={
-                        "label": "Libellé",
-                        "value": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-                    },
-                    hide_index=True,
-                    num_rows="dynamic",
-                    key="editor_passif_tresorerie"
-                )
-                
-                # Mettre à jour les données de session
-                st.session_state.passif_data['tresorerie_passif'] = edited_df.to_dict('records')
-                
-                total_tresorerie = sum(item['value'] for item in st.session_state.passif_data['tresorerie_passif'])
-                st.markdown(f"**Total Trésorerie-passif : {total_tresorerie:,.2f} DHS**")
+                render_editable_section("passif_data.tresorerie_passif", "editor_passif_tresorerie", "Trésorerie-passif")
+                total_tresorerie = totals["editor_passif_tresorerie"] / 100
             
             # Calcul du total général passif
-            total_passif = total_capitaux + total_dettes + total_circulant + total_tresorerie
+            passif_centimes = sum(totals[f"editor_passif_{key}"]
+                                  for key in ('capitaux', 'dettes', 'circulant', 'tresorerie'))
+            total_passif = passif_centimes / 100
             st.markdown(f"**TOTAL GENERAL PASSIF : {total_passif:,.2f} DHS**")
 
-            # Vérification équilibre bilan
-            st.session_state.calculated_data['total_actif'] = total_actif
-            st.session_state.calculated_data['total_passif'] = total_passif
-            
-            if abs(total_actif - total_passif) > 0.01:
-                st.error(f"⚠️ Déséquilibre bilan : Actif ({total_actif:,.2f}) ≠ Passif ({total_passif:,.2f})")
-            else:
-                st.success("✓ Bilan équilibré")
+            # Vérification équilibre bilan
+            st.session_state.calculated_data['total_actif'] = total_actif
+            st.session_state.calculated_data['total_passif'] = total_passif
+            
+            # Totaux entiers : égalité exacte
+            if actif_centimes != passif_centimes:
+                st.error(f"⚠️ Déséquilibre bilan : Actif ({total_actif:,.2f}) ≠ Passif ({total_passif:,.2f})")
+            else:
+                st.success("✓ Bilan équilibré")
+
+
+def show_balance_sheet():
+    st.header("Bilan d'Ouverture")
+    
+    # Alias locaux des données de session (une seule résolution via le proxy)
+    ss = st.session_state
+    actif = ss.actif_data
+    passif = ss.passif_data
+    inv = ss.investment_data
+    
+    # Mettre à jour les valeurs importantes avec les données des autres onglets,
+    # uniquement lorsque ces données ont changé depuis la dernière synchronisation
+    # (réécrire la session à chaque rendu désynchronise les éditeurs)
+    needs_sync = False
+    if 'calculated_data' in ss:
+        calc = ss.calculated_data
+        sync_values = (
+            calc.get('total_frais', 5700.0),
+            inv.get('web_dev', 80000.0),
+            inv.get('cash_contribution', 50511.31), inv.get('in_kind', 20000.0),
+            calc.get('total_subsidies', 0.0),
+            calc.get('total_credits', 0.0),
+        )
+        # Conteneurs comparés par identité (références conservées) : un projet chargé
+        # remplace actif_data/passif_data et doit toujours être resynchronisé
+        last_actif, last_passif, last_values = ss.get('_bilan_sync_state', (None, None, None))
+        needs_sync = last_actif is not actif or last_passif is not passif or last_values != sync_values
+    if needs_sync:
+        ss._bilan_sync_state = (actif, passif, sync_values)
+        
+        # Frais préliminaires
+        if len(actif['immobilisations_non_valeur']) > 0:
+            actif['immobilisations_non_valeur'][0]['value'] = calc.get('total_frais', 5700.0)
+        
+        # Immobilisations incorporelles (système d'information)
+        if len(actif['immobilisations_incorporelles']) > 2:
+            actif['immobilisations_incorporelles'][2]['value'] = inv.get('web_dev', 80000.0)
+        
+        # Apports (capital social)
+        total_apports = inv.get('cash_contribution', 50511.31) + inv.get('in_kind', 20000.0)
+        if len(passif['capitaux_propres']) > 0:
+            passif['capitaux_propres'][0]['value'] = total_apports
+        
+        # Subventions
+        if len(passif['capitaux_propres']) > 2:
+            passif['capitaux_propres'][2]['value'] = calc.get('total_subsidies', 0.0)
+        
+        # Dettes de financement
+        if len(passif['dettes_financement']) > 0:
+            passif['dettes_financement'][0]['value'] = calc.get('total_credits', 0.0)
+
+    # Fonctions pour gérer les lignes
+    def add_line(category, section, default_label="Nouvelle ligne", default_value=0.0):
+        if category == 'actif':
+            actif[section].append({'label': default_label, 'value': default_value})
+        else:
+            passif[section].append({'label': default_label, 'value': default_value})
+
+    def remove_line(category, section, index):
+        if category == 'actif':
+            actif[section].pop(index)
+        else:
+            passif[section].pop(index)
+
+    # Éditeurs et totaux dans un même fragment : une édition ne relance que ce bloc
+    render_bilan_editors()
+
+# ========== COMPTE DE RÉSULTAT ==========
+# Formats des colonnes monétaires du compte de résultat (constants d'un rendu à l'autre)
+_INCOME_COLUMN_CONFIG = {
+    col: st.column_config.NumberColumn(col, format="%.2f DHS")
+    for col in ("Chiffre d'affaires", "Charges d'exploitation", "Résultat d'exploitation",
+                "Charges financières", "Résultat avant impôt", "Impôt sur les sociétés", "Résultat net")
+}
+
+
+@st.cache_data(show_spinner=False)
+def _annual_interest(credits_key):
+    """
+    Intérêts annuels simplifiés (capital × taux) des crédits (montant, taux %, durée) valides
+    """
+    arr = np.asarray(credits_key, dtype=float).reshape(-1, 3)
+    valid = (arr > 0).all(axis=1)
+    if not valid.any():
+        return 3350.0  # Valeur par défaut
+    return float((arr[valid, 0] * arr[valid, 1] / 100).sum())
+
+
+@st.cache_data(show_spinner=False)
+def _build_ca_line(years, ca_projections, growth_n, growth_n1):
+    """
+    Graphique d'évolution du CA, mis en cache sur les valeurs projetées
+    """
+    fig = px.line(x=list(years), y=list(ca_projections),
+                 title=f"Projection du Chiffre d'Affaires<br><sup>Croissance: N→N+1 {growth_n:.1%} | N+1→N+2 {growth_n1:.1%}</sup>",
+                 labels={'x': "Année", 'y': "Chiffre d'affaires"},
+                 markers=True)
+    fig.update_layout(
+        yaxis_title="DHS",
+        hovermode="x unified",
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0.05)',
+        font_color='white',
+        yaxis=dict(
+            gridcolor='rgba(255,255,255,0.1)',
+            zerolinecolor='rgba(255,255,255,0.2)'
+        )
+    )
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def _build_results_bar(years, operating_results, net_results):
+    """
+    Graphique des résultats d'exploitation et nets, mis en cache sur les valeurs projetées
+    """
+    # Format long construit directement (sans pd.melt)
+    plot_data = pd.DataFrame({
+        "Année": list(years) * 2,
+        "Indicateur": ["Résultat d'exploitation"] * len(years) + ["Résultat net"] * len(years),
+        "Montant": list(operating_results) + list(net_results)
+    })
+    
+    fig = px.bar(
+        plot_data,
+        x="Année",
+        y="Montant",
+        color="Indicateur",
+        barmode='group',
+        title="Analyse des Résultats",
+        labels={"Montant": "DHS"},
+        color_discrete_map={
+            "Résultat d'exploitation": "#36A2EB",
+            "Résultat net": "#4BC0C0"
+        }
+    )
+    
+    # Amélioration des paramètres visuels du graphique
+    fig.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0.05)',
+        font_color='white',
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="center",
+            x=0.5,
+            bgcolor='rgba(0,0,0,0.2)'
+        ),
+        yaxis=dict(
+            gridcolor='rgba(255,255,255,0.1)',
+            zerolinecolor='rgba(255,255,255,0.2)'
+        )
+    )
+    return fig
+
 
-# ========== COMPTE DE RÉSULTAT ==========
 def show_income_statement():
     st.header("📊 Compte de Résultat Prévisionnel Dynamique")
 
@@ -4214,47 +3479,45 @@ def show_income_statement():
             format="%.3f"
         )
 
-    # Calcul des projections
+    # Calcul des projections (une seule chaîne NumPy sur les 3 années)
+    # float64 explicite : en float32 (~7 chiffres), un CA de quelques millions perd déjà les centimes
     years = ["N", "N+1", "N+2"]
-    ca_projections = [
-        st.session_state.income_statement_params['base_ca'],
-        st.session_state.income_statement_params['base_ca'] * (1 + st.session_state.income_statement_params['growth_n']),
-        st.session_state.income_statement_params['base_ca'] * (1 + st.session_state.income_statement_params['growth_n']) * (1 + st.session_state.income_statement_params['growth_n1'])
-    ]
+    params = st.session_state.income_statement_params
+    growth = np.array([0.0, params['growth_n'], params['growth_n1']], dtype=np.float64)
+    ca_arr = params['base_ca'] * np.cumprod(1 + growth)
     
     # Calcul des charges avec amélioration progressive
-    charge_ratios = [
-        st.session_state.income_statement_params['cost_ratio'] * (1 - st.session_state.income_statement_params['efficiency_improvement'])**i 
-        for i in range(3)
-    ]
-    charge_projections = [ca * ratio for ca, ratio in zip(ca_projections, charge_ratios)]
+    charge_ratios = params['cost_ratio'] * (1 - params['efficiency_improvement']) ** np.arange(len(years), dtype=np.float64)
+    charge_arr = ca_arr * charge_ratios
 
     # Calcul des charges financières
     def calculate_financial_charges():
-        charges = []
+        # Clé immuable (montant, taux, durée) : le calcul n'est refait que si un crédit change
+        credits_key = []
         for credit in st.session_state.get("credits", []):
             try:
-                principal = float(credit.get("Montant", 0))
-                rate = float(credit.get("Taux", 5)) / 100  # Convertir le taux en décimal
-                term = int(credit.get("Durée", 1))
-                
-                if principal > 0 and rate > 0 and term > 0:
-                    # Calcul simplifié des intérêts annuels
-                    annual_interest = principal * rate
-                    charges.append(annual_interest)
+                credits_key.append((float(credit.get("Montant", 0)), float(credit.get("Taux", 5)), int(credit.get("Durée", 1))))
             except (ValueError, TypeError, KeyError):
                 continue  # Ignorer les crédits avec données invalides
         
-        return sum(charges) if charges else 3350.0  # Valeur par défaut
+        return _annual_interest(tuple(credits_key))
 
     financial_charges = calculate_financial_charges()
     
     # Calcul des résultats
-    operating_results = [ca - ch for ca, ch in zip(ca_projections, charge_projections)]
-    pretax_results = [op - financial_charges for op in operating_results]
+    operating_arr = ca_arr - charge_arr
+    pretax_arr = operating_arr - financial_charges
     tax_rate = 0.15  # Taux d'IS
-    taxes = [max(0, pr * tax_rate) for pr in pretax_results]  # Évite impôts négatifs
-    net_results = [pr - tax for pr, tax in zip(pretax_results, taxes)]
+    taxes_arr = np.clip(pretax_arr * tax_rate, 0, None)  # Évite impôts négatifs
+    net_arr = pretax_arr - taxes_arr
+    
+    # Listes Python pour l'affichage et la session (sérialisables)
+    ca_projections = ca_arr.tolist()
+    charge_projections = charge_arr.tolist()
+    operating_results = operating_arr.tolist()
+    pretax_results = pretax_arr.tolist()
+    taxes = taxes_arr.tolist()
+    net_results = net_arr.tolist()
 
     # Création du DataFrame
     df = pd.DataFrame({
@@ -4278,155 +3541,25 @@ def show_income_statement():
         "Résultat net": net_results
     }
 
-    # Affichage des résultats - PARTIE AMÉLIORÉE POUR LA LISIBILITÉ
+    # Affichage des résultats - tableau natif, formatage par column_config
     with st.expander("📋 Détails des Résultats", expanded=True):
-        # Définir des formats personnalisés pour les nombres
-        formats = {
-            "Chiffre d'affaires": "{:,.2f} DHS",
-            "Charges d'exploitation": "{:,.2f} DHS",
-            "Résultat d'exploitation": "{:,.2f} DHS",
-            "Charges financières": "{:,.2f} DHS",
-            "Résultat avant impôt": "{:,.2f} DHS",
-            "Impôt sur les sociétés": "{:,.2f} DHS",
-            "Résultat net": "{:,.2f} DHS"
-        }
+        # Formats monétaires appliqués côté client (pas de Styler ni de HTML injecté)
+        st.dataframe(df, column_config=_INCOME_COLUMN_CONFIG, hide_index=True, use_container_width=True)
         
-        # Fonction pour colorer les valeurs négatives avec un contraste adapté au fond sombre
-        def color_negative_values(val):
-            if isinstance(val, (int, float)):
-                color = '#FF6B6B' if val < 0 else '#E8FFEA'  # Rouge clair pour négatif, blanc verdâtre pour positif
-                return f'color: {color}; font-weight: bold'
-            return ''
-        
-        # Style amélioré avec meilleur contraste et formatage
-        styled_df = df.style \
-            .format(formats) \
-            .applymap(color_negative_values, subset=pd.IndexSlice[:, df.columns[2:]]) \
-            .set_properties(**{
-                'text-align': 'right',
-                'font-size': '15px',
-                'border': '1px solid #3A3F44',
-                'padding': '8px',
-                'background-color': '#1E2227',
-                'white-space': 'nowrap'  # Empêche le retour à la ligne dans les cellules
-            }) \
-            .set_table_styles([
-                {'selector': 'th', 
-                 'props': [
-                    ('font-size', '16px'),
-                    ('text-align', 'center'),
-                    ('background-color', '#2A313B'),
-                    ('color', 'white'),
-                    ('font-weight', 'bold'),
-                    ('padding', '10px'),
-                    ('border', '1px solid #3A3F44')
-                ]},
-                {'selector': 'tbody tr:nth-of-type(odd)',
-                 'props': [('background-color', '#1A1D22')]},
-                {'selector': 'tbody tr:hover',
-                 'props': [('background-color', '#323842')]},
-                {'selector': '.col0', 
-                 'props': [('font-weight', 'bold'), ('text-align', 'center')]},  # Style pour la colonne Année
-            ]) \
-            .background_gradient(cmap='Greens', subset=["Chiffre d'affaires"], vmin=min(ca_projections), vmax=max(ca_projections)*1.1) \
-            .background_gradient(cmap='Blues', subset=["Résultat net"], vmin=min(net_results), vmax=max(net_results)*1.1)
-        
-        # On utilise HTML brut plutôt que st.dataframe pour un meilleur contrôle de l'apparence
-        html_table = styled_df.to_html()
-        
-        # Ajout de styles CSS supplémentaires pour améliorer la lisibilité
-        st.markdown("""
-        <style>
-        table.dataframe {
-            width: 100%;
-            border-collapse: collapse;
-            margin-bottom: 20px;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-        }
-        table.dataframe th {
-            position: sticky;
-            top: 0;
-            z-index: 10;
-            box-shadow: 0 2px 2px -1px rgba(0, 0, 0, 0.4);
-        }
-        table.dataframe td, table.dataframe th {
-            border: 1px solid #3A3F44;
-            padding: 8px 10px;
-        }
-        /* Améliorer le contraste pour les valeurs négatives */
-        .negative {
-            color: #FF6B6B !important;
-            font-weight: bold;
-        }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Afficher le tableau avec style amélioré
-        st.write(html_table, unsafe_allow_html=True)
+        # Signaler les résultats négatifs (auparavant colorés en rouge dans le tableau)
+        negative_years = [year for year, net in zip(years, net_results) if net < 0]
+        if negative_years:
+            st.caption(f"🔴 Résultat net négatif : {', '.join(negative_years)}")
 
     # Visualisations
     tab1, tab2 = st.tabs(["Évolution du CA", "Analyse des Résultats"])
     
     with tab1:
-        fig = px.line(df, x="Année", y="Chiffre d'affaires",
-                     title=f"Projection du Chiffre d'Affaires<br><sup>Croissance: N→N+1 {st.session_state.income_statement_params['growth_n']:.1%} | N+1→N+2 {st.session_state.income_statement_params['growth_n1']:.1%}</sup>",
-                     markers=True)
-        fig.update_layout(
-            yaxis_title="DHS",
-            hovermode="x unified",
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0.05)',
-            font_color='white',
-            yaxis=dict(
-                gridcolor='rgba(255,255,255,0.1)',
-                zerolinecolor='rgba(255,255,255,0.2)'
-            )
-        )
+        fig = _build_ca_line(tuple(years), tuple(ca_projections), params['growth_n'], params['growth_n1'])
         st.plotly_chart(fig, use_container_width=True)
     
     with tab2:
-        # Transformer les données pour un meilleur affichage avec Plotly
-        plot_data = pd.melt(
-            df, 
-            id_vars=["Année"], 
-            value_vars=["Résultat d'exploitation", "Résultat net"],
-            var_name="Indicateur",
-            value_name="Montant"
-        )
-        
-        fig = px.bar(
-            plot_data,
-            x="Année",
-            y="Montant",
-            color="Indicateur",
-            barmode='group',
-            title="Analyse des Résultats",
-            labels={"Montant": "DHS"},
-            color_discrete_map={
-                "Résultat d'exploitation": "#36A2EB",
-                "Résultat net": "#4BC0C0"
-            }
-        )
-        
-        # Amélioration des paramètres visuels du graphique
-        fig.update_layout(
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0.05)',
-            font_color='white',
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="center",
-                x=0.5,
-                bgcolor='rgba(0,0,0,0.2)'
-            ),
-            yaxis=dict(
-                gridcolor='rgba(255,255,255,0.1)',
-                zerolinecolor='rgba(255,255,255,0.2)'
-            )
-        )
-        
+        fig = _build_results_bar(tuple(years), tuple(operating_results), tuple(net_results))
         st.plotly_chart(fig, use_container_width=True)
 
     # Indicateurs Clés
@@ -4448,79 +3581,118 @@ def show_income_statement():
     # Export des données
     st.download_button(
         label="💾 Exporter en Excel",
-        data=df.to_csv(index=False, sep=";", decimal=",").encode('utf-8'),
+        data=_csv_bytes(df, sep=";", decimal=","),
         file_name="compte_resultat_previsionnel.csv",
         mime="text/csv",
         help="Exportez les données au format CSV pour Excel"
     )
 # ========== CASH FLOW ==========
+# Configuration de colonnes de l'éditeur des frais préliminaires
+_FRAIS_COLUMN_CONFIG = {
+    "nom": "Description",
+    "valeur": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
+}
+
+
+@lru_cache(maxsize=64)
+def _number_formats(numeric_cols):
+    """
+    Formats d'affichage des colonnes numériques (mis en cache par tuple de colonnes)
+    """
+    return {col: "{:,.2f}" for col in numeric_cols}
+
+
+def safe_format_df(df):
+    """Formatage sécurisé des DataFrames"""
+    numeric_cols = tuple(df.select_dtypes(include=[np.number]).columns)
+    styled = df.style.format(_number_formats(numeric_cols))
+    return styled
+
+
+@st.fragment
+def render_flux_details(details):
+    """
+    Tableaux de flux par catégorie, mis en forme seulement lorsqu'ils sont affichés.
+    Fragment : afficher ou masquer les détails ne relance pas toute la page.
+    """
+    if not st.checkbox("🔍 Détails par catégorie", key="show_flux_details"):
+        return
+    
+    tabs = st.tabs(list(details))
+    for tab, flux_df in zip(tabs, details.values()):
+        with tab:
+            st.dataframe(safe_format_df(flux_df), use_container_width=True)
+
+
+@st.cache_data(show_spinner=False)
+def _build_flux_area(flux_df):
+    """
+    Graphique de la trésorerie cumulée, mis en cache sur les flux
+    """
+    return px.area(flux_df, x="Année", y="Flux Cumulés", title="Évolution de la trésorerie")
+
+
 def show_cash_flow():
     st.header("💰 Tableau de Flux de Trésorerie")
 
+    # Alias locaux des données de session (une seule résolution via le proxy)
+    ss = st.session_state
+    params = ss.cash_flow_params
+    inv = ss.investment_data
+    calc = ss.calculated_data
+
     # Section 1: Configuration
     with st.expander("⚙️ Paramètres généraux", expanded=True):
         col1, col2 = st.columns(2)
         with col1:
-            st.session_state.cash_flow_params['taux_actualisation'] = st.number_input(
+            params['taux_actualisation'] = st.number_input(
                 "Taux d'actualisation (%)", 
-                value=float(st.session_state.cash_flow_params['taux_actualisation'] * 100), 
+                value=float(params['taux_actualisation'] * 100), 
                 min_value=0.0, 
                 max_value=20.0, 
                 step=0.5
             ) / 100
         with col2:
-            st.session_state.cash_flow_params['annees_projection'] = st.number_input(
+            params['annees_projection'] = st.number_input(
                 "Nombre d'années à projeter", 
-                value=st.session_state.cash_flow_params['annees_projection'], 
+                value=params['annees_projection'], 
                 min_value=1, 
                 max_value=5
             )
 
     # Section 2: Frais préliminaires
     with st.expander("📝 Frais préliminaires", expanded=True):
-        # Utiliser un data_editor pour tous les frais préliminaires
-        df_frais = pd.DataFrame(st.session_state.frais_preliminaires)
-        
-        edited_df_frais = st.data_editor(
-            df_frais,
-            column_config={
-                "nom": "Description",
-                "valeur": st.column_config.NumberColumn("Montant (DHS)", format="%.2f")
-            },
-            hide_index=True,
-            num_rows="dynamic",
-            key="editor_frais_prelim"
-        )
+        # Éditeur partagé avec le bilan (écriture après édition seulement) ; une édition
+        # relance la page, les flux en aval dépendant du total
+        render_editable_section("frais_preliminaires", "editor_frais_prelim", value_col="valeur",
+                                column_config=_FRAIS_COLUMN_CONFIG)
         
-        # Mettre à jour les données de session
-        st.session_state.frais_preliminaires = edited_df_frais.to_dict('records')
-        
-        total_frais = edited_df_frais["valeur"].sum()
+        total_frais = ss._section_totals["editor_frais_prelim"] / 100
         st.metric("Total Frais Préliminaires", f"{total_frais:,.2f} DHS")
 
         # Synchroniser avec les valeurs de la page Investissements
         if total_frais > 0:
-            st.session_state.calculated_data['total_frais'] = total_frais
+            calc['total_frais'] = total_frais
 
     # Section 3: Investissements
     with st.expander("🏗️ Investissements initiaux", expanded=True):
         systeme_info = st.number_input(
             "Coût du système d'information (DHS)", 
-            value=st.session_state.investment_data['web_dev'], 
+            value=inv['web_dev'], 
             min_value=0.0, 
             step=1000.0
         )
-        st.session_state.investment_data['web_dev'] = systeme_info
+        inv['web_dev'] = systeme_info
         
-        total_immos = st.session_state.calculated_data.get('total_immos', 0.0)
+        total_immos = calc.get('total_immos', 0.0)
         st.metric("Total Immobilisations", f"{total_immos:,.2f} DHS")
 
     # Section 4: Financement
     with st.expander("💵 Financement", expanded=True):
-        cash_contrib = st.session_state.investment_data.get('cash_contribution', 50511.31)
-        in_kind = st.session_state.investment_data.get('in_kind', 20000.0)
-        subventions = st.session_state.calculated_data.get('total_subsidies', 0.0)
-        emprunts = st.session_state.calculated_data.get('total_credits', 0.0)
+        cash_contrib = inv.get('cash_contribution', 50511.31)
+        in_kind = inv.get('in_kind', 20000.0)
+        subventions = calc.get('total_subsidies', 0.0)
+        emprunts = calc.get('total_credits', 0.0)
         
         cols = st.columns(4)
         cols[0].metric("Apport numéraire", f"{cash_contrib:,.2f} DHS")
@@ -4529,7 +3701,7 @@ def show_cash_flow():
         cols[3].metric("Emprunts", f"{emprunts:,.2f} DHS")
 
     # Section 5: Calcul des flux
-    years = ["N"] + [f"N+{i+1}" for i in range(st.session_state.cash_flow_params['annees_projection'])]
+    years = ["N"] + [f"N+{i+1}" for i in range(params['annees_projection'])]
     
     # Fonction de conversion sécurisée en float
     def safe_float_convert(x):
@@ -4538,126 +3710,185 @@ def show_cash_flow():
         except (ValueError, TypeError):
             return 0.0
 
+    # Conversion numérique vectorisée (valeurs invalides ramenées à 0)
+    def to_float_array(values):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+    # Flux de l'année N uniquement (années suivantes à 0), alloués en une fois
+    flux_initiaux = np.zeros((len(years), 6))
+    flux_initiaux[0] = to_float_array([-total_frais, -total_immos, -systeme_info,
+                                       cash_contrib + in_kind, subventions, emprunts])
+
     flux_investissement = pd.DataFrame({
         "Année": years,
-        "Frais préliminaires": [safe_float_convert(-total_frais)] + [0.0] * st.session_state.cash_flow_params['annees_projection'],
-        "Immobilisations": [safe_float_convert(-total_immos)] + [0.0] * st.session_state.cash_flow_params['annees_projection'],
-        "Système d'info": [safe_float_convert(-systeme_info)] + [0.0] * st.session_state.cash_flow_params['annees_projection']
+        "Frais préliminaires": flux_initiaux[:, 0],
+        "Immobilisations": flux_initiaux[:, 1],
+        "Système d'info": flux_initiaux[:, 2]
     })
 
     flux_financement = pd.DataFrame({
         "Année": years,
-        "Apports": [safe_float_convert(cash_contrib + in_kind)] + [0.0] * st.session_state.cash_flow_params['annees_projection'],
-        "Subventions": [safe_float_convert(subventions)] + [0.0] * st.session_state.cash_flow_params['annees_projection'],
-        "Emprunts": [safe_float_convert(emprunts)] + [0.0] * st.session_state.cash_flow_params['annees_projection']
+        "Apports": flux_initiaux[:, 3],
+        "Subventions": flux_initiaux[:, 4],
+        "Emprunts": flux_initiaux[:, 5]
     })
 
     # Utiliser les données du compte de résultat si disponibles
-    if 'income_statement' in st.session_state:
-        ca = st.session_state.income_statement.get("Chiffre d'affaires", [])
-        charges = st.session_state.income_statement.get("Charges d'exploitation", [])
-        
-        # S'assurer que les listes ont la bonne longueur
-        while len(ca) < len(years):
-            last_value = ca[-1] if ca else 150000
-            growth = st.session_state.income_statement_params.get('growth_n1', 0.2)
-            ca.append(last_value * (1 + growth))
-        
-        while len(charges) < len(years):
-            last_value = charges[-1] if charges else 120000
-            efficiency = st.session_state.income_statement_params.get('efficiency_improvement', 0.02)
-            charges.append(last_value * (1 - efficiency))
-        
-        # Tronquer si nécessaire
-        ca = ca[:len(years)]
-        charges = charges[:len(years)]
+    if 'income_statement' in ss:
+        n_years = len(years)
+        
+        # Ajuster une série à len(years) : troncature, puis progression géométrique pré-allouée
+        def fit_series(values, default_last, factor):
+            values = np.asarray(values, dtype=float)[:n_years]
+            out = np.empty(n_years)
+            n_known = len(values)
+            out[:n_known] = values
+            if n_known < n_years:
+                last_value = values[-1] if n_known else default_last
+                out[n_known:] = last_value * factor ** np.arange(1, n_years - n_known + 1)
+            return out
+        
+        growth = ss.income_statement_params.get('growth_n1', 0.2)
+        efficiency = ss.income_statement_params.get('efficiency_improvement', 0.02)
+        ca_arr = fit_series(to_float_array(ss.income_statement.get("Chiffre d'affaires", [])), 150000, 1 + growth)
+        charges_arr = fit_series(to_float_array(ss.income_statement.get("Charges d'exploitation", [])),
+                                 120000, 1 - efficiency)
     else:
-        ca = [safe_float_convert(150000 * (1.2**i)) for i in range(len(years))]
-        charges = [safe_float_convert(ca[i] * 0.8 * (0.98**i)) for i in range(len(years))]
+        # Projection par défaut, vectorisée sur l'ensemble des années
+        years_idx = np.arange(len(years))
+        ca_arr = 150000 * 1.2 ** years_idx
+        charges_arr = ca_arr * 0.8 * 0.98 ** years_idx
 
     # Calculer les amortissements sur 5 ans pour les immobilisations et le système d'info
     amort_annual = (total_immos + systeme_info) / 5
-    amortissements = [safe_float_convert(amort_annual)] * len(years)
+    amortissements = np.full(len(years), safe_float_convert(amort_annual))
     
     flux_exploitation = pd.DataFrame({
         "Année": years,
-        "CA": ca,
-        "Charges (hors amort.)": [safe_float_convert(ch - amort) for ch, amort in zip(charges, amortissements)],
-        "Amortissements": [safe_float_convert(amort) for amort in amortissements],
-        "IS": [safe_float_convert(-max(0, (ca[i] - charges[i])) * 0.15) for i in range(len(years))]
+        "CA": ca_arr,
+        "Charges (hors amort.)": charges_arr - amortissements,
+        "Amortissements": amortissements,
+        "IS": -np.maximum(0, ca_arr - charges_arr) * 0.15
     })
 
-    # Fusion des données
-    df = pd.DataFrame({"Année": years})
-    df["Investissements"] = flux_investissement.drop("Année", axis=1).sum(axis=1)
-    df["Financement"] = flux_financement.drop("Année", axis=1).sum(axis=1)
-    df["Exploitation"] = flux_exploitation.drop("Année", axis=1).sum(axis=1)
-    df["Flux Nets"] = df["Investissements"] + df["Financement"] + df["Exploitation"]
-    df["Flux Cumulés"] = df["Flux Nets"].cumsum()
-    df["Flux Actualisés"] = df["Flux Nets"] / (1 + st.session_state.cash_flow_params['taux_actualisation'])**np.arange(len(years))
+    # Fusion des données : sommes par ligne directement sur les tableaux NumPy
+    flux_invest_tot = flux_initiaux[:, :3].sum(axis=1)
+    flux_fin_tot = flux_initiaux[:, 3:].sum(axis=1)
+    flux_exploit_tot = flux_exploitation.iloc[:, 1:].to_numpy(dtype=float).sum(axis=1)
+    flux_nets = flux_invest_tot + flux_fin_tot + flux_exploit_tot
+    
+    # Facteurs d'actualisation par produit cumulé (multiplications au lieu de puissances)
+    disc = np.empty(len(years))
+    disc[0] = 1.0
+    disc[1:] = 1 / (1 + params['taux_actualisation'])
+    np.cumprod(disc, out=disc)
+    
+    df = pd.DataFrame({
+        "Année": years,
+        "Investissements": flux_invest_tot,
+        "Financement": flux_fin_tot,
+        "Exploitation": flux_exploit_tot,
+        "Flux Nets": flux_nets,
+        "Flux Cumulés": np.cumsum(flux_nets),
+        "Flux Actualisés": flux_nets * disc
+    })
     
     # Section 6: Affichage avec formatage sécurisé
     st.subheader("📊 Synthèse des flux de trésorerie")
     
-    def safe_format_df(df):
-        """Formatage sécurisé des DataFrames"""
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        styled = df.style.format({col: "{:,.2f}" for col in numeric_cols})
-        return styled
-    
     st.dataframe(safe_format_df(df), use_container_width=True)
     
     # Visualisation
-    fig = px.area(df, x="Année", y="Flux Cumulés", title="Évolution de la trésorerie")
+    fig = _build_flux_area(df[["Année", "Flux Cumulés"]])
     st.plotly_chart(fig, use_container_width=True)
     
     # Indicateurs
     st.subheader("📈 Indicateurs clés")
-    van = safe_float_convert(df["Flux Actualisés"].sum())
+    van = float(flux_nets @ disc)
     try:
         # Supprimer le premier flux si nécessaire pour le calcul du TRI
         flux_tri = df["Flux Nets"].values
         if len(flux_tri) > 1:  # S'assurer qu'il y a assez de flux
-            tri = safe_float_convert(npf.irr(flux_tri)) * 100
+            tri = float(_irr_newton(np.asarray(flux_tri, dtype=np.float64)))
+            # Newton part de 10 % : s'il diverge (TRI éloigné), recours à la recherche de racines de npf
+            if np.isnan(tri):
+                tri = safe_float_convert(npf.irr(flux_tri))
+            tri *= 100
         else:
             tri = 0.0
     except:
         tri = 0.0
     
-    # Trouver l'année de retour sur investissement
-    try:
-        payback_year = next((i for i, val in enumerate(df['Flux Cumulés']) if val >= 0), None)
-        if payback_year is not None:
-            payback = f"{years[payback_year]}"
-        else:
-            payback = "Non atteint"
-    except:
-        payback = "Non calculé"
+    # Trouver l'année de retour sur investissement (premier cumul positif)
+    recovered = df["Flux Cumulés"].to_numpy() >= 0
+    payback = years[int(recovered.argmax())] if recovered.any() else "Non atteint"
     
     cols = st.columns(3)
     cols[0].metric("VAN", f"{van:,.2f} DHS")
     cols[1].metric("TRI", f"{tri:.1f}%")
     cols[2].metric("Délai de récupération", payback)
 
-    # Détails par catégorie
-    with st.expander("🔍 Détails par catégorie"):
-        tab1, tab2, tab3 = st.tabs(["Investissements", "Financement", "Exploitation"])
-        with tab1:
-            st.dataframe(safe_format_df(flux_investissement), use_container_width=True)
-        with tab2:
-            st.dataframe(safe_format_df(flux_financement), use_container_width=True)
-        with tab3:
-            st.dataframe(safe_format_df(flux_exploitation), use_container_width=True)
+    # Détails par catégorie (repliés par défaut : aucune mise en forme tant qu'ils sont masqués)
+    render_flux_details({
+        "Investissements": flux_investissement,
+        "Financement": flux_financement,
+        "Exploitation": flux_exploitation
+    })
     
     # Export
     st.download_button(
         "📤 Exporter en CSV", 
-        df.to_csv(index=False), 
+        _csv_bytes(df), 
         "flux_tresorerie.csv",
         help="Télécharger le tableau de flux en format CSV"
     )
 
 # ========== AMORTISSEMENTS (suite) ==========
+# Formats des colonnes monétaires de l'échéancier de crédit (détail et résumé annuel),
+# avec séparateurs de milliers et deux décimales
+_SCHEDULE_COLUMN_CONFIG = {
+    col: st.column_config.NumberColumn(col, format="accounting")
+    for col in ["Paiement", "Capital", "Intérêts", "Solde", "Solde fin d'année"]
+}
+
+
+@st.cache_data(show_spinner=False)
+def _build_capital_interest_bar(chart_source, x_col, title, barmode):
+    """
+    Graphique de répartition Capital/Intérêts, mis en cache sur l'échéancier affiché
+    """
+    chart_data = chart_source.melt(
+        id_vars=[x_col], 
+        value_vars=["Capital", "Intérêts"],
+        var_name="Type",
+        value_name="Montant"
+    )
+    return px.bar(
+        chart_data,
+        x=x_col,
+        y="Montant",
+        color="Type",
+        title=title,
+        barmode=barmode
+    )
+
+
+@st.cache_data(show_spinner=False)
+def _build_balance_line(balance_df):
+    """
+    Graphique du solde restant dû, mis en cache sur l'échéancier
+    """
+    fig = px.line(
+        balance_df,
+        x="Période",
+        y="Solde",
+        title="Évolution du solde restant dû",
+        markers=True
+    )
+    fig.update_layout(yaxis_title="Solde (DHS)")
+    return fig
+
+
 def show_amortization():
     st.header("Tableau d'Amortissement du Crédit")
     
@@ -4714,42 +3945,31 @@ def show_amortization():
             if grace_period > 0:
                 st.info(f"Pendant la période de grâce de {grace_period} mois, seuls les intérêts sont payés.")
             
-            payment = principal * (periodic_rate * (1 + periodic_rate)**(periods)) / ((1 + periodic_rate)**(periods) - 1)
-            
-            schedule = []
-            balance = principal
-            total_interest = 0
+            # Facteurs (1+r)^k, k = 0..n, par produit cumulé : une seule table pour l'échéance et l'échéancier
+            growth = np.empty(periods + 1)
+            growth[0] = 1.0
+            growth[1:] = 1 + periodic_rate
+            np.cumprod(growth, out=growth)
+            payment = principal * periodic_rate * growth[-1] / (growth[-1] - 1)
             
-            # Période de grâce (intérêts seulement)
-            for month in range(1, grace_period + 1):
-                interest = balance * (rate / 12)  # Intérêts mensuels durant la grâce
-                total_interest += interest
-                schedule.append([
-                    month, 
-                    interest,  # Paiement = intérêts seulement
-                    0.0,       # Pas d'amortissement du principal
-                    interest,  # Intérêts
-                    balance    # Solde inchangé
-                ])
+            # Période de grâce (intérêts seulement) : intérêts mensuels, solde inchangé
+            grace_interest = principal * (rate / 12)
             
-            # Remboursement normal après la période de grâce
-            for period in range(periods):
-                month = grace_period + 1 + period
-                interest = balance * periodic_rate
-                principal_payment = payment - interest
-                balance -= principal_payment
-                total_interest += interest
-                
-                schedule.append([
-                    month,
-                    payment,
-                    principal_payment,
-                    interest,
-                    max(0.0, balance)
-                ])
+            # Remboursement normal : solde après k échéances en forme fermée
+            # B_k = P(1+r)^k - A((1+r)^k - 1)/r
+            balances = principal * growth - payment * (growth - 1) / periodic_rate
+            interest_arr = balances[:-1] * periodic_rate
+            capital_arr = payment - interest_arr
+            total_interest = grace_period * grace_interest + interest_arr.sum()
             
             # Création du DataFrame
-            df = pd.DataFrame(schedule, columns=["Période", "Paiement", "Capital", "Intérêts", "Solde"])
+            df = pd.DataFrame({
+                "Période": np.arange(1, grace_period + periods + 1),
+                "Paiement": np.concatenate([np.full(grace_period, grace_interest), np.full(periods, payment)]),
+                "Capital": np.concatenate([np.zeros(grace_period), capital_arr]),
+                "Intérêts": np.concatenate([np.full(grace_period, grace_interest), interest_arr]),
+                "Solde": np.concatenate([np.full(grace_period, principal), np.maximum(0.0, balances[1:])])
+            })
             
             # Ajout de colonnes supplémentaires pour l'année et le trimestre
             if frequency == "Mensuelle":
@@ -4774,22 +3994,23 @@ def show_amortization():
             )
             
             if display_options == "Résumé annuel" and frequency == "Mensuelle":
-                # Créer un résumé annuel
-                annual_summary = df.groupby("Année").agg({
-                    "Paiement": "sum",
-                    "Capital": "sum",
-                    "Intérêts": "sum"
-                }).reset_index()
+                # Créer un résumé annuel : 12 périodes par année, somme par blocs (dernière année complétée par des zéros)
+                n_years = -(-len(df) // 12)
+                monthly = np.zeros((n_years * 12, 3))
+                monthly[:len(df)] = df[["Paiement", "Capital", "Intérêts"]].to_numpy()
+                annual = monthly.reshape(n_years, 12, 3).sum(axis=1)
                 
-                annual_summary["Solde fin d'année"] = principal - annual_summary["Capital"].cumsum()
+                annual_summary = pd.DataFrame({
+                    "Année": np.arange(1, n_years + 1),
+                    "Paiement": annual[:, 0],
+                    "Capital": annual[:, 1],
+                    "Intérêts": annual[:, 2],
+                    "Solde fin d'année": principal - np.cumsum(annual[:, 1])
+                })
                 
                 st.dataframe(
-                    annual_summary.style.format({
-                        "Paiement": "{:,.2f}",
-                        "Capital": "{:,.2f}",
-                        "Intérêts": "{:,.2f}",
-                        "Solde fin d'année": "{:,.2f}"
-                    }),
+                    annual_summary,
+                    column_config=_SCHEDULE_COLUMN_CONFIG,
                     use_container_width=True
                 )
             else:
@@ -4797,12 +4018,8 @@ def show_amortization():
                 rows_to_show = st.slider("Nombre de périodes à afficher", 12, len(df), 12)
                 
                 st.dataframe(
-                    df.head(rows_to_show).style.format({
-                        "Paiement": "{:,.2f}",
-                        "Capital": "{:,.2f}",
-                        "Intérêts": "{:,.2f}",
-                        "Solde": "{:,.2f}"
-                    }),
+                    df.head(rows_to_show),
+                    column_config=_SCHEDULE_COLUMN_CONFIG,
                     use_container_width=True
                 )
             
@@ -4812,59 +4029,89 @@ def show_amortization():
             
             with tab1:
                 if frequency == "Mensuelle" and display_options == "Résumé annuel":
-                    chart_data = annual_summary.melt(
-                        id_vars=["Année"], 
-                        value_vars=["Capital", "Intérêts"],
-                        var_name="Type",
-                        value_name="Montant"
-                    )
-                    fig = px.bar(
-                        chart_data,
-                        x="Année",
-                        y="Montant",
-                        color="Type",
-                        title="Répartition annuelle Capital/Intérêts",
-                        barmode="group"
+                    fig = _build_capital_interest_bar(
+                        annual_summary[["Année", "Capital", "Intérêts"]],
+                        "Année",
+                        "Répartition annuelle Capital/Intérêts",
+                        "group"
                     )
                 else:
                     periods_to_chart = min(60, len(df))  # Limiter à 60 périodes pour la lisibilité
-                    chart_data = df.head(periods_to_chart).melt(
-                        id_vars=["Période"], 
-                        value_vars=["Capital", "Intérêts"],
-                        var_name="Type",
-                        value_name="Montant"
-                    )
-                    fig = px.bar(
-                        chart_data,
-                        x="Période",
-                        y="Montant",
-                        color="Type",
-                        title=f"Répartition {frequency.lower()} Capital/Intérêts",
-                        barmode="stack"
+                    fig = _build_capital_interest_bar(
+                        df.head(periods_to_chart)[["Période", "Capital", "Intérêts"]],
+                        "Période",
+                        f"Répartition {frequency.lower()} Capital/Intérêts",
+                        "stack"
                     )
                 
                 st.plotly_chart(fig, use_container_width=True)
             
             with tab2:
-                fig = px.line(
-                    df,
-                    x="Période",
-                    y="Solde",
-                    title="Évolution du solde restant dû",
-                    markers=True
-                )
-                fig.update_layout(yaxis_title="Solde (DHS)")
+                fig = _build_balance_line(df[["Période", "Solde"]])
                 st.plotly_chart(fig, use_container_width=True)
 
             # Export des données
             st.download_button(
                 label="💾 Exporter en Excel",
-                data=df.to_csv(index=False, sep=";").encode('utf-8'),
+                data=_csv_bytes(df, sep=";"),
                 file_name=f"tableau_amortissement_{selected_credit['Nom']}.csv",
                 mime="text/csv",
                 help="Exportez les données au format CSV pour Excel"
             )
 
+# Catégories d'immobilisations corporelles : motif unique (alternation) par catégorie, testés dans l'ordre
+_CORPORELLES_PATTERNS = (
+    ("Terrain / Local", re.compile("terrain|local")),
+    ("Construction / Aménagement", re.compile("constru|aménag|amenage")),
+    ("Matériel d'équipement", re.compile("équip|equip|techn")),
+    ("Mobilier & matériel de bureau", re.compile("mobil|bureau")),
+    ("Matériel de transport & manutension", re.compile("transport|manut"))
+)
+
+
+@st.cache_data(show_spinner=False)
+def _build_immobilisations_pie(immobilisations, amounts):
+    """
+    Répartition des immobilisations par montant, mise en cache sur les montants
+    """
+    fig = px.pie(
+        names=list(immobilisations),
+        values=list(amounts),
+        title="Répartition des Immobilisations par Montant",
+        # Paramètres supplémentaires pour améliorer la visibilité sur fond sombre
+        color_discrete_sequence=_PALETTE_SET2  # Palette plus visible
+    )
+    fig.update_traces(textposition='inside', textinfo='percent+label', textfont_color='white')
+    fig.update_layout(**_DARK_LAYOUT)
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def _build_amortization_evolution_bar(yearly_df, years):
+    """
+    Évolution des amortissements par année, mise en cache sur le tableau annuel
+    """
+    # Transformer pour Plotly
+    yearly_df_melted = yearly_df.melt(id_vars=['Année'], var_name='Immobilisation', value_name='Amortissement')
+    
+    fig = px.bar(
+        yearly_df_melted,
+        x='Année',
+        y='Amortissement',
+        color='Immobilisation',
+        title="Évolution des Amortissements par Année",
+        labels={'Amortissement': 'Montant (DHS)'},
+        # Paramètres supplémentaires pour améliorer la visibilité sur fond sombre
+        color_discrete_sequence=_PALETTE_BOLD  # Palette vive
+    )
+    fig.update_layout(
+        barmode='stack', 
+        xaxis={'categoryorder': 'array', 'categoryarray': list(years)},
+        **_DARK_LAYOUT
+    )
+    return fig
+
+
 def show_detailed_amortization():
     st.header("📊 Tableau d'Amortissement des Immobilisations")
     
@@ -4883,6 +4130,7 @@ def show_detailed_amortization():
                 st.session_state.detailed_amortization[i]["amortization_n"] = 0.0
                 st.session_state.detailed_amortization[i]["amortization_n1"] = 0.0
                 st.session_state.detailed_amortization[i]["amortization_n2"] = 0.0
+            bump_session_data_version()
             st.success("✅ Tableau d'amortissement réinitialisé")
         
         # Mode debug optionnel
@@ -4927,14 +4175,18 @@ def show_detailed_amortization():
                         categories_to_reset.append(category)
                         debug_info.append(f"Catégorie à réinitialiser: {category}")
             
-            for i, item in enumerate(st.session_state.detailed_amortization):
-                if item["name"] in categories_to_reset:
-                    old_value = st.session_state.detailed_amortization[i]["amount"]
+            # Index nom → ligne du tableau d'amortissement (recherche directe au lieu de parcours)
+            amort_by_name = {item["name"]: item for item in st.session_state.detailed_amortization}
+            
+            for name in categories_to_reset:
+                item = amort_by_name.get(name)
+                if item is not None:
+                    old_value = item["amount"]
                     if old_value > 0:
-                        st.session_state.detailed_amortization[i]["amount"] = 0.0
-                        st.session_state.detailed_amortization[i]["amortization_n"] = 0.0
-                        st.session_state.detailed_amortization[i]["amortization_n1"] = 0.0
-                        st.session_state.detailed_amortization[i]["amortization_n2"] = 0.0
+                        item["amount"] = 0.0
+                        item["amortization_n"] = 0.0
+                        item["amortization_n1"] = 0.0
+                        item["amortization_n2"] = 0.0
                         debug_info.append(f"RÉINITIALISÉ: {item['name']} de {old_value:.2f} à 0")
             
             # ÉTAPE 4: Collecter les valeurs pour les sections non vides
@@ -4975,29 +4227,15 @@ def show_detailed_amortization():
                     
                     label = item['label'].lower()
                     value = item['value']
-                    categorized = False
                     
-                    # Essayer de catégoriser selon le nom
-                    if "terrain" in label or "local" in label:
-                        categorized_values["Terrain / Local"] += value
-                        categorized = True
-                    elif "constru" in label or "aménag" in label or "amenage" in label:
-                        categorized_values["Construction / Aménagement"] += value
-                        categorized = True
-                    elif "équip" in label or "equip" in label or "techn" in label:
-                        categorized_values["Matériel d'équipement"] += value
-                        categorized = True
-                    elif "mobil" in label or "bureau" in label:
-                        categorized_values["Mobilier & matériel de bureau"] += value
-                        categorized = True
-                    elif "transport" in label or "manut" in label:
-                        categorized_values["Matériel de transport & manutension"] += value
-                        categorized = True
+                    # Essayer de catégoriser selon le nom (première catégorie dont le motif correspond)
+                    category = next((cat for cat, pattern in _CORPORELLES_PATTERNS if pattern.search(label)), None)
+                    if category is not None:
+                        categorized_values[category] += value
                     else:
                         # Si pas de correspondance, considérer comme "Construction / Aménagement"
                         categorized_values["Construction / Aménagement"] += value
                         debug_info.append(f"Élément non catégorisé '{item['label']}' ({value:.2f}) ajouté à Construction/Aménagement")
-                        categorized = True
                 
                 # Vérifier si on a réussi à catégoriser les immobilisations
                 categorized_total = sum(categorized_values.values())
@@ -5020,23 +4258,21 @@ def show_detailed_amortization():
             
             # ÉTAPE 5: Mettre à jour le tableau d'amortissement avec les valeurs collectées
             updates_made = 0
-            for i, item in enumerate(st.session_state.detailed_amortization):
-                amort_name = item["name"]
-                if amort_name in item_values:
-                    new_amount = item_values[amort_name]
-                    old_amount = st.session_state.detailed_amortization[i]["amount"]
+            for amort_name, new_amount in item_values.items():
+                item = amort_by_name.get(amort_name)
+                if item is not None:
+                    old_amount = item["amount"]
                     
                     # Mettre à jour uniquement si la valeur a changé significativement
                     if abs(new_amount - old_amount) > 0.01:
-                        st.session_state.detailed_amortization[i]["amount"] = new_amount
+                        item["amount"] = new_amount
                         
                         # Recalculer les amortissements si la durée est positive
-                        if st.session_state.detailed_amortization[i]["duration"] > 0:
-                            rate = st.session_state.detailed_amortization[i]["rate"] / 100
-                            annual_amort = new_amount * rate
-                            st.session_state.detailed_amortization[i]["amortization_n"] = annual_amort
-                            st.session_state.detailed_amortization[i]["amortization_n1"] = annual_amort
-                            st.session_state.detailed_amortization[i]["amortization_n2"] = annual_amort
+                        if item["duration"] > 0:
+                            annual_amort = new_amount * (item["rate"] / 100)
+                            item["amortization_n"] = annual_amort
+                            item["amortization_n1"] = annual_amort
+                            item["amortization_n2"] = annual_amort
                         
                         updates_made += 1
                         debug_info.append(f"Mise à jour de {amort_name}: {old_amount:.2f} → {new_amount:.2f}")
@@ -5101,101 +4337,53 @@ def show_detailed_amortization():
     columns.extend(years)
     columns.extend(["TOTAL", "VNA"])
     
-    # Préparer les données
-    data = []
-    total_row = [""] * len(columns)
-    total_row[0] = "TOTAL"
-    
-    # Initialiser les totaux par colonne
-    for i in range(4, len(columns)):
-        total_row[i] = 0
-    
-    for item in st.session_state.detailed_amortization:
-        row = [
-            item["name"],
-            item["amount"],
-            item["duration"],
-            f"{item['rate']}%"
-        ]
-        
-        # Ajouter les amortissements pour les années N, N+1, N+2
-        row.append(item["amortization_n"])
-        row.append(item["amortization_n1"])
-        row.append(item["amortization_n2"])
-        
-        # Calculer les amortissements pour les années supplémentaires
-        annual_amort = item["amount"] * (item["rate"] / 100) if item["duration"] > 0 else 0
-        for i in range(3, years_to_display):
-            if i < item["duration"]:
-                row.append(annual_amort)
-            else:
-                row.append(0)
-        
-        # Calculer le total des amortissements
-        total_amort = min(item["duration"], years_to_display) * annual_amort
-        row.append(total_amort)
-        
-        # Calculer la Valeur Nette d'Amortissement (VNA)
-        vna = item["amount"] - total_amort
-        row.append(vna)
-        
-        data.append(row)
-        
-        # Mettre à jour les totaux
-        for i in range(4, len(columns)):
-            if isinstance(total_row[i], (int, float)) and isinstance(row[i], (int, float)):
-                total_row[i] += row[i]
-    
-    # Ajouter la ligne des totaux
-    data.append(total_row)
+    # Préparer les données : colonnes descriptives d'un côté, colonnes numériques de l'autre
+    amort_items = st.session_state.detailed_amortization
+    text_rows = [
+        [item["name"], item["amount"], item["duration"], item["rate"]]
+        for item in amort_items
+    ]
+    amount_arr = np.array([item["amount"] for item in amort_items], dtype=np.float64)
+    rate_arr = np.array([item["rate"] for item in amort_items], dtype=np.float64) / 100
+    duration_arr = np.array([item["duration"] for item in amort_items], dtype=np.float64)
+    annual_col = np.where(duration_arr > 0, amount_arr * rate_arr, 0.0)
+    
+    # Amortissements des années N, N+1, N+2 (saisis), puis des années supplémentaires :
+    # annuité tant que l'année est dans la durée (masque 2-D par diffusion)
+    first_years = np.array(
+        [[item["amortization_n"], item["amortization_n1"], item["amortization_n2"]] for item in amort_items],
+        dtype=np.float64
+    ).reshape(len(amort_items), 3)
+    extra_years = (np.arange(3, years_to_display)[None, :] < duration_arr[:, None]) * annual_col[:, None]
+    year_arr = np.hstack([first_years, extra_years])
+    
+    # Total des amortissements et Valeur Nette d'Amortissement (VNA), sur toutes les lignes à la fois
+    total_amort = np.minimum(duration_arr, years_to_display) * annual_col
+    vna = amount_arr - total_amort
+    body = np.column_stack([year_arr, total_amort, vna])
+    
+    # Ligne des totaux : une seule réduction par colonne
+    text_rows.append(["TOTAL", None, None, None])
+    body = np.vstack([body, body.sum(axis=0)])
     
     # Créer le DataFrame
-    df = pd.DataFrame(data, columns=columns)
-    
-    # Fonction pour styliser le tableau
-    def style_amortization_table(df):
-        # Créer un formatage sécurisé qui vérifie le type avant d'appliquer le format
-        formatter = {}
-        for col in df.columns:
-            if col not in ["Immobilisation", "Taux", "Durée (année)"]:
-                formatter[col] = lambda x: "{:,.2f} MAD".format(x) if isinstance(x, (int, float)) else str(x)
-        
-        styler = df.style.format(formatter)
-        
-        # Appliquer un style spécifique à l'en-tête avec couleurs adaptées au mode sombre
-        styler = styler.set_table_styles([
-            {'selector': 'thead th', 'props': [('background-color', '#1e3a8a'), ('color', 'white'), ('font-weight', 'bold')]},
-        ])
-        
-        # Utiliser des couleurs plus sombres mais contrastées pour les lignes alternées
-        even_rows = list(range(0, len(df), 2))
-        odd_rows = list(range(1, len(df), 2))
-        
-        # Lignes paires - couleur plus foncée mais visible
-        styler = styler.set_properties(subset=pd.IndexSlice[even_rows, :], 
-                                    **{'background-color': '#2d3748', 'color': 'white'})
-        
-        # Lignes impaires - couleur légèrement différente pour le contraste
-        styler = styler.set_properties(subset=pd.IndexSlice[odd_rows, :], 
-                                    **{'background-color': '#1f2937', 'color': 'white'})
-        
-        # Mettre en évidence la ligne des totaux avec une couleur plus vive
-        if len(df) > 0:
-            styler = styler.set_properties(subset=pd.IndexSlice[len(df)-1, :], 
-                                       **{'background-color': '#3b82f6', 'color': 'white', 'font-weight': 'bold'})
-        
-        # Mettre en évidence les valeurs négatives avec une couleur visible sur fond sombre
-        def color_negative(val):
-            if isinstance(val, (int, float)) and val < 0:
-                return 'color: #f87171'  # Rouge clair visible sur fond sombre
-            return ''
-        
-        styler = styler.applymap(color_negative)
-        
-        return styler
+    df = pd.concat([
+        pd.DataFrame(text_rows, columns=columns[:4]),
+        pd.DataFrame(body, columns=columns[4:])
+    ], axis=1)
+    
+    # Formats appliqués côté navigateur (pas de Styler à recalculer cellule par cellule) ;
+    # le format comptable garde les séparateurs de milliers, l'unité passe dans l'en-tête
+    amort_column_config = {
+        col: st.column_config.NumberColumn(f"{col} (MAD)", format="accounting")
+        for col in ["Montant à amortir"] + columns[4:]
+    }
+    amort_column_config["Durée (année)"] = st.column_config.NumberColumn("Durée (année)", format="%d")
+    amort_column_config["Taux"] = st.column_config.NumberColumn("Taux", format="%g%%")
     
-    # Afficher le tableau avec le style amélioré pour fond sombre
-    st.dataframe(style_amortization_table(df), use_container_width=True, height=400)
+    st.dataframe(df, column_config=amort_column_config, use_container_width=True, height=400)
+    if (body < 0).any():
+        st.caption("⚠️ Certaines valeurs sont négatives (VNA ou dotations) : vérifiez les durées et les taux.")
     
     # Visualisations
     st.subheader("Analyse des Amortissements")
@@ -5208,19 +4396,7 @@ def show_detailed_amortization():
         amounts = [item["amount"] for item in st.session_state.detailed_amortization if item["amount"] > 0]
         
         if amounts:  # Vérification pour éviter les erreurs avec graphique vide
-            fig = px.pie(
-                names=immobilisations,
-                values=amounts,
-                title="Répartition des Immobilisations par Montant",
-                # Paramètres supplémentaires pour améliorer la visibilité sur fond sombre
-                color_discrete_sequence=px.colors.qualitative.Set2  # Palette plus visible
-            )
-            fig.update_traces(textposition='inside', textinfo='percent+label', textfont_color='white')
-            fig.update_layout(
-                paper_bgcolor='rgba(0,0,0,0)',  # Fond transparent
-                plot_bgcolor='rgba(0,0,0,0)',   # Fond transparent
-                font_color='white'              # Texte blanc
-            )
+            fig = _build_immobilisations_pie(tuple(immobilisations), tuple(amounts))
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Aucune immobilisation à afficher dans le graphique.")
@@ -5231,48 +4407,18 @@ def show_detailed_amortization():
             'Année': years,
         }
         
-        has_data = False
-        for item in st.session_state.detailed_amortization:
-            if item["amount"] > 0:
-                has_data = True
-                yearly_amort = []
-                yearly_amort.append(item["amortization_n"])
-                yearly_amort.append(item["amortization_n1"])
-                yearly_amort.append(item["amortization_n2"])
-                
-                annual_amort = item["amount"] * (item["rate"] / 100) if item["duration"] > 0 else 0
-                for i in range(3, years_to_display):
-                    if i < item["duration"]:
-                        yearly_amort.append(annual_amort)
-                    else:
-                        yearly_amort.append(0)
-                
-                yearly_data[item["name"]] = yearly_amort
+        # Lignes du tableau déjà calculées (year_arr), pour les immobilisations non nulles
+        has_data = bool((amount_arr > 0).any())
+        yearly_data.update({
+            item["name"]: year_arr[i]
+            for i, item in enumerate(amort_items) if item["amount"] > 0
+        })
         
         if has_data:
             # Créer le DataFrame pour le graphique
             yearly_df = pd.DataFrame(yearly_data)
             
-            # Transformer pour Plotly
-            yearly_df_melted = yearly_df.melt(id_vars=['Année'], var_name='Immobilisation', value_name='Amortissement')
-            
-            fig = px.bar(
-                yearly_df_melted,
-                x='Année',
-                y='Amortissement',
-                color='Immobilisation',
-                title="Évolution des Amortissements par Année",
-                labels={'Amortissement': 'Montant (DHS)'},
-                # Paramètres supplémentaires pour améliorer la visibilité sur fond sombre
-                color_discrete_sequence=px.colors.qualitative.Bold  # Palette vive
-            )
-            fig.update_layout(
-                barmode='stack', 
-                xaxis={'categoryorder': 'array', 'categoryarray': years},
-                paper_bgcolor='rgba(0,0,0,0)',  # Fond transparent
-                plot_bgcolor='rgba(0,0,0,0)',   # Fond transparent
-                font_color='white'              # Texte blanc
-            )
+            fig = _build_amortization_evolution_bar(yearly_df, tuple(years))
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Aucune donnée à afficher dans le graphique d'évolution.")
@@ -5282,22 +4428,25 @@ def show_detailed_amortization():
     
     col1, col2, col3 = st.columns(3)
     
-    total_investment = sum(item["amount"] for item in st.session_state.detailed_amortization)
+    # Réductions sur les tableaux déjà construits pour l'affichage
+    total_investment = float(amount_arr.sum())
     with col1:
         st.metric("Total des Immobilisations", f"{total_investment:,.2f} DHS")
     
     with col2:
-        total_annual_amort = sum(item["amortization_n"] for item in st.session_state.detailed_amortization)
+        total_annual_amort = float(first_years[:, 0].sum())
         st.metric("Dotation Annuelle aux Amortissements", f"{total_annual_amort:,.2f} DHS")
     
     with col3:
-        avg_duration = sum(item["amount"] * item["duration"] for item in st.session_state.detailed_amortization if item["amount"] > 0) / total_investment if total_investment > 0 else 0
+        # Durée moyenne pondérée par les montants positifs : un seul produit scalaire
+        weighted_duration = float(np.where(amount_arr > 0, amount_arr, 0.0) @ duration_arr)
+        avg_duration = weighted_duration / total_investment if total_investment > 0 else 0
         st.metric("Durée Moyenne d'Amortissement", f"{avg_duration:.1f} ans")
     
     # Export des données
     st.download_button(
         "💾 Exporter le tableau d'amortissement",
-        data=df.to_csv(index=False).encode('utf-8'),
+        data=_csv_bytes(df),
         file_name="tableau_amortissement_immobilisations.csv",
         mime="text/csv",
         help="Télécharger le tableau au format CSV"
@@ -5487,15 +4636,14 @@ def show_monthly_cashflow():
     # Créer le DataFrame avec le nombre correct de colonnes
     df = pd.DataFrame(data, columns=columns)
     
+    # Colonnes des mois numériques (cellules vides → NaN) : formatage par colonne, sans test par cellule
+    value_cols = columns[1:]
+    df[value_cols] = df[value_cols].apply(pd.to_numeric, errors="coerce")
+    
     # Styliser le tableau - Adapté pour le thème sombre
     def style_cashflow_table(df):
-        # Créer un style par défaut avec format de nombre sécurisé
-        formatter = {}
-        for col in df.columns:
-            if col != "ELEMENTS":
-                formatter[col] = lambda x: "{:,.2f}".format(x) if isinstance(x, (int, float)) else str(x)
-        
-        styler = df.style.format(formatter)
+        # Format appliqué aux colonnes numériques entières (cellules vides laissées vides)
+        styler = df.style.format("{:,.2f}", subset=value_cols, na_rep="")
         
         # Style adapté au mode sombre
         styler = styler.set_table_styles([
@@ -5522,13 +4670,8 @@ def show_monthly_cashflow():
             styler = styler.set_properties(subset=pd.IndexSlice[row, :], 
                                          **{'background-color': '#3b82f6', 'color': 'white', 'font-weight': 'bold'})
         
-        # Colorer les valeurs négatives
-        def color_negative(val):
-            if isinstance(val, (int, float)) and val < 0:
-                return 'color: #f87171'  # Rouge clair pour les valeurs négatives
-            return ''
-        
-        styler = styler.applymap(color_negative)
+        # Colorer les valeurs négatives (rouge clair), colonne par colonne
+        styler = styler.apply(lambda col: np.where(col < 0, 'color: #f87171', ''), subset=value_cols)
         
         return styler
     
@@ -5549,9 +4692,7 @@ def show_monthly_cashflow():
         xaxis_title="Mois",
         yaxis_title="Solde (DHS)",
         hovermode="x unified",
-        paper_bgcolor='rgba(0,0,0,0)',  # Fond transparent
-        plot_bgcolor='rgba(0,0,0,0)',   # Fond transparent
-        font_color='white'              # Texte blanc pour meilleure lisibilité
+        **_DARK_LAYOUT
     )
     st.plotly_chart(fig, use_container_width=True)
     
@@ -5583,7 +4724,7 @@ def show_monthly_cashflow():
     # Export des données
     st.download_button(
         "💾 Exporter ce tableau",
-        data=df.to_csv(index=False).encode('utf-8'),
+        data=_csv_bytes(df),
         file_name="tableau_tresorerie_mensuel.csv",
         mime="text/csv",
         help="Télécharger le tableau au format CSV"
@@ -5755,15 +4896,14 @@ def show_vat_budget():
     # Créer le DataFrame
     df = pd.DataFrame(data, columns=columns)
     
+    # Colonnes des mois numériques (cellules vides → NaN) : formatage par colonne, sans test par cellule
+    value_cols = columns[1:]
+    df[value_cols] = df[value_cols].apply(pd.to_numeric, errors="coerce")
+    
     # Styliser le tableau - AMÉLIORÉ pour meilleure lisibilité sur fond sombre
     def style_vat_table(df):
-        # Créer un style par défaut avec format de nombre sécurisé
-        formatter = {}
-        for col in df.columns:
-            if col != "ELEMENTS":
-                formatter[col] = lambda x: "{:,.2f}".format(x) if isinstance(x, (int, float)) else str(x)
-        
-        styler = df.style.format(formatter)
+        # Format appliqué aux colonnes numériques entières (cellules vides laissées vides)
+        styler = df.style.format("{:,.2f}", subset=value_cols, na_rep="")
         
         # Couleurs améliorées pour meilleure lisibilité sur fond sombre
         header_color = '#1e3a8a'  # Bleu marine foncé pour en-têtes
@@ -5803,13 +4943,8 @@ def show_vat_budget():
             styler = styler.set_properties(subset=pd.IndexSlice[tva_nette_row, :], 
                                         **{'background-color': highlight_color, 'font-weight': 'bold'})
         
-        # Colorer les valeurs négatives en rouge clair (lisible sur fond sombre)
-        def color_negative(val):
-            if isinstance(val, (int, float)) and val < 0:
-                return 'color: #f87171'  # Rouge clair
-            return ''
-        
-        styler = styler.applymap(color_negative)
+        # Colorer les valeurs négatives en rouge clair (lisible sur fond sombre), colonne par colonne
+        styler = styler.apply(lambda col: np.where(col < 0, 'color: #f87171', ''), subset=value_cols)
         
         return styler
     
@@ -5839,9 +4974,7 @@ def show_vat_budget():
             yaxis_title="Montant (DHS)",
             hovermode="x unified",
             legend_title="Composants TVA",
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            font_color='white'
+            **_DARK_LAYOUT
         )
         st.plotly_chart(fig, use_container_width=True)
     
@@ -5879,7 +5012,7 @@ def show_vat_budget():
                     names=labels,
                     values=values,
                     title=f"Répartition des composants de la TVA - Mois {selected_month}",
-                    color_discrete_sequence=px.colors.qualitative.Bold  # Couleurs plus vives
+                    color_discrete_sequence=_PALETTE_BOLD  # Couleurs plus vives
                 )
                 
                 # Mise à jour des traces sans dépendre de fig.data[0].text
@@ -5892,9 +5025,7 @@ def show_vat_budget():
                 
                 fig.update_layout(
                     legend=dict(orientation="h", yanchor="bottom", y=0),
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font_color='white'
+                    **_DARK_LAYOUT
                 )
                 
                 st.plotly_chart(fig, use_container_width=True)
@@ -5945,16 +5076,13 @@ def show_vat_budget():
     # Export des données
     st.download_button(
         "💾 Exporter le budget TVA",
-        data=df.to_csv(index=False).encode('utf-8'),
+        data=_csv_bytes(df),
         file_name="budget_tva.csv",
         mime="text/csv",
         help="Télécharger le tableau au format CSV"
     )
 
 
-
-# Ignorer les avertissements de dépréciation
-warnings.filterwarnings('ignore')
 def calculate_financial_metrics(df):
     """
     Calcule des métriques financières avancées à partir du DataFrame d'importation
@@ -5981,22 +5109,23 @@ def calculate_financial_metrics(df):
     }
     
     try:
-        # Calculer les montants totaux par catégorie avec sécurité contre les None/NaN
-        if 'type' in df.columns and 'montant' in df.columns:
-            # Filtrer les valeurs NaN/None
-            valid_df = df.dropna(subset=['montant'])
-            
-            # Calculer les totaux par type
-            total_immobilisations = valid_df[valid_df['type'] == 'immobilisation']['montant'].sum()
-            total_financements = valid_df[valid_df['type'] == 'financement']['montant'].sum()
-            total_charges_mensuelles = valid_df[valid_df['type'] == 'charges']['montant'].sum()
-            total_ventes_mensuelles = valid_df[valid_df['type'] == 'ventes']['montant'].sum()
-            
-            # Remplacer NaN par 0
-            metrics['total_immobilisations'] = float(total_immobilisations) if not pd.isna(total_immobilisations) else 0
-            metrics['total_financements'] = float(total_financements) if not pd.isna(total_financements) else 0
-            metrics['total_charges'] = float(total_charges_mensuelles) if not pd.isna(total_charges_mensuelles) else 0
-            metrics['total_ventes'] = float(total_ventes_mensuelles) if not pd.isna(total_ventes_mensuelles) else 0
+        # Masques de type et montants calculés une seule fois, réutilisés par toutes les réductions
+        has_type = 'type' in df.columns
+        if has_type:
+            types = df['type'].to_numpy()
+            is_immo = types == 'immobilisation'
+            is_fin = types == 'financement'
+            is_ch = types == 'charges'
+            is_v = types == 'ventes'
+        # None/NaN comptent pour 0
+        montants = df['montant'].fillna(0).to_numpy(dtype=float) if 'montant' in df.columns else None
+        
+        # Calculer les montants totaux par catégorie
+        if has_type and montants is not None:
+            metrics['total_immobilisations'] = float(montants[is_immo].sum())
+            metrics['total_financements'] = float(montants[is_fin].sum())
+            metrics['total_charges'] = float(montants[is_ch].sum())
+            metrics['total_ventes'] = float(montants[is_v].sum())
         
         # Calcul du flux de trésorerie mensuel
         metrics['cash_flow_mensuel'] = metrics['total_ventes'] - metrics['total_charges']
@@ -6020,100 +5149,42 @@ def calculate_financial_metrics(df):
             metrics['payback_months'] = 0
             metrics['payback_years'] = 0
         
-        # Calcul de la VAN (Valeur Actuelle Nette) sur 5 ans avec un taux d'actualisation de 8%
-        if PYFINANCE_AVAILABLE:
-            try:
-                if metrics['cash_flow_mensuel'] > 0:
-                    # Créer un flux de trésorerie sur 60 mois (5 ans)
-                    cash_flows = [-metrics['total_immobilisations']] + [metrics['cash_flow_mensuel']] * 60
-                    
-                    # Taux d'actualisation mensuel (8% annuel)
-                    monthly_rate = 0.08 / 12
-                    
-                    # Calculer la VAN
-                    metrics['van'] = pf.npv(rate=monthly_rate, values=cash_flows)
-                    
-                    # Calculer le TRI
-                    try:
-                        metrics['tri'] = pf.irr(values=cash_flows) * 12  # Convertir le TRI mensuel en annuel
-                    except Exception as e:
-                        metrics['tri'] = None
-                else:
-                    metrics['van'] = -metrics['total_immobilisations']
-                    metrics['tri'] = None
-            except Exception as e:
-                # En cas d'erreur, définir la VAN et le TRI à des valeurs par défaut
-                metrics['van'] = 0
-                metrics['tri'] = None
+        # Calcul de la VAN (Valeur Actuelle Nette) et du TRI sur 5 ans avec un taux d'actualisation de 8%
+        if metrics['cash_flow_mensuel'] > 0:
+            # Flux de trésorerie sur 60 mois (5 ans), taux d'actualisation mensuel (8% annuel)
+            van, tri_mensuel = _npv_irr(
+                float(metrics['total_immobilisations']),
+                float(metrics['cash_flow_mensuel']),
+                0.08 / 12,
+                60
+            )
+            metrics['van'] = float(van)
+            # Convertir le TRI mensuel en annuel
+            metrics['tri'] = float(tri_mensuel) * 12 if not np.isnan(tri_mensuel) else None
         else:
-            # Version simplifiée de calcul si PyFinance n'est pas disponible
-            if metrics['cash_flow_mensuel'] > 0:
-                # Calcul simplifié de la VAN sur 5 ans
-                van = -metrics['total_immobilisations']
-                monthly_rate = 0.08 / 12
-                
-                for i in range(60):
-                    van += metrics['cash_flow_mensuel'] / ((1 + monthly_rate) ** (i + 1))
-                
-                metrics['van'] = van
-                metrics['tri'] = None  # TRI indisponible sans PyFinance
-            else:
-                metrics['van'] = -metrics['total_immobilisations']
-                metrics['tri'] = None
+            metrics['van'] = -metrics['total_immobilisations']
+            metrics['tri'] = None
         
         # Calculer l'amortissement total annuel
         annual_amort = 0
-        if 'type' in df.columns and all(col in df.columns for col in ['montant', 'taux_amort', 'duree_amort']):
-            for _, row in df[df['type'] == 'immobilisation'].iterrows():
-                # Utiliser 0 si les valeurs sont None ou NaN
-                montant = row['montant'] if pd.notna(row['montant']) else 0
-                taux_amort = row['taux_amort'] if pd.notna(row['taux_amort']) else 0
-                duree_amort = row['duree_amort'] if pd.notna(row['duree_amort']) else 0
-                
-                if duree_amort > 0:
-                    annual_amort += montant * (taux_amort / 100)
+        if has_type and montants is not None and all(col in df.columns for col in ['taux_amort', 'duree_amort']):
+            # Immobilisations avec une durée positive (None/NaN traités comme 0)
+            dur = df['duree_amort'].fillna(0).to_numpy(dtype=float)[is_immo]
+            taux = df['taux_amort'].fillna(0).to_numpy(dtype=float)[is_immo]
+            annual_amort = float((montants[is_immo] * (taux / 100.0) * (dur > 0)).sum())
         
         metrics['amortissement_annuel'] = annual_amort
         
-        # Calculer la TVA
-        try:
-            # TVA sur ventes
-            tva_collectee = 0
-            if 'type' in df.columns and 'taux_tva' in df.columns:
-                ventes_df = df[df['type'] == 'ventes']
-                for _, row in ventes_df.iterrows():
-                    montant = row['montant'] if pd.notna(row['montant']) else 0
-                    taux_tva = row['taux_tva'] if pd.notna(row['taux_tva']) else 0
-                    tva_collectee += montant * (taux_tva / 100)
+        # Calculer la TVA (colonnes numériques garanties par process_with_ai, valeurs par défaut à 0 sinon)
+        if has_type and {'montant', 'taux_tva'}.issubset(df.columns):
+            # TVA par type en produits scalaires sur les tableaux NumPy (NaN traités comme 0)
+            taux_tva = df['taux_tva'].fillna(0).to_numpy(dtype=np.float64)
             
-            # TVA sur achats
-            tva_deductible_achats = 0
-            if 'type' in df.columns and 'taux_tva' in df.columns:
-                charges_df = df[df['type'] == 'charges']
-                for _, row in charges_df.iterrows():
-                    montant = row['montant'] if pd.notna(row['montant']) else 0
-                    taux_tva = row['taux_tva'] if pd.notna(row['taux_tva']) else 0
-                    tva_deductible_achats += montant * (taux_tva / 100)
-            
-            # TVA sur immobilisations
-            tva_deductible_immo = 0
-            if 'type' in df.columns and 'taux_tva' in df.columns:
-                immo_df = df[df['type'] == 'immobilisation']
-                for _, row in immo_df.iterrows():
-                    montant = row['montant'] if pd.notna(row['montant']) else 0
-                    taux_tva = row['taux_tva'] if pd.notna(row['taux_tva']) else 0
-                    tva_deductible_immo += montant * (taux_tva / 100)
-            
-            metrics['tva_collectee'] = tva_collectee
-            metrics['tva_deductible_achats'] = tva_deductible_achats
-            metrics['tva_deductible_immo'] = tva_deductible_immo
-            metrics['tva_nette'] = tva_collectee - tva_deductible_achats - tva_deductible_immo
-        except Exception as e:
-            # En cas d'erreur, définir les valeurs de TVA par défaut
-            metrics['tva_collectee'] = 0
-            metrics['tva_deductible_achats'] = 0
-            metrics['tva_deductible_immo'] = 0
-            metrics['tva_nette'] = 0
+            metrics['tva_collectee'] = float(np.dot(montants[is_v], taux_tva[is_v]) * 0.01)  # TVA sur ventes
+            metrics['tva_deductible_achats'] = float(np.dot(montants[is_ch], taux_tva[is_ch]) * 0.01)  # TVA sur achats
+            metrics['tva_deductible_immo'] = float(np.dot(montants[is_immo], taux_tva[is_immo]) * 0.01)  # TVA sur immobilisations
+            metrics['tva_nette'] = (metrics['tva_collectee'] - metrics['tva_deductible_achats']
+                                    - metrics['tva_deductible_immo'])
     
     except Exception as e:
         # En cas d'erreur majeure, conserver les valeurs par défaut
@@ -6122,6 +5193,19 @@ def calculate_financial_metrics(df):
     return metrics
 
 
+# Alias de noms de colonnes pour déduire les colonnes attendues (testés dans l'ordre)
+_COL_ALIASES = (
+    ('type', ('type', 'catégorie', 'élément')),
+    ('categorie', ('catégorie', 'cat', 'groupe')),
+    ('nom', ('nom', 'designation', 'libellé', 'description')),
+    ('montant', ('montant', 'valeur', 'prix', 'somme', 'coût', 'cout')),
+    ('taux_tva', ('tva', 'taxe')),
+    ('duree_amort', ('durée', 'duree', 'période', 'periode', 'années')),
+    ('taux_amort', ('amort', 'pourcentage', 'taux')),
+    ('date', ('date', 'jour')),
+)
+
+
 def process_with_ai(df):
     """
     Fonction d'analyse qui traite automatiquement les données importées
@@ -6134,6 +5218,10 @@ def process_with_ai(df):
     # Initialiser le message de traitement
     processing_log = []
     
+    # Date courante évaluée une seule fois pour toutes les valeurs par défaut
+    now_ts = pd.Timestamp.now()
+    now_str = now_ts.strftime('%Y-%m-%d')
+    
     # Compter les lignes avant traitement
     initial_rows = len(df)
     processing_log.append(f"Fichier importé avec {initial_rows} entrées.")
@@ -6149,43 +5237,28 @@ def process_with_ai(df):
         processing_log.append(f"Colonnes manquantes détectées: {', '.join(missing_columns)}")
         processing_log.append("Tentative de déduction des colonnes à partir des données...")
         
-        # Copier le dataframe pour le retraiter
-        new_df = pd.DataFrame(columns=expected_columns)
-        
         # Essayer de correspondre les colonnes existantes avec les attendues
         column_mapping = {}
         for col in df.columns:
-            # Essayer de deviner la colonne en fonction du nom ou du contenu
+            # Essayer de deviner la colonne en fonction du nom (premier alias trouvé)
             col_lower = str(col).lower()
             
-            if any(x in col_lower for x in ['type', 'catégorie', 'élément']):
-                column_mapping[col] = 'type'
-            elif any(x in col_lower for x in ['catégorie', 'cat', 'groupe']):
-                column_mapping[col] = 'categorie'
-            elif any(x in col_lower for x in ['nom', 'designation', 'libellé', 'description']):
-                column_mapping[col] = 'nom'
-            elif any(x in col_lower for x in ['montant', 'valeur', 'prix', 'somme', 'coût', 'cout']):
-                column_mapping[col] = 'montant'
-            elif any(x in col_lower for x in ['tva', 'taxe']):
-                column_mapping[col] = 'taux_tva'
-            elif any(x in col_lower for x in ['durée', 'duree', 'période', 'periode', 'années']):
-                column_mapping[col] = 'duree_amort'
-            elif any(x in col_lower for x in ['amort', 'pourcentage', 'taux']):
-                column_mapping[col] = 'taux_amort'
-            elif any(x in col_lower for x in ['date', 'jour']):
-                column_mapping[col] = 'date'
-        
-        # Appliquer la correspondance
-        for old_col, new_col in column_mapping.items():
-            new_df[new_col] = df[old_col]
+            for target, keys in _COL_ALIASES:
+                if any(k in col_lower for k in keys):
+                    column_mapping[col] = target
+                    break
+        
+        # Appliquer la correspondance: les colonnes sont réunies dans un dictionnaire
+        # et le DataFrame est construit en une seule fois à la fin
+        data = {new_col: df[old_col] for old_col, new_col in column_mapping.items()}
         
         # Si certaines colonnes sont toujours manquantes, les créer avec des valeurs par défaut
         for col in expected_columns:
-            if col not in new_df.columns:
+            if col not in data:
                 if col == 'type':
                     # Essayer de déduire le type à partir des autres colonnes
-                    new_df[col] = 'autre'
-                    if 'categorie' in new_df.columns:
+                    data[col] = 'autre'
+                    if 'categorie' in data:
                         cat_to_type = {
                             'equipement': 'immobilisation',
                             'transport': 'immobilisation',
@@ -6201,67 +5274,57 @@ def process_with_ai(df):
                             'produit': 'ventes',
                             'service': 'ventes'
                         }
-                        new_df[col] = new_df['categorie'].apply(
-                            lambda x: next((v for k, v in cat_to_type.items() 
-                                          if k in str(x).lower() if pd.notna(x)), 'autre')
-                        )
+                        # Premier mot-clé trouvé dans la catégorie (recherche de sous-chaîne vectorisée)
+                        cat_lower = data['categorie'].fillna('').astype(str).str.lower()
+                        conds = [cat_lower.str.contains(k, regex=False) for k in cat_to_type]
+                        data[col] = np.select(conds, list(cat_to_type.values()), default='autre')
                 elif col == 'categorie':
-                    new_df[col] = 'autre'
+                    data[col] = 'autre'
                 elif col == 'nom':
-                    new_df[col] = 'non spécifié'
+                    data[col] = 'non spécifié'
                 elif col == 'taux_tva':
-                    new_df[col] = 20.0
+                    data[col] = 20.0
                 elif col in ['duree_amort', 'taux_amort']:
-                    new_df[col] = 0.0
-                    if 'type' in new_df.columns:
-                        # Si c'est une immobilisation, mettre des valeurs par défaut d'amortissement
-                        is_immo = new_df['type'] == 'immobilisation'
-                        new_df.loc[is_immo, 'duree_amort'] = 5.0
-                        new_df.loc[is_immo, 'taux_amort'] = 20.0
+                    # Si c'est une immobilisation, mettre des valeurs par défaut d'amortissement
+                    is_immo = (pd.Series(data['type'], index=df.index) == 'immobilisation').to_numpy()
+                    data[col] = np.where(is_immo, 5.0 if col == 'duree_amort' else 20.0, 0.0)
                 elif col == 'montant':
-                    new_df[col] = 0.0
+                    data[col] = 0.0
                 elif col == 'date':
-                    new_df[col] = datetime.now().strftime('%Y-%m-%d')
+                    data[col] = now_str
         
-        df = new_df
+        df = pd.DataFrame(data, index=df.index, columns=expected_columns)
         processing_log.append("Colonnes déduites et valeurs par défaut appliquées.")
     
-    # Convertir les colonnes numériques
-    for col in ['montant', 'taux_tva', 'duree_amort', 'taux_amort']:
-        if col in df.columns:
-            try:
-                # Détection des valeurs problématiques
-                problematic_values = []
-                for idx, val in df[col].items():
-                    if not pd.isna(val):
-                        try:
-                            # Tenter de convertir en nombre
-                            float(val)
-                        except (ValueError, TypeError):
-                            problematic_values.append((idx, val))
-                
-                if problematic_values:
-                    problem_info = ", ".join([f"{idx}: {val}" for idx, val in problematic_values[:5]])
+    # Convertir les colonnes numériques en un seul passage (valeurs problématiques -> NaN -> 0)
+    num_cols = [col for col in ['montant', 'taux_tva', 'duree_amort', 'taux_amort'] if col in df.columns]
+    if num_cols:
+        try:
+            converted = df[num_cols].apply(pd.to_numeric, errors='coerce')
+            
+            # Détection des valeurs problématiques: non vides à l'origine mais non convertibles
+            problematic = converted.isna() & df[num_cols].notna()
+            na_counts = converted.isna().sum()
+            
+            for col in num_cols:
+                problematic_values = df[col][problematic[col]]
+                if not problematic_values.empty:
+                    problem_info = ", ".join([f"{idx}: {val}" for idx, val in problematic_values.head(5).items()])
                     problem_count = len(problematic_values)
                     if problem_count > 5:
                         problem_info += f" et {problem_count-5} autres"
                     processing_log.append(f"Valeurs problématiques détectées dans la colonne {col}: {problem_info}")
                 
-                # Convertir en numérique en remplaçant les valeurs problématiques par NaN
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-                # Remplacer les NaN par 0
-                na_count = df[col].isna().sum()
-                if na_count > 0:
-                    processing_log.append(f"{na_count} valeurs manquantes ou non numériques dans {col} remplacées par 0")
-                
-                df[col] = df[col].fillna(0)
+                if na_counts[col] > 0:
+                    processing_log.append(f"{na_counts[col]} valeurs manquantes ou non numériques dans {col} remplacées par 0")
                 
                 processing_log.append(f"Colonne {col} convertie en format numérique.")
-            except Exception as e:
-                processing_log.append(f"Erreur lors de la conversion de la colonne {col}: {str(e)}")
-                # Créer une colonne de valeurs par défaut
-                df[col] = 0
+            
+            df[num_cols] = converted.fillna(0.0)
+        except Exception as e:
+            processing_log.append(f"Erreur lors de la conversion des colonnes numériques: {str(e)}")
+            # Créer des colonnes de valeurs par défaut
+            df[num_cols] = 0
     
     # Convertir la colonne date en format date
     if 'date' in df.columns:
@@ -6275,13 +5338,13 @@ def process_with_ai(df):
                 processing_log.append(f"{nat_count} valeurs de date non valides remplacées par la date actuelle")
             
             # Remplacer les NaT par la date actuelle
-            df['date'] = df['date'].fillna(pd.Timestamp.now())
+            df['date'] = df['date'].fillna(now_ts)
             
             processing_log.append("Colonne date convertie en format date.")
         except Exception as e:
             processing_log.append(f"Erreur lors de la conversion de la colonne date: {str(e)}")
             # Créer une colonne de valeurs par défaut
-            df['date'] = pd.Timestamp.now()
+            df['date'] = now_ts
     
     # S'assurer que les colonnes de texte ne contiennent pas de None/NaN
     for col in ['type', 'categorie', 'nom']:
@@ -6298,8 +5361,13 @@ def process_with_ai(df):
             else:
                 df[col] = df[col].fillna('non spécifié')
     
-    # Dernières vérifications et nettoyages
-    df = df.drop_duplicates()
+    # Dernières vérifications et nettoyages (masque des doublons, première occurrence conservée)
+    df = df.loc[~df.duplicated(keep='first')]
+    
+    # Colonnes de libellés en catégories: comparaisons et groupby sur des codes entiers
+    for col in ['type', 'categorie']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
     
     # Calcul des métriques financières avec gestion robuste des erreurs
     try:
@@ -6334,6 +5402,19 @@ def process_with_ai(df):
     
     return df, "\n".join(processing_log), metrics
 
+@st.cache_data(show_spinner=False)
+def _ingest_csv(raw_bytes):
+    """Lit et traite un CSV importé; mis en cache sur le contenu du fichier."""
+    # Détecter le séparateur sur l'en-tête puis lire avec le moteur C de pandas
+    head = raw_bytes[:4096].decode('utf-8', 'ignore')
+    try:
+        sep = csv.Sniffer().sniff(head, delimiters=',;\t|').delimiter
+    except csv.Error:
+        sep = ','
+    df = pd.read_csv(io.BytesIO(raw_bytes), sep=sep)
+    return process_with_ai(df)
+
+
 def show_csv_import():
     st.header("📤 Importation et analyse des données financières")
     
@@ -6361,25 +5442,9 @@ def show_csv_import():
         """)
         
         # Lien de téléchargement du modèle CSV
-        csv_template = """type,categorie,nom,montant,taux_tva,duree_amort,taux_amort,date
-immobilisation,equipement,Matériel d'équipement,78400.00,20,5,20,2023-01-15
-immobilisation,transport,Matériel de transport,45000.00,20,5,20,2023-02-10
-immobilisation,terrain,Terrain / Local,120000.00,20,10,10,2023-01-01
-financement,apport,Apport personnel,50000.00,0,0,0,2023-01-01
-financement,emprunt,Crédit bancaire,150000.00,0,0,0,2023-01-15
-financement,subvention,Subvention,30000.00,0,0,0,2023-02-01
-charges,loyer,Loyer mensuel,3500.00,20,0,0,2023-01-01
-charges,personnel,Salaire employé 1,5000.00,0,0,0,2023-01-01
-charges,personnel,Salaire employé 2,6000.00,0,0,0,2023-01-01
-charges,services,Téléphone et Internet,500.00,20,0,0,2023-01-01
-charges,services,Électricité,800.00,14,0,0,2023-01-01
-ventes,produit,Produit A,12000.00,20,0,0,2023-01-15
-ventes,produit,Produit B,8000.00,20,0,0,2023-01-20
-ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
-        
         st.download_button(
             label="📥 Télécharger le modèle CSV",
-            data=csv_template,
+            data=_CSV_TEMPLATE_BYTES,
             file_name="modele_donnees_financieres.csv",
             mime="text/csv"
         )
@@ -6391,11 +5456,8 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
         try:
             # Indicateur de chargement
             with st.spinner("Analyse du fichier CSV avec notre IA..."):
-                # Lire le fichier CSV
-                df = pd.read_csv(uploaded_file, sep=None, engine='python')
-                
-                # Traiter avec l'IA et pyfinance
-                processed_df, log_message, metrics = process_with_ai(df)
+                # Lire et traiter le fichier CSV (résultat réutilisé tant que le fichier ne change pas)
+                processed_df, log_message, metrics = _ingest_csv(uploaded_file.getvalue())
                 
                 if processed_df is not None:
                     st.success("Fichier importé et traité avec succès!")
@@ -6444,37 +5506,31 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                         
                         with col1:
                             # Graphique de répartition des montants par type
-                            pie_data = processed_df.groupby('type')['montant'].sum().reset_index()
+                            pie_data = processed_df.groupby('type', observed=True)['montant'].sum()
                             fig = px.pie(
-                                pie_data,
-                                values='montant',
-                                names='type',
+                                values=pie_data.to_numpy(),
+                                names=pie_data.index.astype(str),
                                 title="Répartition par type de données",
-                                color_discrete_sequence=px.colors.qualitative.Bold
-                            )
-                            fig.update_layout(
-                                paper_bgcolor='rgba(0,0,0,0)',
-                                plot_bgcolor='rgba(0,0,0,0)',
-                                font_color='white'
+                                color_discrete_sequence=_PALETTE_BOLD
                             )
+                            fig.update_layout(**_DARK_LAYOUT)
                             st.plotly_chart(fig, use_container_width=True)
                         
                         with col2:
                             # Graphique des immobilisations par catégorie
                             if len(processed_df[processed_df['type'] == 'immobilisation']) > 0:
-                                immo_data = processed_df[processed_df['type'] == 'immobilisation'].groupby('categorie')['montant'].sum().reset_index()
+                                immo_data = processed_df[processed_df['type'] == 'immobilisation'].groupby('categorie', observed=True)['montant'].sum()
+                                immo_categories = immo_data.index.astype(str)
                                 fig = px.bar(
-                                    immo_data,
-                                    x='categorie',
-                                    y='montant',
+                                    x=immo_categories,
+                                    y=immo_data.to_numpy(),
                                     title="Immobilisations par catégorie",
-                                    color='categorie',
-                                    color_discrete_sequence=px.colors.qualitative.Pastel
+                                    color=immo_categories,
+                                    labels={'color': 'categorie'},
+                                    color_discrete_sequence=_PALETTE_PASTEL
                                 )
                                 fig.update_layout(
-                                    paper_bgcolor='rgba(0,0,0,0)',
-                                    plot_bgcolor='rgba(0,0,0,0)',
-                                    font_color='white',
+                                    **_DARK_LAYOUT,
                                     xaxis_title="Catégorie",
                                     yaxis_title="Montant (DHS)"
                                 )
@@ -6532,22 +5588,15 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                         # Graphique de projection des flux de trésorerie sur 24 mois
                         if metrics['cash_flow_mensuel'] != 0:
                             # Créer les données pour le graphique
-                            months = list(range(0, 25))
-                            cumulative_cash_flow = [-metrics['total_immobilisations']]
-                            
-                            for i in range(1, 25):
-                                cumulative_cash_flow.append(cumulative_cash_flow[-1] + metrics['cash_flow_mensuel'])
-                            
-                            cash_flow_df = pd.DataFrame({
-                                'Mois': months,
-                                'Flux de trésorerie cumulé': cumulative_cash_flow
-                            })
+                            months = np.arange(25)
+                            cf = np.full(25, metrics['cash_flow_mensuel'], dtype=float)
+                            cf[0] = -metrics['total_immobilisations']
+                            cumulative_cash_flow = np.cumsum(cf)
                             
                             # Créer le graphique
                             fig = px.line(
-                                cash_flow_df, 
-                                x='Mois', 
-                                y='Flux de trésorerie cumulé',
+                                x=months,
+                                y=cumulative_cash_flow,
                                 markers=True,
                                 title="Projection du flux de trésorerie cumulé sur 24 mois"
                             )
@@ -6564,9 +5613,7 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                             
                             # Mettre à jour la mise en page
                             fig.update_layout(
-                                paper_bgcolor='rgba(0,0,0,0)',
-                                plot_bgcolor='rgba(0,0,0,0)',
-                                font_color='white',
+                                **_DARK_LAYOUT,
                                 xaxis_title="Mois",
                                 yaxis_title="Flux de trésorerie cumulé (DHS)"
                             )
@@ -6625,26 +5672,19 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                             )
                         
                         # Graphique de répartition de la TVA
-                        tva_data = {
-                            'Composant': ['TVA Collectée', 'TVA Déductible Achats', 'TVA Déductible Immos'],
-                            'Montant': [metrics['tva_collectee'], metrics['tva_deductible_achats'], metrics['tva_deductible_immo']]
-                        }
-                        
-                        tva_df = pd.DataFrame(tva_data)
+                        tva_components = ['TVA Collectée', 'TVA Déductible Achats', 'TVA Déductible Immos']
                         
                         fig = px.bar(
-                            tva_df,
-                            x='Composant',
-                            y='Montant',
+                            x=tva_components,
+                            y=[metrics['tva_collectee'], metrics['tva_deductible_achats'], metrics['tva_deductible_immo']],
                             title="Répartition des composants de la TVA",
-                            color='Composant',
-                            color_discrete_sequence=px.colors.qualitative.Pastel
+                            color=tva_components,
+                            labels={'color': 'Composant'},
+                            color_discrete_sequence=_PALETTE_PASTEL
                         )
                         
                         fig.update_layout(
-                            paper_bgcolor='rgba(0,0,0,0)',
-                            plot_bgcolor='rgba(0,0,0,0)',
-                            font_color='white',
+                            **_DARK_LAYOUT,
                             xaxis_title="",
                             yaxis_title="Montant (DHS)"
                         )
@@ -6654,67 +5694,37 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                         # Tableau détaillé de la TVA par catégorie
                         st.subheader("Détail de la TVA par catégorie")
                         
-                        tva_detail = []
-                        
-                        # TVA sur ventes par catégorie
-                        ventes_by_cat = processed_df[processed_df['type'] == 'ventes'].groupby('categorie').agg({
-                            'montant': 'sum',
-                            'taux_tva': 'mean'
-                        }).reset_index()
-                        
-                        for _, row in ventes_by_cat.iterrows():
-                            tva_detail.append({
-                                'Type': 'Ventes',
-                                'Catégorie': row['categorie'],
-                                'Montant HT': row['montant'],
-                                'Taux TVA': row['taux_tva'],
-                                'TVA': row['montant'] * (row['taux_tva'] / 100),
-                                'Type TVA': 'Collectée'
-                            })
-                        
-                        # TVA sur charges par catégorie
-                        charges_by_cat = processed_df[processed_df['type'] == 'charges'].groupby('categorie').agg({
-                            'montant': 'sum',
-                            'taux_tva': 'mean'
-                        }).reset_index()
-                        
-                        for _, row in charges_by_cat.iterrows():
-                            tva_detail.append({
-                                'Type': 'Charges',
-                                'Catégorie': row['categorie'],
-                                'Montant HT': row['montant'],
-                                'Taux TVA': row['taux_tva'],
-                                'TVA': row['montant'] * (row['taux_tva'] / 100),
-                                'Type TVA': 'Déductible'
-                            })
-                        
-                        # TVA sur immobilisations par catégorie
-                        immo_by_cat = processed_df[processed_df['type'] == 'immobilisation'].groupby('categorie').agg({
-                            'montant': 'sum',
-                            'taux_tva': 'mean'
-                        }).reset_index()
-                        
-                        for _, row in immo_by_cat.iterrows():
-                            tva_detail.append({
-                                'Type': 'Immobilisation',
-                                'Catégorie': row['categorie'],
-                                'Montant HT': row['montant'],
-                                'Taux TVA': row['taux_tva'],
-                                'TVA': row['montant'] * (row['taux_tva'] / 100),
-                                'Type TVA': 'Déductible'
-                            })
+                        # TVA par catégorie: une seule agrégation sur (type, catégorie), découpée par type
+                        agg_tva = processed_df.groupby(['type', 'categorie'], observed=True, as_index=False).agg(
+                            montant=('montant', 'sum'),
+                            taux_tva=('taux_tva', 'mean')
+                        )
+                        tva_parts = []
+                        for type_value, type_label, type_tva in (('ventes', 'Ventes', 'Collectée'),
+                                                                 ('charges', 'Charges', 'Déductible'),
+                                                                 ('immobilisation', 'Immobilisation', 'Déductible')):
+                            g = agg_tva[agg_tva['type'] == type_value]
+                            tva_parts.append(pd.DataFrame({
+                                'Type': type_label,
+                                'Catégorie': g['categorie'],
+                                'Montant HT': g['montant'],
+                                'Taux TVA': g['taux_tva'],
+                                'TVA': g['montant'] * (g['taux_tva'] / 100),
+                                'Type TVA': type_tva
+                            }))
                         
                         # Créer le DataFrame du détail TVA
-                        tva_detail_df = pd.DataFrame(tva_detail)
+                        tva_detail_df = pd.concat(tva_parts, ignore_index=True)
                         
                         if not tva_detail_df.empty:
-                            # Formatter les colonnes
-                            formatted_tva_detail = tva_detail_df.copy()
-                            formatted_tva_detail['Montant HT'] = formatted_tva_detail['Montant HT'].apply(lambda x: f"{x:,.2f}")
-                            formatted_tva_detail['Taux TVA'] = formatted_tva_detail['Taux TVA'].apply(lambda x: f"{x:.1f}%")
-                            formatted_tva_detail['TVA'] = formatted_tva_detail['TVA'].apply(lambda x: f"{x:,.2f}")
+                            # Formatter les colonnes au rendu, sans copie ni colonnes de chaînes
+                            styler = tva_detail_df.style.format({
+                                'Montant HT': '{:,.2f}',
+                                'Taux TVA': '{:.1f}%',
+                                'TVA': '{:,.2f}'
+                            })
                             
-                            st.dataframe(formatted_tva_detail, use_container_width=True)
+                            st.dataframe(styler, use_container_width=True)
                         else:
                             st.info("Aucune donnée TVA détaillée disponible.")
                     
@@ -6731,14 +5741,15 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                         
                         filtered_df = processed_df[processed_df['type'].isin(type_filter)]
                         
-                        # Formatter les colonnes numériques
-                        formatted_df = filtered_df.copy()
-                        formatted_df['montant'] = formatted_df['montant'].apply(lambda x: f"{x:,.2f}")
-                        formatted_df['taux_tva'] = formatted_df['taux_tva'].apply(lambda x: f"{x:.1f}%")
-                        formatted_df['duree_amort'] = formatted_df['duree_amort'].apply(lambda x: f"{x:.0f}" if x > 0 else "-")
-                        formatted_df['taux_amort'] = formatted_df['taux_amort'].apply(lambda x: f"{x:.1f}%" if x > 0 else "-")
+                        # Formatter les colonnes numériques au rendu (les données restent numériques)
+                        styler = filtered_df.style.format({
+                            'montant': '{:,.2f}',
+                            'taux_tva': '{:.1f}%',
+                            'duree_amort': lambda x: f"{x:.0f}" if x > 0 else "-",
+                            'taux_amort': lambda x: f"{x:.1f}%" if x > 0 else "-"
+                        })
                         
-                        st.dataframe(formatted_df, use_container_width=True)
+                        st.dataframe(styler, use_container_width=True)
                     
                     # Option pour appliquer les données importées
                     st.subheader("Application des données")
@@ -6758,141 +5769,184 @@ ventes,service,Service conseil,15000.00,20,0,0,2023-02-01"""
                                 default=["Immobilisations", "Financements", "Charges", "Ventes"]
                             )
                     
-                    if st.button("Appliquer ces données à mon projet", type="primary"):
-                        sections_to_apply = ["Immobilisations", "Financements", "Charges", "Ventes", "Amortissements", "TVA"] if apply_all else apply_options
-                        
-                        # Filtrer par type et mettre à jour les données du projet
-                        immos = processed_df[processed_df['type'] == 'immobilisation']
-                        finances = processed_df[processed_df['type'] == 'financement']
-                        charges = processed_df[processed_df['type'] == 'charges']
-                        ventes = processed_df[processed_df['type'] == 'ventes']
+                    apply_clicked = st.button("Appliquer ces données à mon projet", type="primary")
+                    sections_to_apply = ["Immobilisations", "Financements", "Charges", "Ventes", "Amortissements", "TVA"] if apply_all else apply_options
+                    sections_set = frozenset(sections_to_apply)
+                    
+                    if apply_clicked and not sections_set:
+                        st.warning("⚠️ Aucune section sélectionnée pour l'application.")
+                    elif apply_clicked:
+                        # Alias local de session_state pour toutes les mises à jour ci-dessous
+                        ss = st.session_state
+                        # Listes remplacées, écrites dans session_state en une fois à la fin
+                        pending = {}
+                        
+                        # Répartir par type en un seul passage sur la colonne 'type'
+                        by_type = {k: v for k, v in processed_df.groupby('type', observed=True, sort=False)}
+                        empty_df = processed_df.iloc[:0]
+                        immos = by_type.get('immobilisation', empty_df)
+                        finances = by_type.get('financement', empty_df)
+                        charges = by_type.get('charges', empty_df)
+                        ventes = by_type.get('ventes', empty_df)
+                        
+                        # Montants et TVA par catégorie, agrégés en un seul passage pour charges et ventes
+                        def _agg_montant_tva(frame):
+                            frame_aug = frame.assign(_tva=frame['montant'].to_numpy() * frame['taux_tva'].to_numpy() * 0.01)
+                            return frame_aug.groupby('categorie', observed=True, sort=False)[['montant', '_tva']].sum()
+                        
+                        charges_agg = _agg_montant_tva(charges) if sections_set & {"Charges", "TVA"} else None
+                        ventes_agg = _agg_montant_tva(ventes) if sections_set & {"Ventes", "TVA"} else None
                         
                         # Mettre à jour les immobilisations
-                        if "Immobilisations" in sections_to_apply and not immos.empty:
-                            st.session_state.immos = []
-                            for _, row in immos.iterrows():
-                                st.session_state.immos.append({
-                                    "Nom": row['nom'],
-                                    "Montant": row['montant'],
-                                    "Catégorie": row['categorie'],
-                                    "Date": row['date']
-                                })
+                        if "Immobilisations" in sections_set and not immos.empty:
+                            pending['immos'] = (
+                                immos[['nom', 'montant', 'categorie', 'date']]
+                                .rename(columns={'nom': 'Nom', 'montant': 'Montant', 'categorie': 'Catégorie', 'date': 'Date'})
+                                .to_dict('records')
+                            )
                             st.success("✅ Immobilisations mises à jour!")
                         
                         # Mettre à jour les financements
-                        if "Financements" in sections_to_apply and not finances.empty:
-                            apports = finances[finances['categorie'] == 'apport']['montant'].sum()
-                            emprunts = finances[finances['categorie'] == 'emprunt']['montant'].sum()
-                            subventions = finances[finances['categorie'] == 'subvention']['montant'].sum()
+                        if "Financements" in sections_set and not finances.empty:
+                            fin_by_cat = finances.groupby('categorie', observed=True, sort=False)['montant'].sum()
+                            apports = fin_by_cat.get('apport', 0)
+                            emprunts = fin_by_cat.get('emprunt', 0)
+                            subventions = fin_by_cat.get('subvention', 0)
                             
-                            if 'investment_data' not in st.session_state:
-                                st.session_state.investment_data = {}
+                            if 'investment_data' not in ss:
+                                ss.investment_data = {}
                             
                             if apports > 0:
-                                st.session_state.investment_data['cash_contribution'] = apports
+                                ss.investment_data['cash_contribution'] = apports
                             
-                            if 'calculated_data' not in st.session_state:
-                                st.session_state.calculated_data = {}
+                            if 'calculated_data' not in ss:
+                                ss.calculated_data = {}
                             
+                            calc_updates = {}
                             if emprunts > 0:
-                                st.session_state.calculated_data['total_credits'] = emprunts
-                            
+                                calc_updates['total_credits'] = emprunts
                             if subventions > 0:
-                                st.session_state.calculated_data['total_subsidies'] = subventions
+                                calc_updates['total_subsidies'] = subventions
+                            if calc_updates:
+                                ss.calculated_data.update(calc_updates)
                                 
                             st.success("✅ Financements mis à jour!")
                         
                         # Mettre à jour les charges et ventes
-                        if ("Charges" in sections_to_apply or "Ventes" in sections_to_apply) and (not charges.empty or not ventes.empty):
-                            if 'monthly_cashflow_data' not in st.session_state:
-                                st.session_state.monthly_cashflow_data = {
+                        if ("Charges" in sections_set or "Ventes" in sections_set) and (not charges.empty or not ventes.empty):
+                            if 'monthly_cashflow_data' not in ss:
+                                ss.monthly_cashflow_data = {
                                     'ressources': {},
                                     'chiffre_affaires': {},
                                     'immobilisations': {},
                                     'charges_exploitation': {}
                                 }
+                            mcf = ss.monthly_cashflow_data
                             
                             # Mettre à jour les charges
-                            if "Charges" in sections_to_apply and not charges.empty:
+                            if "Charges" in sections_set and not charges.empty:
                                 # Regrouper les charges par catégorie
-                                charges_by_cat = charges.groupby('categorie')['montant'].sum().to_dict()
-                                for cat, amount in charges_by_cat.items():
-                                    st.session_state.monthly_cashflow_data['charges_exploitation'][cat.capitalize()] = amount
+                                mcf['charges_exploitation'].update(
+                                    {cat.capitalize(): amount for cat, amount in charges_agg['montant'].items()}
+                                )
                                 st.success("✅ Charges mises à jour!")
                             
                             # Mettre à jour les ventes
-                            if "Ventes" in sections_to_apply and not ventes.empty:
+                            if "Ventes" in sections_set and not ventes.empty:
                                 # Regrouper les ventes par catégorie
-                                ventes_by_cat = ventes.groupby('categorie')['montant'].sum().to_dict()
-                                for cat, amount in ventes_by_cat.items():
-                                    st.session_state.monthly_cashflow_data['chiffre_affaires'][cat.capitalize()] = amount
+                                mcf['chiffre_affaires'].update(
+                                    {cat.capitalize(): amount for cat, amount in ventes_agg['montant'].items()}
+                                )
                                 st.success("✅ Ventes mises à jour!")
                         
                         # Mise à jour pour le tableau d'amortissement
-                        if "Amortissements" in sections_to_apply and not immos.empty:
-                            if 'detailed_amortization' not in st.session_state:
-                                st.session_state.detailed_amortization = []
+                        if "Amortissements" in sections_set and not immos.empty:
+                            if 'detailed_amortization' not in ss:
+                                ss.detailed_amortization = []
+                            amort_items = ss.detailed_amortization
                             
-                            for _, row in immos.iterrows():
-                                # Vérifier si l'item existe déjà
-                                item_exists = False
-                                for i, item in enumerate(st.session_state.detailed_amortization):
-                                    if item["name"] == row['nom']:
-                                        item_exists = True
-                                        # Mise à jour
-                                        st.session_state.detailed_amortization[i]["amount"] = row['montant']
-                                        st.session_state.detailed_amortization[i]["duration"] = row['duree_amort']
-                                        st.session_state.detailed_amortization[i]["rate"] = row['taux_amort']
-                                        annual_amort = row['montant'] * (row['taux_amort'] / 100)
-                                        st.session_state.detailed_amortization[i]["amortization_n"] = annual_amort
-                                        st.session_state.detailed_amortization[i]["amortization_n1"] = annual_amort
-                                        st.session_state.detailed_amortization[i]["amortization_n2"] = annual_amort
+                            # Index nom -> éléments existants, construit une seule fois
+                            name_index = {}
+                            for item in amort_items:
+                                name_index.setdefault(item["name"], []).append(item)
+                            
+                            # Nouvelles entrées ajoutées en une seule fois après la boucle
+                            new_entries = []
+                            amort_cols = ['nom', 'montant', 'duree_amort', 'taux_amort']
+                            for nom, montant, duree_amort, taux_amort in immos[amort_cols].itertuples(index=False, name=None):
+                                annual_amort = montant * (taux_amort / 100)
+                                matches = name_index.get(nom)
+                                
+                                # Mise à jour des éléments existants portant ce nom
+                                if matches:
+                                    for item in matches:
+                                        item["amount"] = montant
+                                        item["duration"] = duree_amort
+                                        item["rate"] = taux_amort
+                                        item["amortization_n"] = annual_amort
+                                        item["amortization_n1"] = annual_amort
+                                        item["amortization_n2"] = annual_amort
                                 
                                 # Ajouter si n'existe pas
-                                if not item_exists:
-                                    annual_amort = row['montant'] * (row['taux_amort'] / 100)
-                                    st.session_state.detailed_amortization.append({
-                                        "name": row['nom'],
-                                        "amount": row['montant'],
-                                        "duration": row['duree_amort'],
-                                        "rate": row['taux_amort'],
+                                else:
+                                    item = {
+                                        "name": nom,
+                                        "amount": montant,
+                                        "duration": duree_amort,
+                                        "rate": taux_amort,
                                         "amortization_n": annual_amort,
                                         "amortization_n1": annual_amort,
                                         "amortization_n2": annual_amort
-                                    })
+                                    }
+                                    new_entries.append(item)
+                                    name_index[nom] = [item]
+                            
+                            amort_items.extend(new_entries)
                             st.success("✅ Tableau d'amortissement mis à jour!")
                         
                         # Mise à jour pour la TVA
-                        if "TVA" in sections_to_apply and (not charges.empty or not ventes.empty or not immos.empty):
-                            if 'vat_budget_data' not in st.session_state:
-                                st.session_state.vat_budget_data = {
+                        if "TVA" in sections_set and (not charges.empty or not ventes.empty or not immos.empty):
+                            if 'vat_budget_data' not in ss:
+                                ss.vat_budget_data = {
                                     'achats': {},
                                     'ventes': {},
                                     'tva_immobilisations': {}
                                 }
+                            vat = ss.vat_budget_data
                             
                             # Achats (charges)
                             if not charges.empty:
-                                charges_ht = charges['montant'].sum()
-                                tva_charges = charges.apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
-                                st.session_state.vat_budget_data['achats']['Achat HT'] = charges_ht
-                                st.session_state.vat_budget_data['achats']['TVA déductible sur achat'] = tva_charges
+                                charges_ht = charges_agg['montant'].sum()
+                                tva_charges = float(charges_agg['_tva'].sum())
+                                vat['achats'].update({
+                                    'Achat HT': charges_ht,
+                                    'TVA déductible sur achat': tva_charges
+                                })
                             
                             # Ventes
                             if not ventes.empty:
-                                ventes_ht = ventes['montant'].sum()
-                                tva_ventes = ventes.apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
-                                st.session_state.vat_budget_data['ventes']['Vente en HT'] = ventes_ht
-                                st.session_state.vat_budget_data['ventes']['TVA collecte sur vente'] = tva_ventes
+                                ventes_ht = ventes_agg['montant'].sum()
+                                tva_ventes = float(ventes_agg['_tva'].sum())
+                                vat['ventes'].update({
+                                    'Vente en HT': ventes_ht,
+                                    'TVA collecte sur vente': tva_ventes
+                                })
                             
                             # TVA sur immobilisations
                             if not immos.empty:
-                                tva_immo = immos.apply(lambda x: x['montant'] * (x['taux_tva']/100), axis=1).sum()
-                                st.session_state.vat_budget_data['tva_immobilisations']["TVA dedustible sur immobilisation"] = tva_immo
+                                tva_immo = _tva_total(immos)
+                                vat['tva_immobilisations']["TVA dedustible sur immobilisation"] = tva_immo
                             
                             st.success("✅ Budget TVA mis à jour!")
                         
-                        st.balloons()
+                        # Écriture groupée des listes remplacées
+                        for key, value in pending.items():
+                            ss[key] = value
+                        bump_session_data_version()
+                        
+                        # Animation réservée aux petits imports (coût de rendu côté client)
+                        if len(processed_df) < 500:
+                            st.balloons()
                         st.success("🎉 Toutes les données sélectionnées ont été appliquées avec succès à votre projet!")
         
         except Exception as e: